@@ -11,16 +11,24 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 import os
 from channels.routing import ProtocolTypeRouter, URLRouter
 from django.core.asgi import get_asgi_application
-from channels.auth import AuthMiddlewareStack
-import events.routing 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'event_manager.settings')
 
+# Set up Django (and the app registry) before importing anything that loads
+# models, such as the consumers and the JWT middleware
+django_asgi_app = get_asgi_application()
+
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+import events.routing  # noqa: E402
+from events.authentication import JWTAuthMiddleware  # noqa: E402
+
 application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
-        URLRouter(
-            events.routing.websocket_urlpatterns
+        JWTAuthMiddleware(
+            URLRouter(
+                events.routing.websocket_urlpatterns
+            )
         )
     ),
 })
@@ -43,12 +43,12 @@ INSTALLED_APPS = [
     'events',
     'rest_framework_simplejwt.token_blacklist',
     'channels',
-    'django_ratelimit',
     'drf_yasg',
 
 ]
 
 MIDDLEWARE = [
+    'events.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -137,7 +137,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'events.authentication.ClaimsJWTAuthentication',
     ),
 }
 
@@ -0,0 +1,31 @@
+"""
+Settings for running the test suite and local benchmarks without external
+services. Usage: DJANGO_SETTINGS_MODULE=event_manager.test_settings
+"""
+
+from .settings import *  # noqa: F401,F403
+
+
+# SQLite instead of PostgreSQL. Queries that use PostgreSQL-only index paths
+# (e.g. tstzrange overlap) fall back to portable SQL on this backend.
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_db.sqlite3',
+    }
+}
+
+# Per-process cache instead of django-redis
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# In-process channel layer instead of Redis; the notification dispatcher and
+# consumers must run in the same process
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels.layers.InMemoryChannelLayer',
+    }
+}
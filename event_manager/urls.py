@@ -22,6 +22,7 @@ from django.urls import path, include, re_path
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
+from events.views import MetricsView
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -36,6 +37,7 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('events.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 
     # API documentation
     re_path(r'^swagger(?P<format>\.json|\.yaml)$',
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Profile, Event, EventPermission, EventHistory
+from .models import Profile, Event, EventPermission, EventHistory, NotificationOutbox, ImportCheckpoint
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
@@ -22,3 +22,15 @@ class EventHistoryAdmin(admin.ModelAdmin):
     list_display = ('id', 'event', 'edited_by', 'edited_at')
     list_filter = ('edited_at',)
     search_fields = ('event__title', 'edited_by__username')
+
+@admin.register(NotificationOutbox)
+class NotificationOutboxAdmin(admin.ModelAdmin):
+    list_display = ('id', 'group', 'created_at', 'available_at', 'attempts', 'failed_at')
+    list_filter = ('failed_at',)
+    search_fields = ('group',)
+
+@admin.register(ImportCheckpoint)
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('id', 'source', 'rows', 'imported', 'rejected', 'updated_at', 'finished_at')
+    list_filter = ('kind', 'finished_at')
+    search_fields = ('source',)
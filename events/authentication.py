@@ -0,0 +1,175 @@
+import time
+from threading import Lock
+from urllib.parse import parse_qs
+
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .revocation import revoked_tokens
+
+# User fields copied into tokens at login; requests that only read these
+# (and the id) never load the user
+USER_CLAIMS = ('username', 'email')
+# User fields that grant or withdraw access, so they are read from the table
+# (see UserStates) rather than trusted from a token for its whole lifetime
+USER_STATE_FIELDS = ('is_active', 'is_staff', 'is_superuser')
+# Seconds between re-reads of the users known to this process
+USER_STATES_TTL = getattr(settings, 'JWT_USER_STATES_TTL', 30)
+# User ids per query when re-reading them
+USER_STATES_BATCH_SIZE = 1000
+
+
+def user_claims(user):
+    return {field: getattr(user, field) for field in USER_CLAIMS}
+
+
+class UserStates:
+    """
+    Whether the users presenting tokens to this process still exist, and
+    their USER_STATE_FIELDS. An unseen id costs one query; after that it is
+    answered from memory. Every `ttl` seconds the known ids are re-read
+    together, so deactivations, demotions and deletions made by other
+    processes apply within `ttl`. This process's own apply at once (see
+    events.signals).
+    """
+
+    def __init__(self, ttl=USER_STATES_TTL):
+        self.ttl = ttl
+        # user id -> USER_STATE_FIELDS values, or None for ids no longer in
+        # the table
+        self._states = {}
+        self._expires = 0.0
+        self._lock = Lock()
+
+    def get(self, user_id):
+        if time.monotonic() >= self._expires:
+            self.reload()
+        try:
+            return self._states[user_id]
+        except KeyError:
+            pass
+        state = get_user_model().objects.filter(pk=user_id).values_list(*USER_STATE_FIELDS).first()
+        with self._lock:
+            self._states[user_id] = state
+        return state
+
+    def reload(self):
+        with self._lock:
+            if time.monotonic() < self._expires:
+                return
+            known = list(self._states)
+            states = {}
+            for start in range(0, len(known), USER_STATES_BATCH_SIZE):
+                batch = known[start:start + USER_STATES_BATCH_SIZE]
+                rows = get_user_model().objects.filter(pk__in=batch).values_list('pk', *USER_STATE_FIELDS)
+                states.update((pk, tuple(state)) for pk, *state in rows)
+            # Deleted users are dropped rather than kept as None, so the map
+            # never outgrows the users table; a deleted user's next request
+            # looks it up again
+            self._states = states
+            self._expires = time.monotonic() + self.ttl
+
+    def forget(self, user_id):
+        with self._lock:
+            self._states.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._states = {}
+            self._expires = 0.0
+
+
+user_states = UserStates()
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that builds request.user from the token's claims and
+    the state kept by user_states instead of loading it. The user is a real
+    User instance whose other fields are deferred, so reading one of them
+    (or saving) loads it lazily.
+
+    Tokens issued before the claims were added, and setups that check the
+    password hash in the token, fall back to loading the user.
+    """
+
+    def get_user(self, validated_token):
+        if (
+            api_settings.CHECK_REVOKE_TOKEN
+            or api_settings.USER_ID_FIELD != self.user_model._meta.pk.name
+            or any(claim not in validated_token for claim in USER_CLAIMS)
+        ):
+            return super().get_user(validated_token)
+
+        try:
+            user_id = self.user_model._meta.pk.to_python(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, ValidationError):
+            raise InvalidToken('Token contained no recognizable user identification')
+        state = user_states.get(user_id)
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        values = dict(zip(USER_STATE_FIELDS, state))
+        if api_settings.CHECK_USER_IS_ACTIVE and not values['is_active']:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+
+        values.update((field, validated_token[field]) for field in USER_CLAIMS)
+        values[self.user_model._meta.pk.attname] = user_id
+        # from_db wants the loaded values in field order
+        names = [field.attname for field in self.user_model._meta.concrete_fields if field.attname in values]
+        return self.user_model.from_db(DEFAULT_DB_ALIAS, names, [values[name] for name in names])
+
+
+class FilteredRefreshToken(RefreshToken):
+    """
+    RefreshToken that only queries the blacklist for JTIs the revoked
+    token filter can't rule out.
+    """
+
+    def check_blacklist(self):
+        if self.payload[api_settings.JTI_CLAIM] in revoked_tokens:
+            super().check_blacklist()
+
+
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Sets scope['user'] for websockets from an access token, sent as
+    ?token=<access token> (browsers can't set headers on websockets) or in
+    an Authorization: Bearer header. Without a token the scope keeps the
+    user set by outer middleware (the session); a bad one makes it
+    anonymous.
+    """
+
+    async def __call__(self, scope, receive, send):
+        raw = self.raw_token(scope)
+        if raw is not None:
+            scope = dict(scope, user=await database_sync_to_async(self.authenticate)(raw))
+        return await super().__call__(scope, receive, send)
+
+    @staticmethod
+    def raw_token(scope):
+        tokens = parse_qs(scope.get('query_string', b'').decode('latin-1')).get('token')
+        if tokens:
+            return tokens[0]
+        for name, value in scope.get('headers', ()):
+            if name == b'authorization':
+                parts = value.decode('latin-1').split()
+                if len(parts) == 2 and parts[0] in api_settings.AUTH_HEADER_TYPES:
+                    return parts[1]
+        return None
+
+    @staticmethod
+    def authenticate(raw):
+        authentication = ClaimsJWTAuthentication()
+        try:
+            return authentication.get_user(authentication.get_validated_token(raw))
+        except (InvalidToken, AuthenticationFailed, TokenError):
+            return AnonymousUser()
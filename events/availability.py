@@ -0,0 +1,147 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+
+from .models import Event
+from .recurrence import occurrences_between
+
+MAX_AVAILABILITY_USERS = getattr(settings, 'AVAILABILITY_MAX_USERS', 1000)
+MAX_AVAILABILITY_RESULTS = getattr(settings, 'AVAILABILITY_MAX_RESULTS', 50)
+AVAILABILITY_MAX_WINDOW = getattr(settings, 'AVAILABILITY_MAX_WINDOW', timedelta(days=31))
+# Minutes between the candidate meeting times ranked in 'best'
+DEFAULT_STEP_MINUTES = 15
+
+EVENT_FIELDS = ('id', 'start_time', 'end_time', 'is_recurring', 'recurrence_pattern', 'recurrence_exceptions')
+
+
+def busy_by_user(user_ids, start, end):
+    """
+    Busy (start, end) pairs inside [start, end) of events the users own or
+    hold a role on, as {user_id: [...]}, in one query. Recurring series
+    are expanded into their occurrences in the window.
+    """
+    user_ids = list(user_ids)
+    window = Event.objects.in_window(start, end)
+    # A UNION of two index-friendly halves rather than an OR across the
+    # permissions join, which would scan every event before `end`
+    owned = window.filter(created_by__in=user_ids).values_list('created_by_id', *EVENT_FIELDS)
+    shared = window.filter(permissions__user__in=user_ids).values_list('permissions__user_id', *EVENT_FIELDS)
+
+    # An event can come back once per user (and twice for an owner who
+    # also holds a role); only series need a model instance to expand
+    intervals, users = {}, {}
+    for user_id, event_id, *values in owned.union(shared, all=True):
+        if event_id not in intervals:
+            event_start, event_end, is_recurring = values[:3]
+            if is_recurring:
+                event = Event(event_id, **dict(zip(EVENT_FIELDS[1:], values)))
+                intervals[event_id] = occurrences_between(event, start, end)
+            else:
+                intervals[event_id] = [(event_start, event_end)]
+            users[event_id] = set()
+        users[event_id].add(user_id)
+
+    busy = {user_id: [] for user_id in user_ids}
+    for event_id, attendees in users.items():
+        for user_id in attendees:
+            busy[user_id].extend(intervals[event_id])
+    return busy
+
+
+def _seconds(moment):
+    return int(moment.timestamp())
+
+
+def _moment(seconds):
+    return datetime.fromtimestamp(int(seconds), tz=dt_timezone.utc)
+
+
+def merge_sorted(starts, ends, groups=None):
+    """
+    Vectorized union of intervals already sorted by (group, start): the
+    disjoint blocks of each group, as (starts, ends, groups) arrays.
+
+    Intervals are half-open, so touching ones stay separate blocks. Ends
+    are offset per group so a single running maximum never carries over
+    from one group into the next.
+    """
+    if not len(starts):
+        return starts, ends, groups
+    offset = 0 if groups is None else groups * (int(ends.max()) - int(starts.min()) + 1)
+    reach = np.maximum.accumulate(ends + offset) - offset
+    first = np.ones(len(starts), dtype=bool)
+    first[1:] = starts[1:] >= reach[:-1]
+    if groups is not None:
+        first[1:] |= groups[1:] != groups[:-1]
+    heads = np.flatnonzero(first)
+    tails = np.append(heads[1:], len(starts)) - 1
+    return starts[heads], reach[tails], None if groups is None else groups[heads]
+
+
+def find_availability(user_ids, start, end, duration, step, limit=10):
+    """
+    Free time shared by all users in [start, end) and the best `limit`
+    meeting times of length `duration`, tried every `step`.
+
+    Busy intervals are flattened into integer-second arrays, merged per
+    user and swept with NumPy: `free` lists the gaps of at least
+    `duration` where nobody is busy; `best` ranks non-overlapping
+    candidate slots by how many users can attend, earliest first.
+    """
+    user_ids = list(user_ids)
+    busy = busy_by_user(user_ids, start, end)
+    lower, upper = _seconds(start), _seconds(end)
+    length, stride = int(duration.total_seconds()), int(step.total_seconds())
+
+    counts = [len(busy[user_id]) for user_id in user_ids]
+    total = sum(counts)
+    starts = np.fromiter((_seconds(s) for user_id in user_ids for s, _ in busy[user_id]), dtype=np.int64, count=total)
+    ends = np.fromiter((_seconds(e) for user_id in user_ids for _, e in busy[user_id]), dtype=np.int64, count=total)
+    groups = np.repeat(np.arange(len(user_ids), dtype=np.int64), counts)
+    np.clip(starts, lower, upper, out=starts)
+    np.clip(ends, lower, upper, out=ends)
+    inside = ends > starts
+    starts, ends, groups = starts[inside], ends[inside], groups[inside]
+
+    # Everyone free: gaps in the union of all busy intervals
+    order = np.argsort(starts, kind='stable')
+    union_starts, union_ends, _ = merge_sorted(starts[order], ends[order])
+    gap_starts = np.concatenate(([lower], union_ends))
+    gap_ends = np.concatenate((union_starts, [upper]))
+    wide = gap_ends - gap_starts >= length
+    free = [(_moment(s), _moment(e)) for s, e in zip(gap_starts[wide], gap_ends[wide])]
+
+    # A slot starting at t is blocked for a user by any of their blocks
+    # [s, e) with s - duration < t < e; after merging, each user's blocked
+    # ranges are disjoint, so counting them counts users
+    order = np.lexsort((starts, groups))
+    block_starts, block_ends, block_users = merge_sorted(starts[order], ends[order], groups[order])
+    block_starts = block_starts - length
+    order = np.lexsort((block_starts, block_users))
+    blocked_from, blocked_to, blocked_users = merge_sorted(block_starts[order], block_ends[order], block_users[order])
+
+    candidates = np.arange(lower, upper - length + 1, stride, dtype=np.int64)
+    blocked = (
+        np.searchsorted(np.sort(blocked_from), candidates, side='left')
+        - np.searchsorted(np.sort(blocked_to), candidates, side='right')
+    )
+    available = len(user_ids) - blocked
+
+    # Most attendees first, then earliest; slots overlapping a pick are skipped
+    best, chosen = [], []
+    for i in np.lexsort((candidates, -available)).tolist():
+        if len(chosen) >= limit:
+            break
+        slot = int(candidates[i])
+        if any(abs(slot - other) < length for other in chosen):
+            continue
+        chosen.append(slot)
+        unavailable = blocked_users[(blocked_from < slot) & (blocked_to > slot)]
+        best.append({
+            'start': _moment(slot),
+            'end': _moment(slot + length),
+            'available': int(available[i]),
+            'unavailable': sorted({user_ids[u] for u in unavailable.tolist()}),
+        })
+    return {'free': free, 'best': best}
@@ -0,0 +1,259 @@
+import copy
+
+from django.db import transaction
+
+from .caching import write_through
+from .conflicts import BusyIndex, busy_intervals, candidate_intervals, sweep_conflicts
+from .history import record_versions
+from .live import changed_fields, publish_event_updates
+from .models import Event, EventPermission
+from .recurrence import occurrence_cache, series_end
+from .roles import EDITOR_ROLES, OWNER_ROLES, invalidate_role_pairs
+from .serializers import EventSerializer
+
+MAX_BATCH_SIZE = 10000
+BULK_BATCH_SIZE = 1000
+
+
+def create_event_batch(items, request, serializer_class=EventSerializer):
+    """
+    Validate and insert a list of event payloads for `request.user`.
+
+    Field validation runs per item, but conflict detection is set-based: a
+    sort-and-sweep pass inside the batch and a single range query against
+    the user's existing events. Accepted events and their owner permission
+    rows are inserted with bulk_create in one transaction.
+
+    `serializer_class` validates the items; importers pass a subclass with
+    their own defaults.
+
+    Returns one result dict per input item, in input order.
+    """
+    user = request.user
+    results = [None] * len(items)
+    accepted = {}
+
+    for index, item in enumerate(items):
+        serializer = serializer_class(data=item, context={'request': request, 'check_conflicts': False})
+        if serializer.is_valid():
+            accepted[index] = serializer.validated_data
+        else:
+            results[index] = {'index': index, 'status': 'invalid', 'errors': serializer.errors}
+
+    # Conflicts between items of the same batch; recurring items take part
+    # with each of their occurrences up to the conflict horizon
+    candidates = {index: candidate_intervals(Event(**data)) for index, data in accepted.items()}
+    in_batch = sweep_conflicts(
+        (start, end, index) for index, intervals in candidates.items() for start, end in intervals
+    )
+    for index, other in in_batch.items():
+        results[index] = {'index': index, 'status': 'conflict', 'detail': f'Overlaps item {other} in this batch.'}
+        del accepted[index]
+
+    # Conflicts with events the user already has, fetched with one range query
+    intervals = [interval for index in accepted for interval in candidates[index]]
+    if intervals:
+        lower = min(start for start, _ in intervals)
+        upper = max(end for _, end in intervals)
+        busy = BusyIndex(busy_intervals(user, lower, upper))
+        for index in list(accepted):
+            if any(busy.overlaps(start, end) for start, end in candidates[index]):
+                results[index] = {
+                    'index': index, 'status': 'conflict',
+                    'detail': 'This event conflicts with another scheduled event.',
+                }
+                del accepted[index]
+
+    if accepted:
+        with transaction.atomic():
+            events = [Event(created_by=user, **data) for data in accepted.values()]
+            for event in events:
+                # bulk_create bypasses Event.save()
+                event.recurrence_end = series_end(event)
+            events = Event.objects.bulk_create(events, batch_size=BULK_BATCH_SIZE)
+            EventPermission.objects.bulk_create(
+                [EventPermission(user=user, event=event, role='owner') for event in events],
+                batch_size=BULK_BATCH_SIZE,
+            )
+            # created_by is the requesting user, so this serializes without queries
+            write_through(EventSerializer(events, many=True).data)
+            # Roles probed before the events existed are cached as missing
+            pairs = [(event.pk, user.pk) for event in events]
+            transaction.on_commit(lambda: invalidate_role_pairs(pairs))
+        for index, event in zip(accepted, events):
+            results[index] = {'index': index, 'status': 'created', 'id': event.id}
+
+    return results
+
+
+def _authorize(ids, user, roles):
+    """
+    Split `ids` into those the user holds one of `roles` on and a
+    {id: 'forbidden' | 'not_found'} map for the rest, with one
+    EventPermission query (plus one existence query for the rejected).
+    """
+    held = dict(EventPermission.objects.filter(user=user, event_id__in=ids).values_list('event_id', 'role'))
+    allowed = [event_id for event_id in ids if held.get(event_id) in roles]
+    rejected = [event_id for event_id in ids if held.get(event_id) not in roles]
+    existing = set(Event.objects.filter(pk__in=rejected).values_list('pk', flat=True)) if rejected else set()
+    return allowed, {event_id: 'forbidden' if event_id in existing else 'not_found' for event_id in rejected}
+
+
+def _target_ids(items, results, get_id):
+    # {id: index} of well-formed, unique targets; bad items get their result
+    targets = {}
+    for index, item in enumerate(items):
+        event_id = get_id(item)
+        if not isinstance(event_id, int) or isinstance(event_id, bool):
+            results[index] = {'index': index, 'status': 'invalid', 'errors': {'id': 'An event id is required.'}}
+        elif event_id in targets:
+            results[index] = {
+                'index': index, 'id': event_id, 'status': 'invalid',
+                'errors': {'id': f'Duplicate of item {targets[event_id]}.'},
+            }
+        else:
+            targets[event_id] = index
+    return targets
+
+
+def update_event_batch(items, request):
+    """
+    Apply partial updates, each {'id': <event id>, <field>: <value>, ...}.
+
+    Editor rights for every id are checked with one EventPermission query
+    and fields are validated per item. Conflicts are checked as a set
+    against the requesting user's events, as for single updates: a sweep
+    over the user's own edited events, then one range query for the rest.
+    History versions are written with bulk_create and the edits with
+    bulk_update, in one transaction.
+
+    Returns one result dict per input item, in input order.
+    """
+    user = request.user
+    results = [None] * len(items)
+    targets = _target_ids(items, results, lambda item: item.get('id') if isinstance(item, dict) else None)
+
+    allowed, rejected = _authorize(list(targets), user, EDITOR_ROLES)
+    for event_id, outcome in rejected.items():
+        index = targets[event_id]
+        results[index] = {'index': index, 'id': event_id, 'status': outcome}
+
+    events = {event.pk: event for event in Event.objects.filter(pk__in=allowed).select_related('created_by')}
+    proposed, validated = {}, {}
+    for event_id, event in events.items():
+        index = targets[event_id]
+        data = {field: value for field, value in items[index].items() if field != 'id'}
+        serializer = EventSerializer(
+            event, data=data, partial=True, context={'request': request, 'check_conflicts': False},
+        )
+        if not serializer.is_valid():
+            results[index] = {'index': index, 'id': event_id, 'status': 'invalid', 'errors': serializer.errors}
+            continue
+        # Edited copy, so the loaded event keeps its stored state for history
+        edited = copy.copy(event)
+        for field, value in serializer.validated_data.items():
+            setattr(edited, field, value)
+        proposed[event_id] = edited
+        validated[event_id] = serializer.validated_data
+
+    def reject(event_id, detail):
+        index = targets[event_id]
+        results[index] = {'index': index, 'id': event_id, 'status': 'conflict', 'detail': detail}
+        del proposed[event_id]
+
+    # Only the user's own events make up their calendar
+    own = {event_id for event_id, event in events.items() if event.created_by_id == user.pk}
+    candidates = {event_id: candidate_intervals(edited) for event_id, edited in proposed.items()}
+    in_batch = sweep_conflicts(
+        (start, end, event_id) for event_id in proposed if event_id in own for start, end in candidates[event_id]
+    )
+    for event_id, other in in_batch.items():
+        reject(event_id, f'Overlaps event {other} in this batch.')
+
+    intervals = [interval for event_id in proposed for interval in candidates[event_id]]
+    if intervals:
+        lower = min(start for start, _ in intervals)
+        upper = max(end for _, end in intervals)
+        # The user's edited events are placed from memory: at their new
+        # times if accepted, at their stored times otherwise
+        busy = busy_intervals(user, lower, upper, exclude_ids=own)
+        stored = {event_id: candidate_intervals(events[event_id]) for event_id in own}
+        conflict = 'This event conflicts with another scheduled event.'
+
+        # A rejected own event stays where it was and may block others,
+        # so repeat until nothing more is rejected
+        changed = True
+        while changed:
+            changed = False
+            blocked = BusyIndex(busy + [
+                interval for event_id in own if event_id not in proposed for interval in stored[event_id]
+            ])
+            for event_id in [event_id for event_id in proposed if event_id in own]:
+                if any(blocked.overlaps(start, end) for start, end in candidates[event_id]):
+                    reject(event_id, conflict)
+                    changed = True
+
+        # Events shared with the user must fit around the user's own
+        blocked = BusyIndex(busy + [
+            interval for event_id in own
+            for interval in (candidates[event_id] if event_id in proposed else stored[event_id])
+        ])
+        for event_id in [event_id for event_id in proposed if event_id not in own]:
+            if any(blocked.overlaps(start, end) for start, end in candidates[event_id]):
+                reject(event_id, conflict)
+
+    if proposed:
+        accepted = [events[event_id] for event_id in proposed]
+        before = EventSerializer(accepted, many=True).data
+        fields = {'version', 'recurrence_end'}
+        with transaction.atomic():
+            versions = record_versions(accepted, user)
+            for event in accepted:
+                for field, value in validated[event.pk].items():
+                    setattr(event, field, value)
+                fields.update(validated[event.pk])
+                event.version += 1
+                # bulk_update bypasses Event.save() and its signals
+                event.recurrence_end = series_end(event)
+            Event.objects.bulk_update(accepted, sorted(fields), batch_size=BULK_BATCH_SIZE)
+            after = EventSerializer(accepted, many=True).data
+            write_through(after)
+            publish_event_updates(
+                (
+                    (event.pk, version.pk, changed_fields(old, new))
+                    for event, version, old, new in zip(accepted, versions, before, after)
+                ),
+                user,
+            )
+        for event in accepted:
+            occurrence_cache.invalidate(event.pk)
+            index = targets[event.pk]
+            results[index] = {'index': index, 'id': event.pk, 'status': 'updated', 'version': event.version}
+
+    return results
+
+
+def delete_event_batch(ids, request):
+    """
+    Delete the listed events the requesting user owns. Ownership is
+    checked with one EventPermission query and the deletion is a single
+    queryset delete, so cascades and signal handlers still run.
+
+    Returns one result dict per input id, in input order.
+    """
+    results = [None] * len(ids)
+    targets = _target_ids(ids, results, lambda item: item)
+
+    allowed, rejected = _authorize(list(targets), request.user, OWNER_ROLES)
+    for event_id, outcome in rejected.items():
+        index = targets[event_id]
+        results[index] = {'index': index, 'id': event_id, 'status': outcome}
+
+    if allowed:
+        with transaction.atomic():
+            Event.objects.filter(pk__in=allowed).delete()
+        for event_id in allowed:
+            index = targets[event_id]
+            results[index] = {'index': index, 'id': event_id, 'status': 'deleted'}
+
+    return results
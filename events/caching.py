@@ -0,0 +1,79 @@
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .metrics import count_cache
+
+PAYLOAD_CACHE_TIMEOUT = getattr(settings, 'EVENT_PAYLOAD_CACHE_TIMEOUT', 60 * 60)
+
+_counters = {'hits': 0, 'misses': 0, 'writes': 0, 'invalidations': 0}
+_lock = threading.Lock()
+
+
+def _key(event_id):
+    return f'event-payload:{event_id}'
+
+
+def _count(**amounts):
+    with _lock:
+        for name, amount in amounts.items():
+            _counters[name] += amount
+
+
+def get_payloads(event_ids, versions=None):
+    """
+    Serialized EventSerializer payloads found in the cache, as
+    {event_id: payload}, fetched with one multi-get. With `versions`
+    ({event_id: version}) entries for another version count as misses.
+    """
+    event_ids = list(event_ids)
+    if not event_ids:
+        return {}
+    found = cache.get_many([_key(event_id) for event_id in event_ids])
+    payloads = {}
+    for payload in found.values():
+        if versions is None or versions.get(payload['id']) == payload['version']:
+            payloads[payload['id']] = payload
+    _count(hits=len(payloads), misses=len(event_ids) - len(payloads))
+    count_cache('payload', hits=len(payloads), misses=len(event_ids) - len(payloads))
+    return payloads
+
+
+def get_payload(event_id, version=None):
+    return get_payloads([event_id], None if version is None else {event_id: version}).get(event_id)
+
+
+def store_payloads(payloads):
+    payloads = [dict(payload) for payload in payloads]
+    if payloads:
+        cache.set_many({_key(payload['id']): payload for payload in payloads}, PAYLOAD_CACHE_TIMEOUT)
+        _count(writes=len(payloads))
+
+
+def write_through(payloads):
+    """
+    Store fresh payloads once the surrounding transaction commits, so a
+    rolled-back write never reaches the cache.
+    """
+    payloads = [dict(payload) for payload in payloads]
+    transaction.on_commit(lambda: store_payloads(payloads))
+
+
+def invalidate_payloads(event_ids):
+    event_ids = list(event_ids)
+
+    def delete():
+        cache.delete_many([_key(event_id) for event_id in event_ids])
+        _count(invalidations=len(event_ids))
+
+    transaction.on_commit(delete)
+
+
+def payload_cache_stats():
+    with _lock:
+        stats = dict(_counters)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
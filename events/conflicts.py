@@ -0,0 +1,103 @@
+from bisect import bisect_left
+from datetime import timedelta
+
+from django.conf import settings
+
+from .models import Event
+from .recurrence import get_rule, iter_occurrences, occurrences_between
+
+# How far ahead a new recurring series is checked for conflicts
+RECURRENCE_CONFLICT_HORIZON = getattr(settings, 'RECURRENCE_CONFLICT_HORIZON', timedelta(days=365))
+
+
+def merge_intervals(intervals):
+    """
+    Union of (start, end) pairs as a sorted list of disjoint [start, end] blocks.
+    """
+    blocks = []
+    for start, end in sorted(intervals):
+        if blocks and start <= blocks[-1][1]:
+            if end > blocks[-1][1]:
+                blocks[-1][1] = end
+        else:
+            blocks.append([start, end])
+    return blocks
+
+
+class BusyIndex:
+    """
+    Answers "does [start, end) overlap anything busy?" in O(log n).
+
+    Busy intervals are merged into disjoint blocks sorted by start, so their
+    ends are sorted too: the only block that can overlap is the last one
+    starting before `end`.
+    """
+    def __init__(self, intervals):
+        self.blocks = merge_intervals(intervals)
+        self.starts = [block[0] for block in self.blocks]
+
+    def overlaps(self, start, end):
+        position = bisect_left(self.starts, end) - 1
+        return position >= 0 and self.blocks[position][1] > start
+
+
+def sweep_conflicts(items):
+    """
+    Sort-and-sweep over (start, end, key) intervals; a key may own several
+    intervals (the occurrences of a recurring item). Intervals are accepted
+    greedily in start order and a key is rejected as soon as one of its
+    intervals overlaps an accepted interval of another key.
+
+    Returns {rejected key: key of the accepted item it overlaps}.
+    """
+    conflicts = {}
+    furthest = None  # (end, key) of the accepted interval reaching furthest
+    for start, end, key in sorted(items, key=lambda item: (item[0], item[1])):
+        if key in conflicts:
+            continue
+        if furthest is not None and start < furthest[0] and furthest[1] != key:
+            conflicts[key] = furthest[1]
+        elif furthest is None or end > furthest[0]:
+            furthest = (end, key)
+    return conflicts
+
+
+def candidate_intervals(event):
+    """
+    Intervals a new or edited event would occupy: the event itself, or the
+    occurrences of its series up to the conflict horizon.
+    """
+    if get_rule(event) is None:
+        return [(event.start_time, event.end_time)]
+    horizon = event.start_time + RECURRENCE_CONFLICT_HORIZON
+    return list(iter_occurrences(event, event.start_time, horizon))
+
+
+def busy_intervals(user, start, end, exclude_ids=()):
+    """
+    (start, end) pairs the user is busy with inside [start, end), in one query.
+    Recurring series are expanded into their occurrences in the window.
+    """
+    events = Event.objects.filter(created_by=user).in_window(start, end).only(
+        'id', 'start_time', 'end_time', 'is_recurring', 'recurrence_pattern', 'recurrence_exceptions',
+    )
+    if exclude_ids:
+        events = events.exclude(id__in=exclude_ids)
+
+    intervals = []
+    for event in events:
+        intervals.extend(occurrences_between(event, start, end))
+    return intervals
+
+
+def find_conflict(user, event, exclude_ids=()):
+    """
+    True when `event` (saved or not) overlaps another event of the user.
+    """
+    candidates = candidate_intervals(event)
+    if not candidates:
+        return False
+    lower = min(start for start, _ in candidates)
+    upper = max(end for _, end in candidates)
+    busy = BusyIndex(busy_intervals(user, lower, upper, exclude_ids))
+    return any(busy.overlaps(start, end) for start, end in candidates)
@@ -1,16 +1,266 @@
+import asyncio
 import json
+import weakref
+from collections import deque
+
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+
+from .live import event_group
+from .roles import lookup_role
+
+OVERFLOW_POLICIES = ('drop_oldest', 'coalesce', 'disconnect')
+
+# Messages held per connection while the client is slower than the producers
+QUEUE_SIZE = getattr(settings, 'NOTIFICATION_QUEUE_SIZE', 100)
+OVERFLOW_POLICY = getattr(settings, 'NOTIFICATION_OVERFLOW_POLICY', 'coalesce')
+# Messages arriving within this many seconds of each other share one frame
+BATCH_WINDOW = getattr(settings, 'NOTIFICATION_BATCH_WINDOW', 0.05)
+# Event groups a single socket may follow at once
+MAX_SUBSCRIPTIONS = getattr(settings, 'NOTIFICATION_MAX_SUBSCRIPTIONS', 200)
+
+# Application close code sent when the 'disconnect' policy drops a client
+OVERFLOW_CLOSE_CODE = 4008
+
+# channel name -> consumer, for connection_stats()
+_connections = weakref.WeakValueDictionary()
+
+
+class NotificationQueue:
+    """
+    Bounded per-connection send queue. When full, `policy` decides what
+    happens to a new message:
+
+    - drop_oldest: the oldest queued message is discarded.
+    - coalesce: everything queued, plus the new message, is replaced by a
+      single summary message carrying the count, followed by one update
+      per event with live edits queued (their changes merged, latest
+      version_id and editor).
+    - disconnect: push() returns False and the caller closes the socket.
+    """
+
+    def __init__(self, maxsize=QUEUE_SIZE, policy=OVERFLOW_POLICY):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {policy!r}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.items = deque()
+        self.high_water = 0
+        self.received = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.frames_sent = 0
+        self.messages_sent = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def push(self, message):
+        self.received += 1
+        if len(self.items) >= self.maxsize:
+            if self.policy == 'disconnect':
+                return False
+            if self.policy == 'drop_oldest':
+                self.items.popleft()
+                self.dropped += 1
+            else:
+                self._coalesce(message)
+                return True
+        self.items.append(message)
+        self.high_water = max(self.high_water, len(self.items))
+        return True
+
+    def _coalesce(self, message):
+        # Live edits of one event merge into a single update carrying every
+        # changed field at its latest value, so subscribers can still
+        # rebuild the event; the rest collapses into one summary
+        count = 0
+        updates = {}
+        for item in (*self.items, message):
+            if item.get('type') == 'event.update':
+                merged = updates.get(item['event_id'])
+                if merged is not None:
+                    item = {**item, 'changes': {**merged['changes'], **item['changes']}}
+                updates[item['event_id']] = item
+            else:
+                count += item.get('count', 1) if item.get('coalesced') else 1
+        self.coalesced += len(self.items) + 1
+        self.items.clear()
+        if count:
+            self.items.append({'message': f'{count} new notifications', 'count': count, 'coalesced': True})
+        self.items.extend(updates.values())
+
+    def drain(self):
+        messages = list(self.items)
+        self.items.clear()
+        if messages:
+            self.frames_sent += 1
+            self.messages_sent += len(messages)
+        return messages
+
+    def stats(self):
+        return {
+            'depth': len(self.items),
+            'high_water': self.high_water,
+            'received': self.received,
+            'dropped': self.dropped,
+            'coalesced': self.coalesced,
+            'frames_sent': self.frames_sent,
+            'messages_sent': self.messages_sent,
+        }
+
+
+def frame(messages):
+    # A lone message keeps the original one-object frame
+    if len(messages) == 1:
+        return messages[0]
+    return {'messages': messages}
+
+
+def connection_stats():
+    """
+    Queue counters of every notification socket open in this process.
+    """
+    return [
+        {'channel': channel_name, 'user_id': consumer.user_id, **consumer.queue.stats()}
+        for channel_name, consumer in list(_connections.items())
+    ]
+
 
 class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Notification socket of the authenticated user, at
+    ws/notifications/<their id>/. Clients can also follow live edits of
+    events they have a role on by sending
+    {"action": "subscribe" | "unsubscribe", "event_id": <id>}.
+    """
+    # Channel-layer handlers that never touch the database
+    layer_handlers = ('send_notification', 'send_notification_batch', 'event_update', 'event_access_revoked')
+    queue_size = QUEUE_SIZE
+    overflow_policy = OVERFLOW_POLICY
+    batch_window = BATCH_WINDOW
+
+    def __init__(self, *args, queue_size=None, overflow_policy=None, batch_window=None, **kwargs):
+        # Per-route overrides via as_asgi(); channels ignores unknown kwargs
+        super().__init__(*args, **kwargs)
+        if queue_size is not None:
+            self.queue_size = queue_size
+        if overflow_policy is not None:
+            self.overflow_policy = overflow_policy
+        if batch_window is not None:
+            self.batch_window = batch_window
+
     async def connect(self):
-        self.user_id = self.scope['url_route']['kwargs']['user_id']
+        # The path names the user, but only the authenticated one (see
+        # events.authentication.JWTAuthMiddleware) may open it
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated or str(user.pk) != self.scope['url_route']['kwargs']['user_id']:
+            await self.close()
+            return
+        self.user_id = user.pk
         self.group_name = f"user_{self.user_id}"
+        self.queue = NotificationQueue(self.queue_size, self.overflow_policy)
+        self.pending = asyncio.Event()
+        self.closing = False
+        self.event_ids = set()
 
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
+        self.flusher = asyncio.create_task(self.flush_loop())
+        _connections[self.channel_name] = self
+
+    async def dispatch(self, message):
+        # Channels closes stale DB connections (a thread-pool hop) before
+        # every handler; notification handlers never touch the database
+        if message['type'] in self.layer_handlers:
+            await getattr(self, message['type'])(message)
+        else:
+            await super().dispatch(message)
 
     async def disconnect(self, close_code):
+        self.closing = True
+        flusher = getattr(self, 'flusher', None)
+        if flusher is not None:
+            flusher.cancel()
+        _connections.pop(self.channel_name, None)
+        if not hasattr(self, 'group_name'):
+            # Refused in connect()
+            return
         await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        for event_id in getattr(self, 'event_ids', ()):
+            await self.channel_layer.group_discard(event_group(event_id), self.channel_name)
+
+    async def receive(self, text_data=None, bytes_data=None):
+        try:
+            data = json.loads(text_data or '')
+            action, event_id = data['action'], int(data['event_id'])
+        except (ValueError, KeyError, TypeError):
+            action, event_id = None, None
+
+        if action == 'subscribe':
+            await self.subscribe(event_id)
+        elif action == 'unsubscribe':
+            await self.unsubscribe(event_id)
+        else:
+            await self.reply({'type': 'error', 'detail': 'Expected {"action": "subscribe" | "unsubscribe", "event_id": <id>}.'})
+
+    async def subscribe(self, event_id):
+        if event_id not in self.event_ids:
+            if len(self.event_ids) >= MAX_SUBSCRIPTIONS:
+                await self.reply({'type': 'error', 'event_id': event_id, 'detail': f'At most {MAX_SUBSCRIPTIONS} subscriptions per connection.'})
+                return
+            if await database_sync_to_async(lookup_role)(self.user_id, event_id) is None:
+                await self.reply({'type': 'error', 'event_id': event_id, 'detail': 'No permission on this event.'})
+                return
+            await self.channel_layer.group_add(event_group(event_id), self.channel_name)
+            self.event_ids.add(event_id)
+        await self.reply({'type': 'subscribed', 'event_id': event_id})
+
+    async def unsubscribe(self, event_id, reason=None):
+        if event_id in self.event_ids:
+            self.event_ids.discard(event_id)
+            await self.channel_layer.group_discard(event_group(event_id), self.channel_name)
+        await self.reply({'type': 'unsubscribed', 'event_id': event_id, **({'reason': reason} if reason else {})})
+
+    async def reply(self, message):
+        # Control replies skip the notification queue
+        if not self.closing:
+            await self.send(text_data=json.dumps(message))
 
     async def send_notification(self, event):
-        await self.send(text_data=json.dumps(event['message']))
+        await self.enqueue(event['message'])
+
+    async def send_notification_batch(self, event):
+        # Several outbox messages for this socket's group coalesced into one
+        # channel-layer message
+        for queued in event['events']:
+            await self.dispatch(queued)
+
+    async def event_update(self, event):
+        await self.enqueue({'type': 'event.update', **event['update']})
+
+    async def event_access_revoked(self, event):
+        if event['event_id'] in self.event_ids:
+            await self.unsubscribe(event['event_id'], reason='access revoked')
+
+    async def enqueue(self, message):
+        # Never waits on the socket, so a slow client cannot back up the
+        # channel layer; the bounded queue absorbs the difference
+        if self.closing:
+            return
+        if not self.queue.push(message):
+            self.closing = True
+            await self.close(code=OVERFLOW_CLOSE_CODE)
+            return
+        self.pending.set()
+
+    async def flush_loop(self):
+        while True:
+            await self.pending.wait()
+            if self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            self.pending.clear()
+            messages = self.queue.drain()
+            if messages:
+                await self.send(text_data=json.dumps(frame(messages)))
@@ -0,0 +1,47 @@
+from hashlib import sha1
+
+from django.utils.cache import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def version_etag(kind, event_id, version, request=None):
+    """
+    Strong ETag for a representation derived from one event at `version`.
+    Pass the request when query parameters (cursor, page size, format)
+    change the representation.
+    """
+    tag = f'{kind}-{event_id}-{version}'
+    if request is not None and request.META.get('QUERY_STRING'):
+        tag += '-' + sha1(request.META['QUERY_STRING'].encode()).hexdigest()[:16]
+    return quote_etag(tag)
+
+
+def digest_etag(*parts):
+    # For representations built from many rows, e.g. a page of events
+    return quote_etag(sha1(repr(parts).encode()).hexdigest())
+
+
+def etag_matches(request, etag):
+    """
+    If-None-Match test, using weak comparison as RFC 9110 requires for it.
+    """
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    candidates = parse_etags(header)
+    if '*' in candidates:
+        return True
+    return etag in (candidate.removeprefix('W/') for candidate in candidates)
+
+
+def not_modified(etag):
+    response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    return response
+
+
+def with_etag(response, etag):
+    if response.status_code == status.HTTP_200_OK:
+        response['ETag'] = etag
+    return response
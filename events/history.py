@@ -0,0 +1,159 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, Q, Subquery
+from django.utils.dateparse import parse_datetime
+
+from .models import Event, EventHistory
+
+HISTORY_FIELDS = ('title', 'description', 'location', 'start_time', 'end_time')
+DATETIME_FIELDS = ('start_time', 'end_time')
+
+# A full snapshot is stored at least every K versions, so rebuilding any
+# version replays at most K - 1 deltas
+KEYFRAME_INTERVAL = getattr(settings, 'EVENT_HISTORY_KEYFRAME_INTERVAL', 10)
+
+
+def snapshot_of(event):
+    """
+    The versioned fields of `event` in their stored (JSON) form.
+    """
+    return {
+        field: getattr(event, field).isoformat() if field in DATETIME_FIELDS else getattr(event, field)
+        for field in HISTORY_FIELDS
+    }
+
+
+def decode_snapshot(stored):
+    snapshot = dict(stored)
+    for field in DATETIME_FIELDS:
+        if snapshot.get(field) is not None:
+            snapshot[field] = parse_datetime(snapshot[field])
+    return snapshot
+
+
+def record_version(event, edited_by):
+    return record_versions([event], edited_by)[0]
+
+
+def record_versions(events, edited_by):
+    """
+    Append a history version holding the current state of each event; call
+    it before applying an edit, then increment `event.version`. Needs three queries whatever the number of
+    events: latest versions, their delta chains, and one bulk insert.
+    """
+    events = list(events)
+    if not events:
+        return []
+    event_ids = [event.pk for event in events]
+
+    with transaction.atomic():
+        # Serialize concurrent edits of the same event so versions stay unique.
+        # Event.version is refreshed under the lock so callers can bump it.
+        locked = dict(
+            Event.objects.select_for_update().filter(pk__in=event_ids).order_by('pk').values_list('pk', 'version')
+        )
+        for event in events:
+            event.version = locked.get(event.pk, event.version)
+
+        latest = {
+            row['event_id']: (row['latest'], row['keyframe'])
+            for row in EventHistory.objects.filter(event_id__in=event_ids).values('event_id').annotate(
+                latest=Max('version'), keyframe=Max('version', filter=Q(is_keyframe=True)),
+            )
+        }
+        chains = Q()
+        for event_id, (version, keyframe) in latest.items():
+            if keyframe is not None and version - keyframe + 1 < KEYFRAME_INTERVAL:
+                chains |= Q(event_id=event_id, version__gte=keyframe, version__lte=version)
+        previous = {}
+        if chains:
+            wanted = {event_id: {version} for event_id, (version, _) in latest.items()}
+            previous = _replay(EventHistory.objects.filter(chains), wanted)
+
+        rows = []
+        for event in events:
+            current = snapshot_of(event)
+            version, _ = latest.get(event.pk, (0, None))
+            prior = previous.get((event.pk, version))
+            if prior is None:
+                row = EventHistory(event=event, edited_by=edited_by, version=version + 1, is_keyframe=True, changes=current)
+            else:
+                delta = {field: value for field, value in current.items() if prior.get(field) != value}
+                row = EventHistory(event=event, edited_by=edited_by, version=version + 1, is_keyframe=False, changes=delta)
+            row.snapshot = decode_snapshot(current)
+            rows.append(row)
+        return EventHistory.objects.bulk_create(rows)
+
+
+def _replay(chain_rows, targets):
+    """
+    Rebuild stored snapshots from keyframe + delta rows. `targets` maps
+    event_id to the set of versions wanted.
+    Returns {(event_id, version): stored snapshot}.
+    """
+    snapshots = {}
+    state, state_event = None, None
+    for row in chain_rows.order_by('event_id', 'version').only('event_id', 'version', 'is_keyframe', 'changes'):
+        if row.is_keyframe:
+            state = dict(row.changes)
+        elif state is None or state_event != row.event_id:
+            continue
+        else:
+            state = {**state, **row.changes}
+        state_event = row.event_id
+        if row.version in targets.get(row.event_id, ()):
+            snapshots[(row.event_id, row.version)] = state
+    return snapshots
+
+
+def iter_snapshots(rows):
+    """
+    Yield EventHistory rows of one event with `.snapshot` set, replaying
+    deltas as the rows stream past so memory stays constant however long
+    the history is. `rows` must be in version order and start at a keyframe.
+    """
+    state = None
+    for row in rows:
+        state = dict(row.changes) if row.is_keyframe else {**state, **row.changes}
+        row.snapshot = decode_snapshot(state)
+        yield row
+
+
+def attach_snapshots(rows):
+    """
+    Set `.snapshot` (decoded field values) on each EventHistory row, loading
+    every delta chain needed with a single query. Returns the rows.
+    """
+    rows = list(rows)
+    pending = [row for row in rows if not hasattr(row, 'snapshot')]
+    if not pending:
+        return rows
+
+    targets = {}
+    for row in pending:
+        targets.setdefault(row.event_id, set()).add(row.version)
+
+    # Versions close together share one chain; distant ones get their own
+    # so a diff between v1 and v50000 does not read everything in between.
+    chains = Q()
+    for event_id, versions in targets.items():
+        cluster = []
+        for version in sorted(versions):
+            if cluster and version - cluster[-1] > KEYFRAME_INTERVAL:
+                chains |= _chain_filter(event_id, cluster[0], cluster[-1])
+                cluster = []
+            cluster.append(version)
+        chains |= _chain_filter(event_id, cluster[0], cluster[-1])
+
+    snapshots = _replay(EventHistory.objects.filter(chains), targets)
+    for row in pending:
+        row.snapshot = decode_snapshot(snapshots[(row.event_id, row.version)])
+    return rows
+
+
+def _chain_filter(event_id, first, last):
+    # From the last keyframe at or before `first` up to `last`
+    keyframe = EventHistory.objects.filter(
+        event_id=event_id, version__lte=first, is_keyframe=True,
+    ).order_by('-version').values('version')[:1]
+    return Q(event_id=event_id, version__lte=last, version__gte=Subquery(keyframe))
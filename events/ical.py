@@ -0,0 +1,318 @@
+import re
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import serializers
+
+from .batch import create_event_batch
+from .recurrence import RECURRENCE_TIME_ZONE, get_rule, parse_exceptions
+from .serializers import EventSerializer
+
+# Rows fetched per round trip while exporting
+ICAL_EXPORT_CHUNK_SIZE = getattr(settings, 'ICAL_EXPORT_CHUNK_SIZE', 2000)
+# Events validated and inserted per create_event_batch call while importing
+ICAL_IMPORT_CHUNK_SIZE = getattr(settings, 'ICAL_IMPORT_CHUNK_SIZE', 1000)
+ICAL_UID_DOMAIN = getattr(settings, 'ICAL_UID_DOMAIN', 'event-manager')
+
+MEDIA_TYPE = 'text/calendar'
+PRODID = '-//Event Manager//Events API//EN'
+
+# RFC 5545: content lines are folded at 75 octets
+_FOLD_OCTETS = 75
+_UTC_FORMAT = '%Y%m%dT%H%M%SZ'
+_LOCAL_FORMAT = '%Y%m%dT%H%M%S'
+_DURATION = re.compile(r'^([+-])?P(?:(\d+)W)?(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?$')
+
+
+# Export
+
+def escape(text):
+    return (
+        text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def fold(line):
+    """
+    One content line, folded into CRLF-terminated pieces of at most 75
+    octets without splitting a UTF-8 sequence.
+    """
+    if len(line.encode('utf-8')) <= _FOLD_OCTETS:
+        return line + '\r\n'
+    pieces, piece, size = [], '', 0
+    for char in line:
+        octets = len(char.encode('utf-8'))
+        # Continuation lines start with a space, which counts
+        if size + octets > _FOLD_OCTETS:
+            pieces.append(piece)
+            piece, size = ' ', 1
+        piece += char
+        size += octets
+    pieces.append(piece)
+    return '\r\n'.join(pieces) + '\r\n'
+
+
+def utc(moment):
+    return moment.astimezone(dt_timezone.utc).strftime(_UTC_FORMAT)
+
+
+def timed(name, moments, zone=None):
+    # A DATE-TIME property: UTC values, or wall-clock ones with the zone's TZID
+    if zone is None:
+        return f"{name}:{','.join(utc(moment) for moment in moments)}"
+    values = ','.join(moment.astimezone(zone).strftime(_LOCAL_FORMAT) for moment in moments)
+    return f'{name};TZID={zone.key}:{values}'
+
+
+def vevent(event, stamp):
+    """
+    The VEVENT of one event as a folded str. Series become an RRULE plus
+    EXDATEs; legacy patterns the rule parser rejects are exported as
+    single events, as everywhere else. Series repeat in
+    RECURRENCE_TIME_ZONE, so outside UTC their times carry its TZID for
+    clients to expand them the same way.
+    """
+    rule = get_rule(event)
+    zone = RECURRENCE_TIME_ZONE if rule is not None and RECURRENCE_TIME_ZONE.key != 'UTC' else None
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:event-{event.id}@{ICAL_UID_DOMAIN}',
+        f'DTSTAMP:{stamp}',
+        timed('DTSTART', [event.start_time], zone),
+        timed('DTEND', [event.end_time], zone),
+        f'SUMMARY:{escape(event.title)}',
+    ]
+    if event.description:
+        lines.append(f'DESCRIPTION:{escape(event.description)}')
+    if event.location:
+        lines.append(f'LOCATION:{escape(event.location)}')
+    if event.created_at:
+        lines.append(f'CREATED:{utc(event.created_at)}')
+    lines.append(f'SEQUENCE:{event.version - 1}')
+    if rule is not None:
+        lines.append(f'RRULE:{rule.to_rrule()}')
+        exceptions = sorted(parse_exceptions(event.recurrence_exceptions))
+        if exceptions:
+            lines.append(timed('EXDATE', exceptions, zone))
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def iter_calendar(events):
+    """
+    A VCALENDAR as str parts, one per event, for streaming.
+    """
+    stamp = utc(timezone.now())
+    yield fold('BEGIN:VCALENDAR') + fold('VERSION:2.0') + fold(f'PRODID:{PRODID}') + fold('CALSCALE:GREGORIAN')
+    for event in events:
+        yield vevent(event, stamp)
+    yield fold('END:VCALENDAR')
+
+
+# Import
+
+class ICalEventSerializer(EventSerializer):
+    # Calendar entries often have no description or location
+    description = serializers.CharField(allow_blank=True, required=False, default='')
+    location = serializers.CharField(allow_blank=True, required=False, default='', max_length=255)
+
+
+def unfold(lines):
+    """
+    Logical content lines from an iterable of physical lines (str or
+    bytes), joining folded continuations. Reads lazily.
+    """
+    current = None
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.rstrip('\r\n')
+        if line[:1] in (' ', '\t'):
+            if current is not None:
+                current += line[1:]
+            continue
+        if current is not None:
+            yield current
+        current = line
+    if current:
+        yield current
+
+
+def parse_line(line):
+    """
+    (NAME, {PARAM: value}, value) of a content line.
+    """
+    # The value starts at the first ':' outside a quoted parameter value
+    quoted = False
+    for position, char in enumerate(line):
+        if char == '"':
+            quoted = not quoted
+        elif char == ':' and not quoted:
+            head, value = line[:position], line[position + 1:]
+            break
+    else:
+        head, value = line, ''
+    name, *params = head.split(';')
+    parameters = {}
+    for param in params:
+        key, _, param_value = param.partition('=')
+        parameters[key.upper()] = param_value.strip('"')
+    return name.upper(), parameters, value
+
+
+def unescape(text):
+    return re.sub(r'\\([\\;,nN])', lambda match: '\n' if match.group(1) in 'nN' else match.group(1), text)
+
+
+def parse_moment(value, params):
+    """
+    DATE-TIME (UTC, floating or with TZID) or DATE value as an aware
+    datetime; dates become midnight. Raises ValueError.
+    """
+    value = value.strip()
+    if params.get('VALUE') == 'DATE' or len(value) == 8:
+        return timezone.make_aware(datetime.combine(datetime.strptime(value, '%Y%m%d').date(), time.min))
+    if value.endswith('Z'):
+        return datetime.strptime(value, _UTC_FORMAT).replace(tzinfo=dt_timezone.utc)
+    moment = datetime.strptime(value, '%Y%m%dT%H%M%S')
+    zone = timezone.get_default_timezone()
+    if 'TZID' in params:
+        try:
+            zone = ZoneInfo(params['TZID'])
+        except (ZoneInfoNotFoundError, ValueError):
+            pass
+    return timezone.make_aware(moment, zone)
+
+
+def parse_duration(value):
+    match = _DURATION.match(value.strip())
+    if not match or not any(match.groups()[1:]):
+        raise ValueError(f'Malformed duration {value!r}.')
+    sign, weeks, days, hours, minutes, seconds = match.groups()
+    duration = timedelta(
+        weeks=int(weeks or 0), days=int(days or 0),
+        hours=int(hours or 0), minutes=int(minutes or 0), seconds=int(seconds or 0),
+    )
+    return -duration if sign == '-' else duration
+
+
+def iter_components(lines):
+    """
+    Properties of each top-level VEVENT as {NAME: [(params, value), ...]},
+    one event at a time. Nested components (e.g. VALARM) are skipped.
+    Raises ValueError when the input is not a VCALENDAR.
+    """
+    lines = unfold(lines)
+    for line in lines:
+        if line.strip():
+            if line.strip().lstrip('\ufeff').upper() != 'BEGIN:VCALENDAR':
+                raise ValueError('Not an iCalendar file.')
+            break
+    else:
+        raise ValueError('Not an iCalendar file.')
+
+    event, depth = None, 0
+    for line in lines:
+        if not line.strip():
+            continue
+        name, params, value = parse_line(line)
+        if name == 'BEGIN':
+            if event is None and value.upper() == 'VEVENT':
+                event = {}
+            elif event is not None:
+                depth += 1
+        elif name == 'END':
+            if event is not None and depth:
+                depth -= 1
+            elif event is not None and value.upper() == 'VEVENT':
+                yield event
+                event = None
+        elif event is not None and not depth:
+            event.setdefault(name, []).append((params, value))
+
+
+def to_payload(component):
+    """
+    EventSerializer input for one VEVENT, or raises ValueError for what the
+    serializer cannot judge (missing or malformed DTSTART, DTEND, DURATION).
+    """
+    def first(name, default=None):
+        values = component.get(name)
+        return values[0] if values else (None, default)
+
+    start_params, start_value = first('DTSTART')
+    if start_value is None:
+        raise ValueError('DTSTART is required.')
+    start = parse_moment(start_value, start_params)
+
+    end_params, end_value = first('DTEND')
+    _, duration = first('DURATION')
+    if end_value is not None:
+        end = parse_moment(end_value, end_params)
+    elif duration is not None:
+        end = start + parse_duration(duration)
+    elif start_params.get('VALUE') == 'DATE' or len(start_value.strip()) == 8:
+        end = start + timedelta(days=1)
+    else:
+        raise ValueError('DTEND or DURATION is required.')
+
+    payload = {
+        'title': unescape(first('SUMMARY', '')[1]).strip() or '(untitled)',
+        'description': unescape(first('DESCRIPTION', '')[1]),
+        'location': unescape(first('LOCATION', '')[1]),
+        'start_time': start.isoformat(),
+        'end_time': end.isoformat(),
+    }
+    _, rrule = first('RRULE')
+    if rrule:
+        payload['is_recurring'] = True
+        payload['recurrence_pattern'] = rrule.strip()
+        payload['recurrence_exceptions'] = [
+            parse_moment(moment, params).isoformat()
+            for params, value in component.get('EXDATE', ())
+            for moment in value.split(',') if moment.strip()
+        ]
+    return payload
+
+
+def import_calendar(lines, request):
+    """
+    Create the events of an iCalendar stream for `request.user`. VEVENTs
+    are parsed as the input is read and inserted in chunks of
+    ICAL_IMPORT_CHUNK_SIZE through create_event_batch, each chunk in its
+    own transaction.
+
+    Returns (created, failures), failures being the result dicts of the
+    events that were not created, indexed by position in the file.
+    """
+    created, failures = 0, []
+    chunk, sources = [], []
+
+    def flush():
+        nonlocal created
+        results = create_event_batch(chunk, request, serializer_class=ICalEventSerializer)
+        for (position, uid), result in zip(sources, results):
+            if result['status'] == 'created':
+                created += 1
+            else:
+                failures.append({**result, 'index': position, 'uid': uid})
+        chunk.clear()
+        sources.clear()
+
+    for position, component in enumerate(iter_components(lines)):
+        uid = component.get('UID', [({}, None)])[0][1]
+        try:
+            payload = to_payload(component)
+        except ValueError as exc:
+            failures.append({'index': position, 'uid': uid, 'status': 'invalid', 'detail': str(exc)})
+            continue
+        chunk.append(payload)
+        sources.append((position, uid))
+        if len(chunk) >= ICAL_IMPORT_CHUNK_SIZE:
+            flush()
+    if chunk:
+        flush()
+    return created, failures
@@ -0,0 +1,628 @@
+import csv
+import io
+import json
+from array import array
+from bisect import bisect_left
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .caching import invalidate_payloads
+from .conflicts import candidate_intervals, merge_intervals
+from .history import DATETIME_FIELDS, HISTORY_FIELDS
+from .models import Event, EventHistory, EventPermission
+from .recurrence import RecurrenceRule, get_rule, iter_occurrences, series_end
+from .roles import invalidate_role_pairs
+from .sharing import ROLES
+
+# Records per transaction (and per checkpoint)
+IMPORT_CHUNK_SIZE = getattr(settings, 'IMPORT_CHUNK_SIZE', 10000)
+FORMATS = ('csv', 'ndjson')
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+_MICROSECOND = timedelta(microseconds=1)
+_TRUE = {'1', 'true', 't', 'yes', 'y'}
+_FALSE = {'', '0', 'false', 'f', 'no', 'n'}
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+_SERIES_FIELDS = ('start_time', 'end_time', 'is_recurring', 'recurrence_pattern', 'recurrence_exceptions')
+
+
+# Reading
+
+def read_records(path, fmt, offset=0):
+    """
+    (end offset, record) for each record of a CSV file with a header line,
+    or of an NDJSON file, read as a stream from byte `offset`. Reading
+    resumes at the end offset of the last record handled. NDJSON lines
+    that are not JSON objects come back as None.
+    """
+    with open(path, 'rb') as stream:
+        if fmt == 'csv':
+            header = stream.readline()
+            fieldnames = next(csv.reader([header.decode('utf-8-sig')]), [])
+            offset = max(offset, len(header))
+        stream.seek(offset)
+        position = offset
+
+        def lines():
+            nonlocal position
+            for line in stream:
+                position += len(line)
+                yield line.decode('utf-8', errors='replace')
+
+        if fmt == 'csv':
+            # csv pulls only the lines of one record at a time, so
+            # `position` is the record's end, quoted newlines included
+            for values in csv.reader(lines()):
+                if values:
+                    yield position, dict(zip(fieldnames, values))
+            return
+        for line in lines():
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield position, record if isinstance(record, dict) else None
+
+
+# Field parsing; each raises ValueError with the message reported for the row
+
+def _text(record, field, required=False, max_length=None):
+    value = record.get(field)
+    value = '' if value is None else str(value)
+    if required and not value.strip():
+        raise ValueError(f'{field} is required.')
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f'{field} is longer than {max_length} characters.')
+    return value
+
+
+def _moment(value, field):
+    moment = parse_datetime(value) if isinstance(value, str) else None
+    if moment is None:
+        raise ValueError(f'{field} must be an ISO 8601 date and time.')
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _flag(value, field):
+    if isinstance(value, bool):
+        return value
+    text = '' if value is None else str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f'{field} must be true or false.')
+
+
+def _integer(value, field, required=True):
+    if value in (None, '') and not required:
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{field} must be an integer.')
+    if number < 1 or isinstance(value, bool):
+        raise ValueError(f'{field} must be a positive integer.')
+    return number
+
+
+def _json(value, field, kind):
+    if isinstance(value, str) and value.strip():
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise ValueError(f'{field} is not valid JSON.')
+    if not isinstance(value, kind):
+        raise ValueError(f'{field} must be a JSON {kind.__name__}.')
+    return value
+
+
+def _micros(moment):
+    return (moment - _EPOCH) // _MICROSECOND
+
+
+# Writing
+
+def copy_value(value):
+    """
+    A value in COPY text format.
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (list, dict)):
+        value = json.dumps(value)
+    return str(value).translate(_COPY_ESCAPES)
+
+
+def copy_rows(connection, table, columns, lines):
+    """
+    Load `lines` (rows of `columns` values in COPY text format, each
+    ending in a newline) into `table` with COPY FROM STDIN. PostgreSQL
+    only.
+    """
+    buffer = io.StringIO()
+    buffer.writelines(lines)
+    quote = connection.ops.quote_name
+    sql = f'COPY {quote(table)} ({", ".join(quote(column) for column in columns)}) FROM STDIN'
+    with connection.cursor() as cursor:
+        if hasattr(cursor, 'copy_expert'):
+            # psycopg2
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+        else:
+            with cursor.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+class Calendar:
+    """
+    One user's busy time during an import. Single events are kept as
+    disjoint intervals in two sorted microsecond arrays, so a check is a
+    bisect and an insert a memmove; series are expanded only around the
+    intervals being checked, as busy_intervals does.
+    """
+    __slots__ = ('starts', 'ends', 'series')
+
+    def __init__(self, intervals=(), series=()):
+        blocks = merge_intervals((_micros(start), _micros(end)) for start, end in intervals)
+        self.starts = array('q', [start for start, _ in blocks])
+        self.ends = array('q', [end for _, end in blocks])
+        self.series = list(series)
+
+    def is_free(self, intervals):
+        for start, end in intervals:
+            lower, upper = _micros(start), _micros(end)
+            # Disjoint blocks: only the last one starting before `upper` can overlap
+            position = bisect_left(self.starts, upper) - 1
+            if position >= 0 and self.ends[position] > lower:
+                return False
+            for event in self.series:
+                if next(iter_occurrences(event, start, end), None) is not None:
+                    return False
+        return True
+
+    def add(self, event):
+        if get_rule(event) is not None:
+            self.series.append(event)
+            return
+        # Only free intervals are added, so the blocks stay disjoint
+        lower = _micros(event.start_time)
+        position = bisect_left(self.starts, lower)
+        self.starts.insert(position, lower)
+        self.ends.insert(position, _micros(event.end_time))
+
+
+class Importer:
+    """
+    Loads one kind of row in chunks. process() runs inside the caller's
+    transaction and returns (imported, [(row number, reason), ...]).
+    """
+    kind = None
+
+    def __init__(self, using='default', use_copy=None):
+        self.using = using
+        self.connection = connections[using]
+        self.use_copy = self.connection.vendor == 'postgresql' if use_copy is None else use_copy
+        # username -> id, None for names that don't exist
+        self.users = {}
+
+    def resolve_users(self, usernames):
+        missing = {name for name in usernames if name and name not in self.users}
+        if missing:
+            found = dict(User.objects.using(self.using).filter(username__in=missing).values_list('username', 'id'))
+            for name in missing:
+                self.users[name] = found.get(name)
+        return self.users
+
+    def existing_events(self, event_ids):
+        return set(Event.objects.using(self.using).filter(pk__in=event_ids).values_list('pk', flat=True))
+
+    def insert(self, model, objects, columns):
+        """
+        Insert unsaved instances with COPY, writing only `columns` (so
+        auto_now_add and primary key values must already be set), or with
+        bulk_create.
+        """
+        if not self.use_copy:
+            return model.objects.using(self.using).bulk_create(objects, batch_size=1000)
+        fields = [model._meta.get_field(column) for column in columns]
+        copy_rows(
+            self.connection, model._meta.db_table, [field.column for field in fields],
+            ('\t'.join([copy_value(getattr(obj, field.attname)) for field in fields]) + '\n' for obj in objects),
+        )
+        return objects
+
+    def process(self, records):
+        raise NotImplementedError
+
+    def finish(self):
+        pass
+
+
+class EventRow:
+    """
+    An event being imported. Has the attributes the recurrence helpers
+    read, at a fraction of the cost of an Event instance.
+    """
+    __slots__ = (
+        'id', 'created_by_id', 'title', 'description', 'location', 'start_time', 'end_time',
+        'is_recurring', 'recurrence_pattern', 'recurrence_exceptions',
+    )
+
+    def __init__(self, id, title, description, location, start_time, end_time,
+                 is_recurring, recurrence_pattern, recurrence_exceptions):
+        self.id = id
+        self.created_by_id = None
+        self.title = title
+        self.description = description
+        self.location = location
+        self.start_time = start_time
+        self.end_time = end_time
+        self.is_recurring = is_recurring
+        self.recurrence_pattern = recurrence_pattern
+        self.recurrence_exceptions = recurrence_exceptions
+
+
+class EventImporter(Importer):
+    """
+    Rows: owner (username), title, description, location, start_time,
+    end_time, is_recurring, recurrence_pattern, recurrence_exceptions and
+    an optional id. Each event gets its owner permission, as through the
+    API.
+
+    With `check_conflicts`, an event overlapping another of its owner's
+    events is rejected. Each owner's stored events are loaded once into a
+    Calendar; the rows of a chunk are then swept per owner in start
+    order against it, accepted rows joining the calendar as they go.
+    """
+    kind = 'events'
+    columns = (
+        'id', 'title', 'description', 'location', 'start_time', 'end_time', 'created_by', 'created_at',
+        'is_recurring', 'recurrence_pattern', 'recurrence_exceptions', 'recurrence_end', 'version',
+    )
+
+    def __init__(self, using='default', use_copy=None, check_conflicts=True):
+        super().__init__(using, use_copy)
+        self.check_conflicts = check_conflicts
+        self.calendars = {}
+
+    def parse(self, record):
+        start = _moment(record.get('start_time'), 'start_time')
+        end = _moment(record.get('end_time'), 'end_time')
+        if start >= end:
+            raise ValueError('End time must be after start time.')
+        is_recurring = _flag(record.get('is_recurring'), 'is_recurring')
+        pattern = _text(record, 'recurrence_pattern', max_length=255) or None
+        exceptions = record.get('recurrence_exceptions') or []
+        if isinstance(exceptions, str):
+            # A JSON list, or comma-separated start times in CSV
+            if exceptions.lstrip().startswith('['):
+                exceptions = _json(exceptions, 'recurrence_exceptions', list)
+            else:
+                exceptions = exceptions.split(',')
+        if not isinstance(exceptions, list):
+            raise ValueError('recurrence_exceptions must be a list.')
+        if is_recurring:
+            if not pattern:
+                raise ValueError('Recurring events need a recurrence pattern.')
+            rule = RecurrenceRule.parse(pattern)
+            if end - start >= rule.min_step:
+                raise ValueError('Event duration must be shorter than its recurrence interval.')
+        return EventRow(
+            _integer(record.get('id'), 'id', required=False),
+            _text(record, 'title', required=True, max_length=255),
+            _text(record, 'description'),
+            _text(record, 'location', max_length=255),
+            start,
+            end,
+            is_recurring,
+            pattern,
+            [_moment(str(value).strip(), 'recurrence_exceptions').isoformat() for value in exceptions],
+        )
+
+    def load_calendars(self, owner_ids):
+        intervals, series = defaultdict(list), defaultdict(list)
+        rows = Event.objects.using(self.using).filter(created_by__in=owner_ids).values_list(
+            'created_by_id', 'id', *_SERIES_FIELDS,
+        )
+        for owner_id, event_id, start, end, *values in rows:
+            event = Event(event_id, start_time=start, end_time=end, **dict(zip(_SERIES_FIELDS[2:], values)))
+            if get_rule(event) is not None:
+                series[owner_id].append(event)
+            else:
+                intervals[owner_id].append((start, end))
+        for owner_id in owner_ids:
+            self.calendars[owner_id] = Calendar(intervals[owner_id], series[owner_id])
+
+    def process(self, records):
+        rejected, accepted = [], []
+        parsed = []
+        for number, record in records:
+            if record is None:
+                rejected.append((number, 'Malformed record.'))
+                continue
+            try:
+                parsed.append((number, record.get('owner'), self.parse(record)))
+            except ValueError as exc:
+                rejected.append((number, str(exc)))
+
+        users = self.resolve_users({owner for _, owner, _ in parsed})
+        explicit = [row.id for _, _, row in parsed if row.id is not None]
+        taken = self.existing_events(explicit) if explicit else set()
+        seen = set()
+        for number, owner, row in parsed:
+            if users.get(owner) is None:
+                rejected.append((number, f'Unknown owner {owner!r}.'))
+            elif row.id in taken:
+                rejected.append((number, f'Event {row.id} already exists.'))
+            elif row.id is not None and row.id in seen:
+                rejected.append((number, f'Duplicate event id {row.id}.'))
+            else:
+                seen.add(row.id)
+                row.created_by_id = users[owner]
+                accepted.append((number, row))
+
+        if self.check_conflicts and accepted:
+            new_owners = {row.created_by_id for _, row in accepted} - self.calendars.keys()
+            if new_owners:
+                self.load_calendars(new_owners)
+            kept = []
+            # Sorted sweep: per owner in start order, each row checked
+            # against the calendar holding everything accepted before it
+            for number, row in sorted(accepted, key=lambda item: (item[1].created_by_id, item[1].start_time, item[0])):
+                calendar = self.calendars[row.created_by_id]
+                if calendar.is_free(candidate_intervals(row)):
+                    calendar.add(row)
+                    kept.append((number, row))
+                else:
+                    rejected.append((number, 'This event conflicts with another scheduled event.'))
+            accepted = kept
+
+        if accepted:
+            self.write([row for _, row in accepted])
+        return len(accepted), rejected
+
+    def write(self, rows):
+        now = timezone.now()
+        explicit = [row.id for row in rows if row.id is not None]
+        if self.use_copy:
+            self.copy(rows, now)
+        else:
+            events = Event.objects.using(self.using).bulk_create([
+                Event(
+                    id=row.id, title=row.title, description=row.description, location=row.location,
+                    start_time=row.start_time, end_time=row.end_time, created_by_id=row.created_by_id,
+                    is_recurring=row.is_recurring, recurrence_pattern=row.recurrence_pattern,
+                    recurrence_exceptions=row.recurrence_exceptions,
+                    # bulk_create bypasses Event.save()
+                    recurrence_end=series_end(row),
+                )
+                for row in rows
+            ], batch_size=1000)
+            for row, event in zip(rows, events):
+                row.id = event.pk
+            EventPermission.objects.using(self.using).bulk_create(
+                [EventPermission(user_id=row.created_by_id, event_id=row.id, role='owner') for row in rows],
+                batch_size=1000,
+            )
+
+        # Roles probed before the events existed are cached as missing
+        pairs = [(row.id, row.created_by_id) for row in rows]
+        transaction.on_commit(lambda: invalidate_role_pairs(pairs), using=self.using)
+        if explicit:
+            # Ids may have belonged to deleted events with cached payloads
+            invalidate_payloads(explicit)
+
+    def copy(self, rows, now):
+        missing = [row for row in rows if row.id is None]
+        if missing:
+            with self.connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT nextval(pg_get_serial_sequence(%s, 'id')) FROM generate_series(1, %s)",
+                    [Event._meta.db_table, len(missing)],
+                )
+                for row, (pk,) in zip(missing, cursor.fetchall()):
+                    row.id = pk
+
+        # Lines are formatted here rather than through copy_value: at
+        # millions of rows the per-value dispatch is most of the run time
+        created_at = now.isoformat()
+        lines = []
+        for row in rows:
+            end = series_end(row) if row.is_recurring else row.end_time
+            lines.append(
+                f'{row.id}\t{row.title.translate(_COPY_ESCAPES)}\t{row.description.translate(_COPY_ESCAPES)}\t'
+                f'{row.location.translate(_COPY_ESCAPES)}\t{row.start_time.isoformat()}\t{row.end_time.isoformat()}\t'
+                f'{row.created_by_id}\t{created_at}\t{"t" if row.is_recurring else "f"}\t'
+                f'{copy_value(row.recurrence_pattern)}\t{copy_value(row.recurrence_exceptions) if row.recurrence_exceptions else "[]"}\t{copy_value(end)}\t1\n'
+            )
+        fields = [Event._meta.get_field(column).column for column in self.columns]
+        copy_rows(self.connection, Event._meta.db_table, fields, lines)
+        copy_rows(
+            self.connection, EventPermission._meta.db_table, ['user_id', 'event_id', 'role'],
+            [f'{row.created_by_id}\t{row.id}\towner\n' for row in rows],
+        )
+
+    def finish(self):
+        # Move the id sequence past any ids given in the file (PostgreSQL)
+        with self.connection.cursor() as cursor:
+            for sql in self.connection.ops.sequence_reset_sql(no_style(), [Event]):
+                cursor.execute(sql)
+
+
+class PermissionImporter(Importer):
+    """
+    Rows: event (id), user (username) and role. A role the user already
+    holds on the event is replaced, except the creator's.
+    """
+    kind = 'permissions'
+
+    def process(self, records):
+        rejected, wanted = [], {}
+        parsed = []
+        for number, record in records:
+            if record is None:
+                rejected.append((number, 'Malformed record.'))
+                continue
+            try:
+                event_id = _integer(record.get('event'), 'event')
+                role = _text(record, 'role')
+                if role not in ROLES:
+                    raise ValueError(f"role must be one of: {', '.join(ROLES)}.")
+            except ValueError as exc:
+                rejected.append((number, str(exc)))
+                continue
+            parsed.append((number, event_id, record.get('user'), role))
+
+        users = self.resolve_users({username for _, _, username, _ in parsed})
+        owners = dict(
+            Event.objects.using(self.using).filter(pk__in={event_id for _, event_id, _, _ in parsed})
+            .values_list('pk', 'created_by_id')
+        )
+        for number, event_id, username, role in parsed:
+            user_id = users.get(username)
+            if user_id is None:
+                rejected.append((number, f'Unknown user {username!r}.'))
+            elif event_id not in owners:
+                rejected.append((number, f'Event {event_id} does not exist.'))
+            elif owners[event_id] == user_id:
+                rejected.append((number, "The creator's owner role cannot be changed."))
+            elif (event_id, user_id) in wanted:
+                rejected.append((number, f'Duplicate of row {wanted[event_id, user_id][0]}.'))
+            else:
+                wanted[event_id, user_id] = (number, role)
+
+        if wanted:
+            current = {
+                (event_id, user_id): (pk, role)
+                for pk, event_id, user_id, role in EventPermission.objects.using(self.using).filter(
+                    event_id__in={event_id for event_id, _ in wanted},
+                    user_id__in={user_id for _, user_id in wanted},
+                ).values_list('pk', 'event_id', 'user_id', 'role')
+            }
+            created = [
+                EventPermission(event_id=event_id, user_id=user_id, role=role)
+                for (event_id, user_id), (_, role) in wanted.items() if (event_id, user_id) not in current
+            ]
+            updated = [
+                EventPermission(pk=current[pair][0], event_id=pair[0], user_id=pair[1], role=role)
+                for pair, (_, role) in wanted.items() if pair in current and current[pair][1] != role
+            ]
+            self.insert(EventPermission, created, ('user', 'event', 'role'))
+            if updated:
+                EventPermission.objects.using(self.using).bulk_update(updated, ['role'], batch_size=1000)
+
+            changed = {event_id for event_id, _ in wanted}
+            Event.objects.using(self.using).filter(pk__in=changed).bump_versions()
+            invalidate_payloads(changed)
+            pairs = list(wanted)
+            transaction.on_commit(lambda: invalidate_role_pairs(pairs), using=self.using)
+        return len(wanted), rejected
+
+
+class HistoryImporter(Importer):
+    """
+    Rows: event (id), version, edited_by (username, optional), edited_at
+    (defaults to now), is_keyframe and changes, in the stored form of
+    events.history: keyframes hold every versioned field, other versions
+    only the fields that changed, and each event's first version is a
+    keyframe. A delta is rejected unless a keyframe of its event, stored or
+    accepted earlier in the import, precedes it.
+    """
+    kind = 'history'
+    columns = ('event', 'edited_by', 'version', 'is_keyframe', 'changes', 'edited_at')
+
+    def parse(self, record):
+        version = _integer(record.get('version'), 'version')
+        is_keyframe = _flag(record.get('is_keyframe'), 'is_keyframe')
+        changes = _json(record.get('changes'), 'changes', dict)
+        if set(changes) - set(HISTORY_FIELDS):
+            raise ValueError(f"changes may only hold: {', '.join(HISTORY_FIELDS)}.")
+        if is_keyframe and set(changes) != set(HISTORY_FIELDS):
+            raise ValueError('Keyframes must hold every versioned field.')
+        if version == 1 and not is_keyframe:
+            raise ValueError('The first version must be a keyframe.')
+        for field in DATETIME_FIELDS:
+            if field in changes:
+                changes[field] = _moment(changes[field], f'changes.{field}').isoformat()
+        edited_at = record.get('edited_at')
+        return EventHistory(
+            event_id=_integer(record.get('event'), 'event'),
+            version=version,
+            is_keyframe=is_keyframe,
+            changes=changes,
+            edited_at=_moment(edited_at, 'edited_at') if edited_at else None,
+        ), record.get('edited_by') or None
+
+    def process(self, records):
+        rejected, parsed = [], []
+        for number, record in records:
+            if record is None:
+                rejected.append((number, 'Malformed record.'))
+                continue
+            try:
+                parsed.append((number, *self.parse(record)))
+            except ValueError as exc:
+                rejected.append((number, str(exc)))
+
+        users = self.resolve_users({username for _, _, username in parsed})
+        events = self.existing_events({row.event_id for _, row, _ in parsed})
+        taken, keyframes = set(), {}
+        stored = EventHistory.objects.using(self.using).filter(event_id__in=events)
+        for event_id, version, is_keyframe in stored.values_list('event_id', 'version', 'is_keyframe'):
+            taken.add((event_id, version))
+            if is_keyframe:
+                keyframes[event_id] = min(version, keyframes.get(event_id, version))
+        accepted = {}
+        for number, row, username in parsed:
+            key = (row.event_id, row.version)
+            if username is not None and users.get(username) is None:
+                rejected.append((number, f'Unknown user {username!r}.'))
+            elif row.event_id not in events:
+                rejected.append((number, f'Event {row.event_id} does not exist.'))
+            elif key in taken or key in accepted:
+                rejected.append((number, f'Version {row.version} of event {row.event_id} already exists.'))
+            elif not row.is_keyframe and keyframes.get(row.event_id, row.version) >= row.version:
+                # Deltas are replayed from the nearest earlier keyframe
+                rejected.append((number, f'Version {row.version} of event {row.event_id} has no earlier keyframe.'))
+            else:
+                row.edited_by_id = users.get(username)
+                accepted[key] = row
+                if row.is_keyframe:
+                    keyframes[row.event_id] = min(row.version, keyframes.get(row.event_id, row.version))
+
+        if accepted:
+            rows = list(accepted.values())
+            now = timezone.now()
+            given = {id(row): row.edited_at for row in rows if row.edited_at is not None}
+            for row in rows:
+                row.edited_at = row.edited_at or now
+            rows = self.insert(EventHistory, rows, self.columns)
+            if given and not self.use_copy:
+                # bulk_create stamps auto_now_add fields with the current time
+                for row in rows:
+                    row.edited_at = given.get(id(row), row.edited_at)
+                EventHistory.objects.using(self.using).bulk_update(rows, ['edited_at'], batch_size=1000)
+            # History ETags are derived from the event version
+            changed = {row.event_id for row in rows}
+            Event.objects.using(self.using).filter(pk__in=changed).bump_versions()
+            invalidate_payloads(changed)
+        return len(accepted), rejected
+
+
+IMPORTERS = {importer.kind: importer for importer in (EventImporter, PermissionImporter, HistoryImporter)}
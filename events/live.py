@@ -0,0 +1,51 @@
+from .outbox import enqueue, enqueue_many
+
+
+def event_group(event_id):
+    return f"event_{event_id}"
+
+
+def changed_fields(before, after):
+    """
+    Fields of `after` whose value differs from `before` (both serialized).
+    """
+    return {field: value for field, value in after.items() if before.get(field) != value}
+
+
+def _update_message(event_id, version_id, changes, edited_by):
+    return {
+        'type': 'event_update',
+        'update': {
+            'event_id': event_id,
+            'version_id': version_id,
+            'changes': changes,
+            'edited_by': edited_by.username if edited_by else None,
+        },
+    }
+
+
+def publish_event_update(event_id, version_id, changes, edited_by):
+    """
+    Queue one message for every socket subscribed to the event: the changed
+    fields in their API representation and the history version recorded
+    for the edit. Call it inside the transaction making the change.
+    """
+    if not changes:
+        return None
+    return enqueue(event_group(event_id), _update_message(event_id, version_id, changes, edited_by))
+
+
+def publish_event_updates(updates, edited_by):
+    """
+    publish_event_update for many (event_id, version_id, changes) at once,
+    queued with one insert.
+    """
+    return enqueue_many(
+        (event_group(event_id), _update_message(event_id, version_id, changes, edited_by))
+        for event_id, version_id, changes in updates if changes
+    )
+
+
+def publish_access_revoked(event_id, user_id):
+    # Lets the user's open sockets leave the event group
+    return enqueue(f"user_{user_id}", {'type': 'event_access_revoked', 'event_id': event_id})
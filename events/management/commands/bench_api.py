@@ -0,0 +1,475 @@
+import json
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import django
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.layers import InMemoryChannelLayer, get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment,
+)
+from rest_framework.test import APIClient
+
+from events.authentication import JWTAuthMiddleware
+from events.history import KEYFRAME_INTERVAL, snapshot_of
+from events.models import Event, EventHistory, EventPermission, NotificationOutbox
+from events.outbox import dispatch_batch
+from events.recurrence import series_end
+from events.routing import websocket_urlpatterns
+from events.serializers import CustomTokenObtainPairSerializer
+from events.utils import notify_users
+
+# Seeded events start on this Monday; events created while benchmarking go
+# years later, clear of the seeded calendars
+SEED_START = datetime(2030, 1, 7, tzinfo=dt_timezone.utc)
+WRITE_START = SEED_START + timedelta(days=3 * 365)
+WORDS = (
+    'planning', 'review', 'standup', 'retro', 'budget', 'hiring', 'roadmap', 'design',
+    'launch', 'training', 'offsite', 'demo', 'sync', 'onboarding', 'security', 'release',
+)
+BATCH_ITEMS = 20
+
+
+def percentile(ordered, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(latencies, queries=None, statuses=None):
+    ordered = sorted(latencies)
+    summary = {
+        'requests': len(ordered),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3) if ordered else None,
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3) if ordered else None,
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3) if ordered else None,
+        'mean_ms': round(statistics.fmean(ordered) * 1000, 3) if ordered else None,
+        'max_ms': round(ordered[-1] * 1000, 3) if ordered else None,
+    }
+    if queries is not None:
+        summary['queries'] = statistics.median(queries) if queries else None
+        summary['queries_max'] = max(queries, default=None)
+    if statuses is not None:
+        summary['status'] = {str(code): count for code, count in sorted(statuses.items())}
+    return summary
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a synthetic dataset into a throwaway test database, drive the main '
+        'API endpoints and the notification websocket, and report p50/p95/p99 '
+        'latency and query counts per endpoint as JSON. '
+        'Run with --settings=event_manager.test_settings.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--events-per-user', type=int, default=50)
+        parser.add_argument('--shares', type=int, default=3, help='Other users each event is shared with.')
+        parser.add_argument('--history', type=int, default=5, help='History versions per event.')
+        parser.add_argument('--recurring', type=float, default=0.1, help='Fraction of events that are weekly series.')
+        parser.add_argument('--requests', type=int, default=200, help='Measured requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per endpoint; their queries are counted.')
+        parser.add_argument('--endpoints', help='Comma-separated endpoint names to run (default: all).')
+        parser.add_argument('--ws-connections', type=int, default=100)
+        parser.add_argument('--ws-messages', type=int, default=20, help='Notification rounds sent to every socket.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Write the report to this JSON file.')
+        parser.add_argument('--compare', help='A previous report to compare against.')
+
+    def handle(self, *args, **options):
+        if not isinstance(get_channel_layer(), InMemoryChannelLayer) or not isinstance(caches['default'], LocMemCache):
+            raise CommandError(
+                'bench_api needs the in-memory channel layer and locmem cache '
+                '(--settings=event_manager.test_settings).'
+            )
+        selected = self.endpoints()
+        if options['endpoints']:
+            wanted = options['endpoints'].split(',')
+            unknown = set(wanted) - set(selected) - {'ws'}
+            if unknown:
+                raise CommandError(f"Unknown endpoints: {', '.join(sorted(unknown))}. Choose from: {', '.join(selected)}, ws.")
+            selected = {name: endpoint for name, endpoint in selected.items() if name in wanted}
+            run_ws = 'ws' in wanted
+        else:
+            run_ws = True
+
+        setup_test_environment()
+        # Migrated from scratch, in memory on SQLite; nothing touches the
+        # configured database
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # The login/batch/changelog rate limits would turn the run into 429s
+            with override_settings(RATELIMIT_ENABLE=False):
+                report = self.run(selected, run_ws, **options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(text + '\n')
+        else:
+            self.stdout.write(text)
+        self.print_table(report)
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                self.print_comparison(json.load(baseline), report)
+
+    def run(self, selected, run_ws, seed, **options):
+        self.rng = random.Random(seed)
+        cache.clear()
+        started = time.perf_counter()
+        dataset = self.seed_data(**options)
+        seeded_in = time.perf_counter() - started
+
+        results = {}
+        for name, endpoint in selected.items():
+            results[name] = self.measure(endpoint, options['requests'], options['warmup'])
+        if run_ws and options['ws_connections']:
+            results.update(async_to_sync(self.bench_websockets)(options['ws_connections'], options['ws_messages']))
+
+        return {
+            'meta': self.meta(seed),
+            'dataset': {**dataset, 'seed_seconds': round(seeded_in, 2)},
+            'config': {'requests': options['requests'], 'warmup': options['warmup']},
+            'endpoints': results,
+        }
+
+    def meta(self, seed):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'database': connection.vendor,
+            'machine': platform.machine(),
+            'seed': seed,
+        }
+
+    # Dataset
+
+    def seed_data(self, users, events_per_user, shares, history, recurring, **options):
+        rng = self.rng
+        self.users = User.objects.bulk_create([User(username=f'bench{n}', password='!') for n in range(users)])
+        user_ids = [user.pk for user in self.users]
+
+        events = []
+        for user in self.users:
+            for n in range(events_per_user):
+                # Four two-hour slots a day, so the calendars are busy but sane
+                start = SEED_START + timedelta(days=n // 4, hours=(n % 4) * 2)
+                event = Event(
+                    title=f'{rng.choice(WORDS)} {rng.choice(WORDS)} meeting',
+                    description=f'Agenda: {" ".join(rng.choices(WORDS, k=12))}',
+                    location=f'Room {rng.randint(1, 40)}',
+                    start_time=start,
+                    end_time=start + timedelta(hours=1),
+                    created_by=user,
+                    version=history + 1,
+                )
+                if rng.random() < recurring:
+                    event.is_recurring = True
+                    event.recurrence_pattern = 'FREQ=WEEKLY;COUNT=12'
+                event.recurrence_end = series_end(event)
+                events.append(event)
+        events = Event.objects.bulk_create(events, batch_size=1000)
+
+        permissions = [EventPermission(user=event.created_by, event=event, role='owner') for event in events]
+        self.shared = {user_id: [] for user_id in user_ids}
+        for event in events:
+            others = [user_id for user_id in rng.sample(user_ids, min(shares + 1, len(user_ids))) if user_id != event.created_by_id]
+            for user_id in others[:shares]:
+                permissions.append(EventPermission(user_id=user_id, event=event, role=rng.choice(('viewer', 'editor'))))
+                self.shared[user_id].append(event.pk)
+        EventPermission.objects.bulk_create(permissions, batch_size=1000)
+
+        # Keyframes and title-only deltas, laid out as events.history does
+        rows = []
+        for event in events:
+            snapshot = snapshot_of(event)
+            for version in range(1, history + 1):
+                title = f'{event.title} (draft {version})'
+                if (version - 1) % KEYFRAME_INTERVAL == 0:
+                    changes, is_keyframe = {**snapshot, 'title': title}, True
+                else:
+                    changes, is_keyframe = {'title': title}, False
+                rows.append(EventHistory(
+                    event=event, edited_by=event.created_by, version=version, is_keyframe=is_keyframe, changes=changes,
+                ))
+        rows = EventHistory.objects.bulk_create(rows, batch_size=1000)
+        self.versions = {}
+        for row in rows:
+            self.versions.setdefault(row.event_id, []).append(row.pk)
+
+        self.owned = {user_id: [] for user_id in user_ids}
+        for event in events:
+            self.owned[event.created_by_id].append(event.pk)
+        self.clients = {}
+        self.writes = 0
+        return {
+            'users': users,
+            'events': len(events),
+            'permissions': len(permissions),
+            'history_rows': len(rows),
+            'recurring': sum(1 for event in events if event.is_recurring),
+        }
+
+    # Endpoints
+
+    def client(self, user_id=None):
+        if user_id is None:
+            user_id = self.rng.choice(self.users).pk
+        if user_id not in self.clients:
+            user = next(user for user in self.users if user.pk == user_id)
+            # The login serializer's token, with the claims the API reads
+            token = CustomTokenObtainPairSerializer.get_token(user).access_token
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.clients[user_id] = client
+        return user_id, self.clients[user_id]
+
+    def own_event(self):
+        user_id, client = self.client()
+        return client, self.rng.choice(self.owned[user_id])
+
+    def write_slot(self):
+        # A fresh hour far from the seeded calendars for every created event
+        self.writes += 1
+        start = WRITE_START + timedelta(hours=self.writes * 2)
+        return start, start + timedelta(hours=1)
+
+    def new_event(self):
+        start, end = self.write_slot()
+        return {
+            'title': f'{self.rng.choice(WORDS)} session', 'description': 'Created by bench_api',
+            'location': 'Room 1', 'start_time': start.isoformat(), 'end_time': end.isoformat(),
+        }
+
+    def window(self, days):
+        start = SEED_START + timedelta(days=self.rng.randint(0, 6))
+        return start.isoformat(), (start + timedelta(days=days)).isoformat()
+
+    def endpoints(self):
+        """
+        {name: callable returning a response}, in run order: reads first,
+        then writes.
+        """
+        def events_list():
+            return self.client()[1].get('/api/events/')
+
+        etags = {}
+
+        def events_list_cached():
+            # Revalidation of an unchanged page; one user, so only the
+            # first (warm-up) request has to fetch the ETag
+            client = self.client(self.users[0].pk)[1]
+            if 'list' not in etags:
+                etags['list'] = client.get('/api/events/')['ETag']
+            return client.get('/api/events/', HTTP_IF_NONE_MATCH=etags['list'])
+
+        def events_retrieve():
+            client, event_id = self.own_event()
+            return client.get(f'/api/events/{event_id}/')
+
+        def events_calendar():
+            start, end = self.window(7)
+            return self.client()[1].get('/api/events/calendar/', {'from': start, 'to': end})
+
+        def events_search():
+            return self.client()[1].get('/api/events/search/', {'q': self.rng.choice(WORDS)})
+
+        def events_changelog():
+            client, event_id = self.own_event()
+            return client.get(f'/api/events/{event_id}/changelog/')
+
+        def events_history():
+            client, event_id = self.own_event()
+            return client.get(f'/api/events/{event_id}/history/{self.rng.choice(self.versions[event_id])}/')
+
+        def events_diff():
+            client, event_id = self.own_event()
+            return client.get(f'/api/events/{event_id}/diff/{self.versions[event_id][0]}/current/')
+
+        def events_permissions():
+            client, event_id = self.own_event()
+            return client.get(f'/api/events/{event_id}/permissions/')
+
+        def events_export():
+            response = self.client()[1].get('/api/events/export.ics')
+            # Streaming: the body is produced while it is read
+            b''.join(response.streaming_content)
+            return response
+
+        def availability():
+            start, end = self.window(7)
+            users = [user.pk for user in self.rng.sample(self.users, min(10, len(self.users)))]
+            return self.client()[1].post(
+                '/api/availability/', {'users': users, 'from': start, 'to': end, 'duration': 30}, format='json',
+            )
+
+        def events_create():
+            return self.client()[1].post('/api/events/', self.new_event(), format='json')
+
+        def events_update():
+            client, event_id = self.own_event()
+            return client.patch(f'/api/events/{event_id}/', {'title': f'{self.rng.choice(WORDS)} update'}, format='json')
+
+        def events_batch():
+            return self.client()[1].post('/api/events/batch/', [self.new_event() for _ in range(BATCH_ITEMS)], format='json')
+
+        def events_bulk_update():
+            user_id, client = self.client()
+            ids = self.rng.sample(self.owned[user_id], min(BATCH_ITEMS, len(self.owned[user_id])))
+            return client.patch(
+                '/api/events/bulk/', [{'id': event_id, 'title': f'{self.rng.choice(WORDS)} bulk'} for event_id in ids],
+                format='json',
+            )
+
+        def events_share_bulk():
+            user_id, client = self.client()
+            event_id = self.rng.choice(self.owned[user_id])
+            users = [user.pk for user in self.rng.sample(self.users, min(BATCH_ITEMS + 1, len(self.users))) if user.pk != user_id]
+            return client.post(
+                f'/api/events/{event_id}/share/bulk/',
+                [{'user': other, 'role': self.rng.choice(('viewer', 'editor'))} for other in users[:BATCH_ITEMS]],
+                format='json',
+            )
+
+        return {
+            'events.list': events_list,
+            'events.list.not_modified': events_list_cached,
+            'events.retrieve': events_retrieve,
+            'events.calendar': events_calendar,
+            'events.search': events_search,
+            'events.changelog': events_changelog,
+            'events.history': events_history,
+            'events.diff': events_diff,
+            'events.permissions': events_permissions,
+            'events.export_ics': events_export,
+            'availability': availability,
+            'events.create': events_create,
+            'events.update': events_update,
+            'events.batch': events_batch,
+            'events.bulk_update': events_bulk_update,
+            'events.share_bulk': events_share_bulk,
+        }
+
+    def measure(self, endpoint, requests, warmup):
+        statuses, queries, latencies = {}, [], []
+        # Warm-up requests fill the caches and give the query counts; timing
+        # them separately keeps query capture out of the latencies
+        for _ in range(warmup):
+            with CaptureQueriesContext(connection) as captured:
+                response = endpoint()
+            queries.append(len(captured))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = endpoint()
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        return summarize(latencies, queries, statuses)
+
+    # Websockets
+
+    async def bench_websockets(self, connections, messages):
+        """
+        Open `connections` notification sockets, time a subscribe round trip
+        on each, then send `messages` rounds of one notification per user
+        through the outbox and time each from dispatch to arrival.
+        """
+        application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+        users = self.users[:connections]
+        sockets = []
+        for user in users:
+            token = (await database_sync_to_async(CustomTokenObtainPairSerializer.get_token)(user)).access_token
+            communicator = WebsocketCommunicator(application, f'/ws/notifications/{user.pk}/?token={token}')
+            connected, _ = await communicator.connect()
+            if not connected:
+                raise CommandError(f'Websocket for user {user.pk} was refused.')
+            sockets.append((user.pk, communicator))
+
+        subscribe = []
+        for user_id, communicator in sockets:
+            started = time.perf_counter()
+            await communicator.send_json_to({'action': 'subscribe', 'event_id': self.owned[user_id][0]})
+            await communicator.receive_json_from(timeout=5)
+            subscribe.append(time.perf_counter() - started)
+
+        # Notifications queued by the HTTP writes would be sent first
+        await database_sync_to_async(NotificationOutbox.objects.all().delete)()
+        delivery, dispatch, lost = [], [], 0
+        for n in range(messages):
+            await database_sync_to_async(notify_users)([(user_id, f'bench notification {n}') for user_id, _ in sockets])
+            started = time.perf_counter()
+            await database_sync_to_async(dispatch_batch)(len(sockets))
+            dispatch.append(time.perf_counter() - started)
+            for _, communicator in sockets:
+                try:
+                    await communicator.receive_from(timeout=5)
+                except TimeoutError:
+                    lost += 1
+                    continue
+                delivery.append(time.perf_counter() - started)
+
+        for _, communicator in sockets:
+            await communicator.disconnect()
+        return {
+            'ws.subscribe': summarize(subscribe),
+            'ws.dispatch': summarize(dispatch),
+            'ws.notification': {**summarize(delivery), 'connections': len(sockets), 'lost': lost},
+        }
+
+    # Output
+
+    def print_table(self, report):
+        self.stderr.write(f"\n{'endpoint':<28}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}  status")
+        for name, stats in report['endpoints'].items():
+            queries = stats.get('queries')
+            self.stderr.write(
+                f"{name:<28}{stats['requests']:>6}{stats['p50_ms'] or 0:>10.2f}{stats['p95_ms'] or 0:>10.2f}"
+                f"{stats['p99_ms'] or 0:>10.2f}{'' if queries is None else queries:>9}  {stats.get('status', '')}"
+            )
+
+    def print_comparison(self, baseline, report):
+        self.stderr.write(f"\nagainst {baseline['meta'].get('commit')}:")
+        self.stderr.write(f"{'endpoint':<28}{'p50':>10}{'p95':>10}{'queries':>10}")
+        for name, stats in report['endpoints'].items():
+            before = baseline['endpoints'].get(name)
+            if not before:
+                continue
+
+            def change(key):
+                if not before.get(key) or stats.get(key) is None:
+                    return '-'
+                return f'{(stats[key] / before[key] - 1) * 100:+.0f}%'
+
+            queries = '-'
+            if stats.get('queries') is not None and before.get('queries') is not None:
+                queries = f"{stats['queries'] - before['queries']:+g}"
+            self.stderr.write(f"{name:<28}{change('p50_ms'):>10}{change('p95_ms'):>10}{queries:>10}")
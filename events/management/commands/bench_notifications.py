@@ -0,0 +1,175 @@
+import asyncio
+import json
+import resource
+import time
+import tracemalloc
+
+from channels.layers import DEFAULT_CHANNEL_LAYER, InMemoryChannelLayer, channel_layers, get_channel_layer
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from events.consumers import OVERFLOW_POLICIES, NotificationConsumer, connection_stats
+
+
+class BenchChannelLayer(InMemoryChannelLayer):
+    # The stock layer scans every channel and group for expired entries on
+    # each send, which makes a run quadratic in the number of connections
+    # and measures the test layer rather than the consumers
+    clean_interval = 1.0
+    _cleaned_at = 0.0
+
+    def _clean_expired(self):
+        now = time.monotonic()
+        if now - self._cleaned_at >= self.clean_interval:
+            self._cleaned_at = now
+            super()._clean_expired()
+
+
+class Command(BaseCommand):
+    help = (
+        'Drive simulated notification sockets with slow clients through the '
+        'in-memory channel layer and report queue depth and memory use.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000)
+        parser.add_argument('--messages', type=int, default=200, help='Notifications published per connection.')
+        parser.add_argument('--client-delay', type=float, default=3.0, help='Seconds each simulated client takes per frame.')
+        parser.add_argument('--queue-size', type=int, default=10, help='Per-connection queue bound; 0 for unbounded.')
+        parser.add_argument('--policy', choices=OVERFLOW_POLICIES, default='coalesce')
+        parser.add_argument('--window', type=float, default=0.05, help='Batch window in seconds.')
+        parser.add_argument('--connect-timeout', type=float, default=30.0)
+        parser.add_argument('--drain-timeout', type=float, default=30.0)
+        parser.add_argument(
+            '--tracemalloc', action='store_true',
+            help='Measure Python heap growth with tracemalloc (exact, but several times slower) instead of peak RSS.',
+        )
+        parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+
+    def handle(self, *args, **options):
+        if not isinstance(get_channel_layer(), InMemoryChannelLayer):
+            raise CommandError(
+                'bench_notifications needs channels.layers.InMemoryChannelLayer '
+                '(e.g. --settings=event_manager.test_settings).'
+            )
+        # Capacity above the queue bound, so overflow is handled by the
+        # consumers' policy rather than by the layer dropping messages
+        previous = channel_layers.set(DEFAULT_CHANNEL_LAYER, BenchChannelLayer(capacity=1000))
+        try:
+            report = asyncio.run(self.run(**options))
+        finally:
+            channel_layers.set(DEFAULT_CHANNEL_LAYER, previous)
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        for key, value in report.items():
+            self.stdout.write(f'{key:>24}: {value}')
+
+    async def run(
+        self, connections, messages, client_delay, queue_size, policy, window, connect_timeout, drain_timeout, **options
+    ):
+        trace = options['tracemalloc']
+        layer = get_channel_layer()
+        app = NotificationConsumer.as_asgi(
+            queue_size=queue_size or float('inf'), overflow_policy=policy, batch_window=window,
+        )
+        totals = {'frames': 0, 'bytes': 0, 'closed': 0}
+        User = get_user_model()
+
+        def server(user_id):
+            # Stands in for the ASGI server: a socket whose client needs
+            # `client_delay` seconds to take each frame
+            inbox = asyncio.Queue()
+            inbox.put_nowait({'type': 'websocket.connect'})
+
+            async def send(message):
+                if message['type'] == 'websocket.send':
+                    totals['frames'] += 1
+                    totals['bytes'] += len(message['text'])
+                    await asyncio.sleep(client_delay)
+                elif message['type'] == 'websocket.close':
+                    totals['closed'] += 1
+                    inbox.put_nowait({'type': 'websocket.disconnect', 'code': message.get('code', 1000)})
+
+            scope = {
+                'type': 'websocket',
+                'path': f'/ws/notifications/{user_id}/',
+                'url_route': {'args': (), 'kwargs': {'user_id': str(user_id)}},
+                # As JWTAuthMiddleware would set it; the socket only opens
+                # for the user it names
+                'user': User(pk=user_id),
+            }
+            return asyncio.create_task(app(scope, inbox.get, send)), inbox
+
+        if trace:
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+        else:
+            # ru_maxrss is in KiB on Linux
+            baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+        sockets = [server(user_id) for user_id in range(1, connections + 1)]
+        deadline = time.perf_counter() + connect_timeout
+        while len(connection_stats()) < connections:
+            if time.perf_counter() >= deadline:
+                for task, _ in sockets:
+                    task.cancel()
+                raise CommandError(
+                    f'Only {len(connection_stats())} of {connections} sockets connected within {connect_timeout}s.'
+                )
+            await asyncio.sleep(0.01)
+
+        started = time.perf_counter()
+        for n in range(messages):
+            # One notification to every user per round, sent concurrently
+            await asyncio.gather(*(
+                layer.group_send(f'user_{user_id}', {
+                    'type': 'send_notification', 'message': {'message': f'notification {n}'},
+                })
+                for user_id in range(1, connections + 1)
+            ))
+        published_in = time.perf_counter() - started
+        peak_depth = max((stats['high_water'] for stats in connection_stats()), default=0)
+
+        deadline = time.perf_counter() + drain_timeout
+        while any(stats['depth'] for stats in connection_stats()) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(window * 2)
+        drained_in = time.perf_counter() - started
+
+        stats = connection_stats()
+        if trace:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+        for task, inbox in sockets:
+            inbox.put_nowait({'type': 'websocket.disconnect', 'code': 1000})
+        await asyncio.gather(*(task for task, _ in sockets), return_exceptions=True)
+
+        published = connections * messages
+        received = sum(s['received'] for s in stats)
+        return {
+            'connections': connections,
+            # Counters below cover these; sockets closed by the policy are gone
+            'open_at_end': len(stats),
+            'policy': policy,
+            'queue_size': queue_size or 'unbounded',
+            'published': published,
+            'publish_rate_per_s': round(published / published_in),
+            'received_by_consumers': received,
+            # Lost in the layer (full channel) or sent after a policy disconnect
+            'not_received': published - received,
+            'frames_sent': totals['frames'],
+            'messages_per_frame': round(sum(s['messages_sent'] for s in stats) / max(totals['frames'], 1), 2),
+            'dropped_oldest': sum(s['dropped'] for s in stats),
+            'coalesced': sum(s['coalesced'] for s in stats),
+            'closed_by_policy': totals['closed'],
+            'peak_queue_depth': peak_depth,
+            'still_queued': sum(s['depth'] for s in stats),
+            'drain_seconds': round(drained_in, 2),
+            'memory_measure': 'tracemalloc' if trace else 'peak rss',
+            'peak_memory_kib': (peak - baseline) // 1024,
+            'memory_per_connection_kib': round((peak - baseline) / 1024 / connections, 1),
+        }
@@ -0,0 +1,152 @@
+import json
+import random
+import statistics
+import time
+import uuid
+from types import SimpleNamespace
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+
+from events.management.commands.bench_api import percentile
+from events.throttling import RATELIMIT_USE_CACHE, RATELIMIT_WORKERS, LocalRateThrottle, SlidingWindowLimiter, parse_rate
+
+# Cache methods either limiter calls
+CACHE_METHODS = ('get', 'get_many', 'add', 'set', 'incr', 'decr')
+
+
+class CacheMeter:
+    """
+    Counts calls to a cache backend and optionally delays each by a fixed
+    round trip, to stand in for a networked cache when the configured one
+    is in process.
+    """
+
+    def __init__(self, cache, latency):
+        self.calls = 0
+        self.cache = cache
+        self.originals = {name: getattr(cache, name) for name in CACHE_METHODS}
+        for name, method in self.originals.items():
+            setattr(cache, name, self.wrap(method, latency))
+
+    def wrap(self, method, latency):
+        def metered(*args, **kwargs):
+            self.calls += 1
+            if latency:
+                time.sleep(latency)
+            return method(*args, **kwargs)
+        return metered
+
+    def restore(self):
+        for name in CACHE_METHODS:
+            delattr(self.cache, name)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the per-request cost of the django_ratelimit decorator with '
+        'the local-first LocalRateThrottle, and measure how far workers '
+        'sharing the cache overshoot the limit.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', default='1000/m', help='Limit per key (default 1000/m).')
+        parser.add_argument('--keys', type=int, default=100, help='Distinct client IPs (default 100).')
+        parser.add_argument('--requests', type=int, default=20000, help='Requests per limiter (default 20000).')
+        parser.add_argument('--cache-latency', type=float, default=0.0,
+                            help='Milliseconds added to every cache call, e.g. 0.3 for a Redis round trip.')
+        parser.add_argument('--workers', type=int, default=RATELIMIT_WORKERS,
+                            help='Processes simulated for the overshoot run (default RATELIMIT_WORKERS).')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--output', help='Also write the report to this JSON file.')
+
+    def handle(self, *args, rate, keys, requests, cache_latency, workers, seed, **options):
+        try:
+            limit, period = parse_rate(rate)
+        except ValueError as exc:
+            raise CommandError(str(exc))
+        if keys < 1 or requests < 1 or workers < 1:
+            raise CommandError('--keys, --requests and --workers must be positive.')
+        try:
+            # Only this comparison needs it; the app no longer does
+            from django_ratelimit.core import is_ratelimited
+        except ImportError:
+            raise CommandError('bench_ratelimit compares against django-ratelimit: pip install django-ratelimit==4.1.0')
+
+        rng = random.Random(seed)
+        factory = RequestFactory()
+        clients = [factory.get('/api/auth/login/', REMOTE_ADDR=f'10.0.{n // 256}.{n % 256}') for n in range(keys)]
+        stream = [rng.choice(clients) for _ in range(requests)]
+        cache = caches[RATELIMIT_USE_CACHE]
+
+        # Fresh groups and scopes each run, so counts left in a shared
+        # cache by earlier runs don't matter
+        run = uuid.uuid4().hex[:8]
+        view = SimpleNamespace(throttle_scope=f'bench-{run}', throttle_rate=rate, throttle_key='ip')
+
+        def decorator(request):
+            return not is_ratelimited(request, group=f'bench-{run}', key='ip', rate=rate, increment=True)
+
+        def throttle(request):
+            return LocalRateThrottle().allow_request(request, view)
+
+        report = {
+            'config': {
+                'rate': rate, 'keys': keys, 'requests': requests, 'cache': type(cache).__name__,
+                'cache_latency_ms': cache_latency, 'workers': workers, 'seed': seed,
+            },
+            'limiters': {},
+        }
+        for name, limiter in (('django_ratelimit', decorator), ('local', throttle)):
+            meter = CacheMeter(cache, cache_latency / 1000)
+            latencies, admitted = [], 0
+            try:
+                for request in stream:
+                    started = time.perf_counter()
+                    allowed = limiter(request)
+                    latencies.append(time.perf_counter() - started)
+                    admitted += allowed
+            finally:
+                meter.restore()
+            latencies.sort()
+            report['limiters'][name] = {
+                'mean_us': round(statistics.fmean(latencies) * 1e6, 2),
+                'p50_us': round(percentile(latencies, 0.50) * 1e6, 2),
+                'p99_us': round(percentile(latencies, 0.99) * 1e6, 2),
+                'cache_calls_per_request': round(meter.calls / requests, 3),
+                'admitted': admitted,
+                'rejected': requests - admitted,
+            }
+
+        report['overshoot'] = self.overshoot(limit, period, workers, rng, run)
+
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                json.dump(report, handle, indent=2)
+        self.stdout.write(f"{'limiter':<18}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'cache/req':>11}{'admitted':>10}")
+        for name, stats in report['limiters'].items():
+            self.stdout.write(
+                f"{name:<18}{stats['mean_us']:>10}{stats['p50_us']:>10}{stats['p99_us']:>10}"
+                f"{stats['cache_calls_per_request']:>11}{stats['admitted']:>10}"
+            )
+        over = report['overshoot']
+        self.stdout.write(
+            f"\n{workers} workers, one key, {over['offered']} requests in one window: "
+            f"{over['admitted']} admitted for a limit of {limit} (bound {over['bound']})."
+        )
+
+    def overshoot(self, limit, period, workers, rng, run):
+        # Workers as separate limiters on the shared cache, taking turns at
+        # random within a single window
+        limiters = [SlidingWindowLimiter(f'overshoot-{run}', limit, period, workers=workers) for _ in range(workers)]
+        start = (time.time() // period + 1) * period
+        offered = 3 * limit
+        step = period / 2 / offered
+        admitted = sum(rng.choice(limiters).hit('bench', now=start + n * step)[0] for n in range(offered))
+        return {
+            'offered': offered,
+            'admitted': admitted,
+            'limit': limit,
+            'bound': limit + (workers - 1) * (limiters[0].batch - 1),
+        }
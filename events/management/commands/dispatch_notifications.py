@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from events.outbox import dispatch_batch
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued notifications from the outbox to the channel layer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows claimed per round (default 500).')
+        parser.add_argument('--interval', type=float, default=0.5, help='Seconds to wait when the outbox is drained (default 0.5).')
+        parser.add_argument('--once', action='store_true', help='Drain what is due now and exit.')
+
+    def handle(self, *args, batch_size, interval, once, **options):
+        totals = [0, 0]
+        try:
+            while True:
+                claimed, delivered, retried = dispatch_batch(batch_size)
+                totals[0] += delivered
+                totals[1] += retried
+                if claimed and options['verbosity'] > 1:
+                    self.stdout.write(f'{delivered} delivered, {retried} to retry')
+                if claimed < batch_size:
+                    if once:
+                        break
+                    time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(f'Delivered {totals[0]} notifications, {totals[1]} failed attempts.')
@@ -0,0 +1,136 @@
+import json
+import os
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils import timezone
+
+from events.importing import FORMATS, IMPORT_CHUNK_SIZE, IMPORTERS, read_records
+from events.models import ImportCheckpoint
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk-load events, permissions or history rows from a CSV or NDJSON '
+        'file, in chunks that each commit with a checkpoint so an interrupted '
+        'run can be resumed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--kind', choices=list(IMPORTERS), default='events')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension (.csv, else NDJSON).')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE, help='Rows per transaction.')
+        parser.add_argument('--resume', action='store_true', help='Continue an interrupted import of this file.')
+        parser.add_argument('--restart', action='store_true', help='Discard the checkpoint and start from the top.')
+        parser.add_argument('--no-conflict-check', action='store_true', help='Skip overlap checks for events.')
+        parser.add_argument('--no-copy', action='store_true', help='Use bulk_create even on PostgreSQL.')
+        parser.add_argument('--rejects', help='Append rejected rows to this file as NDJSON.')
+        parser.add_argument('--progress', type=float, default=5.0, help='Seconds between progress lines (default 5).')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, path, kind, chunk_size, resume, restart, database, **options):
+        if not os.path.isfile(path):
+            raise CommandError(f'No such file: {path}')
+        if resume and restart:
+            raise CommandError('--resume and --restart are exclusive.')
+        if chunk_size < 1:
+            raise CommandError('--chunk-size must be at least 1.')
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'ndjson')
+
+        postgresql = connections[database].vendor == 'postgresql'
+        kwargs = {'using': database}
+        if options['no_copy']:
+            kwargs['use_copy'] = False
+        elif not postgresql and options['verbosity'] > 1:
+            self.stdout.write('COPY needs PostgreSQL; using bulk_create.')
+        if kind == 'events':
+            kwargs['check_conflicts'] = not options['no_conflict_check']
+        importer = IMPORTERS[kind](**kwargs)
+
+        checkpoint = self.checkpoint(f'{kind}:{os.path.abspath(path)}'[:255], kind, resume, restart, database)
+        if checkpoint.offset > os.path.getsize(path):
+            raise CommandError('The file is shorter than the checkpoint; it has changed since. Use --restart.')
+        if checkpoint.rows:
+            self.stdout.write(f'Resuming after row {checkpoint.rows}.')
+
+        rejects = open(options['rejects'], 'a', encoding='utf-8') if options['rejects'] else None
+        records = read_records(path, fmt, checkpoint.offset)
+        started = reported = time.perf_counter()
+        done = 0
+        try:
+            while chunk := list(islice(records, chunk_size)):
+                first = checkpoint.rows
+                numbered = [(first + n, record) for n, (_, record) in enumerate(chunk)]
+                with transaction.atomic(using=database):
+                    if postgresql:
+                        with connections[database].cursor() as cursor:
+                            # A crash may lose the last commits, but each
+                            # chunk commits with its checkpoint, so --resume
+                            # redoes exactly what was lost
+                            cursor.execute('SET LOCAL synchronous_commit TO OFF')
+                    imported, rejected = importer.process(numbered)
+                    checkpoint.offset = chunk[-1][0]
+                    checkpoint.rows += len(chunk)
+                    checkpoint.imported += imported
+                    checkpoint.rejected += len(rejected)
+                    checkpoint.save(using=database)
+                done += len(chunk)
+                # Written after the commit: a crash in between can lose these
+                # lines, never the rows themselves
+                if rejects is not None:
+                    for number, reason in sorted(rejected):
+                        rejects.write(json.dumps({'row': number, 'reason': reason, 'record': chunk[number - first][1]}) + '\n')
+                    rejects.flush()
+                elif rejected and options['verbosity'] > 1:
+                    for number, reason in sorted(rejected):
+                        self.stderr.write(f'row {number}: {reason}')
+
+                now = time.perf_counter()
+                if now - reported >= options['progress']:
+                    reported = now
+                    self.report(checkpoint, done / (now - started))
+            importer.finish()
+        except KeyboardInterrupt:
+            self.stdout.write(f'Interrupted after row {checkpoint.rows}; rerun with --resume to continue.')
+            return
+        finally:
+            if rejects is not None:
+                rejects.close()
+
+        checkpoint.finished_at = timezone.now()
+        checkpoint.save(using=database)
+        elapsed = time.perf_counter() - started
+        self.report(checkpoint, done / elapsed if elapsed else 0)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {checkpoint.imported} of {checkpoint.rows} rows '
+            f'({checkpoint.rejected} rejected) in {elapsed:.1f}s.'
+        ))
+
+    def checkpoint(self, source, kind, resume, restart, database):
+        checkpoint, created = ImportCheckpoint.objects.using(database).get_or_create(
+            source=source, defaults={'kind': kind},
+        )
+        if created:
+            return checkpoint
+        if checkpoint.finished_at is None and not (resume or restart):
+            raise CommandError(
+                f'An import of this file stopped after row {checkpoint.rows}. '
+                'Pass --resume to continue it or --restart to start over.'
+            )
+        if checkpoint.finished_at is not None and not restart:
+            raise CommandError('This file has already been imported. Pass --restart to import it again.')
+        if restart:
+            checkpoint.offset = checkpoint.rows = checkpoint.imported = checkpoint.rejected = 0
+            checkpoint.started_at = timezone.now()
+            checkpoint.finished_at = None
+            checkpoint.save(using=database)
+        return checkpoint
+
+    def report(self, checkpoint, rate):
+        self.stdout.write(
+            f'{checkpoint.rows} rows: {checkpoint.imported} imported, '
+            f'{checkpoint.rejected} rejected ({rate:,.0f} rows/s)'
+        )
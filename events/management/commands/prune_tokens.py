@@ -0,0 +1,44 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from events.revocation import revoked_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete expired outstanding and blacklisted refresh tokens in batches, '
+        'then have every process rebuild its revoked token filter.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Tokens deleted per transaction (default 5000).')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to wait between batches.')
+
+    def handle(self, *args, batch_size, pause, **options):
+        if batch_size < 1:
+            raise CommandError('--batch-size must be positive.')
+        # Fixed up front so the run ends even while tokens keep expiring
+        now = timezone.now()
+        expired = OutstandingToken.objects.filter(expires_at__lte=now).order_by('id')
+        outstanding = blacklisted = 0
+        last_id = 0
+        try:
+            while ids := list(expired.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size]):
+                last_id = ids[-1]
+                with transaction.atomic():
+                    blacklisted += BlacklistedToken.objects.filter(token_id__in=ids).delete()[0]
+                    outstanding += OutstandingToken.objects.filter(id__in=ids).delete()[0]
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'{outstanding} tokens deleted')
+                if pause:
+                    time.sleep(pause)
+        except KeyboardInterrupt:
+            self.stdout.write('Interrupted; what was deleted so far stays deleted.')
+        finally:
+            if outstanding:
+                revoked_tokens.reset()
+        self.stdout.write(f'Deleted {outstanding} expired tokens, {blacklisted} of them blacklisted.')
@@ -0,0 +1,478 @@
+"""
+Per-process request instrumentation, exposed in the Prometheus text format
+at /metrics.
+
+MetricsMiddleware gives each request a RequestRecord (held in a context
+variable, so it follows the request into sync_to_async threads and
+streamed responses). A database execute wrapper, the response
+serializers (TimedSerializerMixin, count_serialized) and the caches
+(count_cache) add to it, and when the response is done it is folded into
+the stats of its URL name.
+
+Stats live in one shard per thread and only that thread writes to it, so
+recording takes no lock; a scrape sums the shards. Shards of finished
+threads are folded into one.
+"""
+import contextvars
+import logging
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = getattr(settings, 'METRICS_ENABLED', True)
+# Bearer token required to scrape /metrics. Without one only clients at
+# the addresses below may, and there are none unless configured: behind a
+# local reverse proxy every request comes from loopback, so only list
+# addresses that reach the app directly.
+METRICS_TOKEN = getattr(settings, 'METRICS_TOKEN', None)
+METRICS_ALLOWED_ADDRESSES = tuple(getattr(settings, 'METRICS_ALLOWED_ADDRESSES', ()))
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = tuple(getattr(
+    settings, 'METRICS_LATENCY_BUCKETS', (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+))
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+# One statement run this many times in a request is logged as a likely N+1
+N_PLUS_ONE_REPEATS = getattr(settings, 'METRICS_N_PLUS_ONE_REPEATS', 10)
+# A view is flagged once its queries grow by this much per serialized
+# object, fitted over at least N_PLUS_ONE_MIN_REQUESTS requests
+N_PLUS_ONE_SLOPE = getattr(settings, 'METRICS_N_PLUS_ONE_SLOPE', 0.5)
+N_PLUS_ONE_MIN_REQUESTS = getattr(settings, 'METRICS_N_PLUS_ONE_MIN_REQUESTS', 20)
+
+# Label of work done outside any request (websocket consumers, commands)
+BACKGROUND = 'background'
+
+_current = contextvars.ContextVar('events_request_record', default=None)
+
+
+class RequestRecord:
+    __slots__ = ('queries', 'query_seconds', 'serializer_queries', 'serializer_seconds', 'serializing', 'objects', 'statements', 'cache')
+
+    def __init__(self):
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.serializer_queries = 0
+        self.serializer_seconds = 0.0
+        self.serializing = False
+        self.objects = 0
+        # sql -> executions, to spot one statement repeated per object
+        self.statements = {}
+        # cache name -> [hits, misses]
+        self.cache = {}
+
+
+class ViewStats:
+    __slots__ = (
+        'requests', 'seconds', 'latency', 'queries', 'query_seconds', 'query_counts',
+        'serializer_queries', 'serializer_seconds', 'objects', 'repeated',
+        # Sums for the least-squares fit of queries against objects
+        'sxx', 'sxy',
+    )
+
+    def __init__(self):
+        self.requests = 0
+        self.seconds = 0.0
+        self.latency = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.queries = 0
+        self.query_seconds = 0.0
+        self.query_counts = [0] * (len(QUERY_BUCKETS) + 1)
+        self.serializer_queries = 0
+        self.serializer_seconds = 0.0
+        self.objects = 0
+        self.repeated = 0
+        self.sxx = 0
+        self.sxy = 0
+
+    def merge(self, other):
+        for name in ('requests', 'seconds', 'queries', 'query_seconds', 'serializer_queries',
+                     'serializer_seconds', 'objects', 'repeated', 'sxx', 'sxy'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.latency = [a + b for a, b in zip(self.latency, other.latency)]
+        self.query_counts = [a + b for a, b in zip(self.query_counts, other.query_counts)]
+
+    def queries_per_object(self):
+        # Slope of queries over objects; None without enough spread in sizes
+        n = self.requests
+        spread = n * self.sxx - self.objects ** 2
+        if n < 2 or spread <= 0:
+            return None
+        return (n * self.sxy - self.objects * self.queries) / spread
+
+
+class _Shard:
+    __slots__ = ('views', 'statuses', 'cache')
+
+    def __init__(self):
+        # (view, method) -> ViewStats
+        self.views = {}
+        # (view, method, status) -> requests
+        self.statuses = {}
+        # (view, cache name) -> [hits, misses]
+        self.cache = {}
+
+
+class _ShardOwner:
+    # Only referenced from its thread's locals, so it is freed when the
+    # thread ends
+    __slots__ = ('shard', '__weakref__')
+
+    def __init__(self, shard):
+        self.shard = shard
+
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+# What the shards of finished threads counted, so the counters never go
+# backwards while a thread per request doesn't leave a shard per request
+_retired = _Shard()
+# Views already reported in the log as repeating a statement
+_warned = set()
+
+
+def _shard():
+    owner = getattr(_local, 'owner', None)
+    if owner is None:
+        owner = _local.owner = _ShardOwner(_Shard())
+        with _shards_lock:
+            _shards.append(owner.shard)
+        weakref.finalize(owner, _retire, owner.shard)
+    return owner.shard
+
+
+def _fold(shard, views, statuses, cache):
+    # list() of a dict view runs without releasing the GIL, so a writer
+    # adding a key can't break the iteration
+    for key, stats in list(shard.views.items()):
+        views.setdefault(key, ViewStats()).merge(stats)
+    for key, count in list(shard.statuses.items()):
+        statuses[key] = statuses.get(key, 0) + count
+    for key, (hits, misses) in list(shard.cache.items()):
+        counts = cache.setdefault(key, [0, 0])
+        counts[0] += hits
+        counts[1] += misses
+
+
+def _retire(shard):
+    # The thread is gone, so nothing writes to its shard any more
+    with _shards_lock:
+        _fold(shard, _retired.views, _retired.statuses, _retired.cache)
+        _shards.remove(shard)
+
+
+def _observe_query(execute, sql, params, many, context):
+    record = _current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.query_seconds += time.perf_counter() - started
+        record.queries += 1
+        if record.serializing:
+            record.serializer_queries += 1
+        record.statements[sql] = record.statements.get(sql, 0) + 1
+
+
+def _install_query_wrapper(sender, connection, **kwargs):
+    # Fires on every (re)connect of the same wrapper object
+    if _observe_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_observe_query)
+
+
+if METRICS_ENABLED:
+    connection_created.connect(_install_query_wrapper, dispatch_uid='events.metrics')
+
+
+def count_cache(name, hits=0, misses=0):
+    """
+    Count lookups of the `name` cache against the current request, or
+    against BACKGROUND outside one.
+    """
+    record = _current.get()
+    if record is not None:
+        counts = record.cache.get(name)
+        if counts is None:
+            counts = record.cache[name] = [0, 0]
+    else:
+        cache = _shard().cache
+        counts = cache.get((BACKGROUND, name))
+        if counts is None:
+            counts = cache[(BACKGROUND, name)] = [0, 0]
+    counts[0] += hits
+    counts[1] += misses
+
+
+class TimedSerializerMixin:
+    """
+    Adds the time spent in to_representation, and the queries it runs, to
+    the current request. Nested calls are timed once, by the outermost.
+    """
+
+    def to_representation(self, instance):
+        record = _current.get()
+        if record is None or record.serializing:
+            return super().to_representation(instance)
+        record.serializing = True
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            record.serializing = False
+            record.serializer_seconds += time.perf_counter() - started
+            record.objects += 1
+
+
+def count_serialized(objects, seconds):
+    """
+    Add objects serialized without a serializer (events.payloads) to the
+    current request.
+    """
+    record = _current.get()
+    if record is not None:
+        record.serializer_seconds += seconds
+        record.objects += objects
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match is not None else 'unmatched'
+
+
+def record_request(request, status_code, record, seconds):
+    view = view_name(request)
+    shard = _shard()
+    key = (view, request.method)
+    stats = shard.views.get(key)
+    if stats is None:
+        stats = shard.views[key] = ViewStats()
+    stats.requests += 1
+    stats.seconds += seconds
+    stats.latency[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+    stats.queries += record.queries
+    stats.query_seconds += record.query_seconds
+    stats.query_counts[bisect_left(QUERY_BUCKETS, record.queries)] += 1
+    stats.serializer_queries += record.serializer_queries
+    stats.serializer_seconds += record.serializer_seconds
+    stats.objects += record.objects
+    stats.sxx += record.objects * record.objects
+    stats.sxy += record.objects * record.queries
+
+    status_key = (view, request.method, status_code)
+    shard.statuses[status_key] = shard.statuses.get(status_key, 0) + 1
+    for name, (hits, misses) in record.cache.items():
+        counts = shard.cache.get((view, name))
+        if counts is None:
+            counts = shard.cache[(view, name)] = [0, 0]
+        counts[0] += hits
+        counts[1] += misses
+
+    if record.statements:
+        sql, repeats = max(record.statements.items(), key=lambda item: item[1])
+        if repeats >= N_PLUS_ONE_REPEATS:
+            stats.repeated += 1
+            if view not in _warned:
+                _warned.add(view)
+                logger.warning('Possible N+1 query in %s: ran %d times in one request: %s', view, repeats, sql[:300])
+
+
+def _observed(content, context, done):
+    # Runs the body iterator inside the request's context, so queries and
+    # serialization while streaming are counted too
+    iterator = iter(content)
+    try:
+        while True:
+            try:
+                chunk = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield chunk
+    finally:
+        done()
+
+
+async def _aobserved(content, record, done):
+    # The async counterpart: the request's record is current while each
+    # chunk is produced
+    iterator = aiter(content)
+    try:
+        while True:
+            token = _current.set(record)
+            try:
+                chunk = await anext(iterator)
+            except StopAsyncIteration:
+                return
+            finally:
+                _current.reset(token)
+            yield chunk
+    finally:
+        done()
+
+
+class MetricsMiddleware:
+    """
+    Put first in MIDDLEWARE so the whole request is measured. Streamed
+    responses are recorded once the body has been sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        record = RequestRecord()
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            return self.observe(request, response, record, started)
+        finally:
+            _current.reset(token)
+
+    async def __acall__(self, request):
+        record = RequestRecord()
+        token = _current.set(record)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+            return self.observe(request, response, record, started)
+        finally:
+            _current.reset(token)
+
+    def observe(self, request, response, record, started):
+        def done():
+            record_request(request, response.status_code, record, time.perf_counter() - started)
+
+        if response.streaming and response.is_async:
+            response.streaming_content = _aobserved(response.streaming_content, record, done)
+        elif response.streaming:
+            response.streaming_content = _observed(response.streaming_content, contextvars.copy_context(), done)
+        else:
+            done()
+        return response
+
+
+# Exposition
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels.items()
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def _number(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float):
+        return repr(round(value, 9))
+    return str(value)
+
+
+def exposition(families):
+    """
+    Prometheus text format of (name, type, help, samples) families, samples
+    being (suffix, labels, value).
+    """
+    lines = []
+    for name, kind, help_text, samples in families:
+        if not samples:
+            continue
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix, labels, value in samples:
+            lines.append(f'{name}{suffix}{_labels(labels)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _histogram(bounds, counts, total, labels):
+    samples, cumulative = [], 0
+    for bound, count in zip(bounds, counts):
+        cumulative += count
+        samples.append(('_bucket', {**labels, 'le': _number(bound)}, cumulative))
+    cumulative += counts[-1]
+    samples.append(('_bucket', {**labels, 'le': '+Inf'}, cumulative))
+    samples.append(('_sum', labels, total))
+    samples.append(('_count', labels, cumulative))
+    return samples
+
+
+def collect():
+    """
+    The request metrics of this process, summed over the thread shards, as
+    families for exposition().
+    """
+    views, statuses, cache = {}, {}, {}
+    with _shards_lock:
+        # A shard is either retired already or still listed, never both
+        shards = list(_shards)
+        _fold(_retired, views, statuses, cache)
+    for shard in shards:
+        _fold(shard, views, statuses, cache)
+
+    latency, query_counts, query_seconds, serializer_seconds, serializer_queries, objects = [], [], [], [], [], []
+    repeated, slopes, flagged = [], [], []
+    per_view = {}
+    for (view, method), stats in sorted(views.items()):
+        labels = {'view': view, 'method': method}
+        latency += _histogram(LATENCY_BUCKETS, stats.latency, stats.seconds, labels)
+        query_counts += _histogram(QUERY_BUCKETS, stats.query_counts, stats.queries, labels)
+        query_seconds.append(('_total', labels, stats.query_seconds))
+        serializer_seconds.append(('_total', labels, stats.serializer_seconds))
+        serializer_queries.append(('_total', labels, stats.serializer_queries))
+        objects.append(('_total', labels, stats.objects))
+        repeated.append(('_total', labels, stats.repeated))
+        per_view.setdefault(view, ViewStats()).merge(stats)
+    for view, stats in sorted(per_view.items()):
+        slope = stats.queries_per_object()
+        slopes.append(('', {'view': view}, slope))
+        suspect = slope is not None and stats.requests >= N_PLUS_ONE_MIN_REQUESTS and slope >= N_PLUS_ONE_SLOPE
+        flagged.append(('', {'view': view}, int(suspect)))
+
+    cache_lookups, ratios, totals = [], [], {}
+    for (view, name), (hits, misses) in sorted(cache.items()):
+        cache_lookups.append(('_total', {'view': view, 'cache': name, 'result': 'hit'}, hits))
+        cache_lookups.append(('_total', {'view': view, 'cache': name, 'result': 'miss'}, misses))
+        total = totals.setdefault(name, [0, 0])
+        total[0] += hits
+        total[1] += misses
+    for name, (hits, misses) in sorted(totals.items()):
+        ratios.append(('', {'cache': name}, hits / (hits + misses) if hits + misses else None))
+
+    return [
+        ('events_http_requests', 'counter', 'Requests by URL name, method and status.', [
+            ('_total', {'view': view, 'method': method, 'status': status}, count)
+            for (view, method, status), count in sorted(statuses.items())
+        ]),
+        ('events_http_request_duration_seconds', 'histogram', 'Request latency, including a streamed body.', latency),
+        ('events_db_queries_per_request', 'histogram', 'SQL statements run per request.', query_counts),
+        ('events_db_query_seconds', 'counter', 'Time spent executing SQL.', query_seconds),
+        ('events_serializer_seconds', 'counter', 'Time spent in response serializers.', serializer_seconds),
+        ('events_serializer_queries', 'counter', 'SQL statements run from inside a serializer.', serializer_queries),
+        ('events_serialized_objects', 'counter', 'Objects serialized.', objects),
+        ('events_repeated_query_requests', 'counter',
+         f'Requests that ran one statement at least {N_PLUS_ONE_REPEATS} times.', repeated),
+        ('events_queries_per_object', 'gauge', 'Fitted growth of queries per serialized object.', slopes),
+        ('events_n_plus_one', 'gauge', 'Whether queries grow with result size (likely N+1).', flagged),
+        ('events_cache_lookups', 'counter', 'Cache lookups by URL name, cache and result.', cache_lookups),
+        ('events_cache_hit_ratio', 'gauge', 'Hits over lookups since start.', ratios),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-17 06:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['start_time', 'id'], name='event_start_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['created_by', 'start_time', 'id'], name='event_owner_start_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventpermission',
+            index=models.Index(fields=['event', 'user', 'role'], name='eventperm_event_user_role_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+# GiST indexes over the event's [start_time, end_time) span, used by
+# Overlaps() on PostgreSQL. The owner variant needs btree_gist to combine the
+# scalar created_by_id column with the range and is skipped where that
+# extension isn't installed. Other backends fall back to the B-tree indexes
+# on start_time.
+SPAN = "tstzrange(start_time, end_time, '[)')"
+
+
+def create_span_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'CREATE INDEX IF NOT EXISTS event_span_gist ON events_event USING gist ({SPAN})')
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gist'")
+        has_btree_gist = cursor.fetchone() is not None
+    if has_btree_gist:
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS event_owner_span_gist ON events_event USING gist (created_by_id, {SPAN})'
+        )
+
+
+def drop_span_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS event_owner_span_gist')
+    schema_editor.execute('DROP INDEX IF EXISTS event_span_gist')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0002_event_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_span_indexes, drop_span_indexes),
+    ]
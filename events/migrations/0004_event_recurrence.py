@@ -0,0 +1,136 @@
+# Generated by Django 5.2.1 on 2026-10-17 06:31
+
+import calendar
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+from django.utils.dateparse import parse_datetime
+
+
+# Frozen copy of events.recurrence.series_end as it stood for this
+# migration: later changes to the rules, or to RECURRENCE_TIME_ZONE, must
+# not change what it stores. It steps in UTC, so finite ends get SLACK on
+# top; recurrence_end only bounds window queries from below, and stepping
+# in a local zone moves an occurrence by less than a day.
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+SLACK = timedelta(days=1)
+
+
+def _parse_until(value):
+    for fmt in ('%Y%m%dT%H%M%SZ', '%Y%m%dT%H%M%S'):
+        try:
+            return datetime.strptime(value, fmt).replace(tzinfo=dt_timezone.utc)
+        except ValueError:
+            pass
+    try:
+        return datetime.combine(datetime.strptime(value, '%Y%m%d').date(), time.max, tzinfo=dt_timezone.utc)
+    except ValueError:
+        pass
+    until = parse_datetime(value)
+    if until is not None and until.tzinfo is None:
+        until = until.replace(tzinfo=dt_timezone.utc)
+    return until
+
+
+def _parse_rule(pattern):
+    """
+    (freq, interval, count, until) of a plain or RRULE pattern, or None
+    when it is unparseable (such events are single events).
+    """
+    pattern = (pattern or '').strip()
+    if pattern.upper().startswith('RRULE:'):
+        pattern = pattern[len('RRULE:'):]
+    if '=' not in pattern:
+        return (pattern.upper(), 1, None, None) if pattern.upper() in FREQUENCIES else None
+    parts = {}
+    for part in pattern.split(';'):
+        name, sep, value = part.partition('=')
+        if not sep or not value.strip():
+            return None
+        parts[name.strip().upper()] = value.strip()
+    if set(parts) - {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL'} or parts.get('FREQ', '').upper() not in FREQUENCIES:
+        return None
+    if 'COUNT' in parts and 'UNTIL' in parts:
+        return None
+    try:
+        interval, count = int(parts.get('INTERVAL', '1')), int(parts['COUNT']) if 'COUNT' in parts else None
+    except ValueError:
+        return None
+    until = _parse_until(parts['UNTIL']) if 'UNTIL' in parts else None
+    if interval < 1 or (count is not None and count < 1) or ('UNTIL' in parts and until is None):
+        return None
+    return parts['FREQ'].upper(), interval, count, until
+
+
+def _nth_start(start, freq, interval, n):
+    if freq == 'MONTHLY':
+        month_index = start.month - 1 + n * interval
+        year, month = start.year + month_index // 12, month_index % 12 + 1
+        return start.replace(year=year, month=month, day=min(start.day, calendar.monthrange(year, month)[1]))
+    return start + n * interval * timedelta(days=7 if freq == 'WEEKLY' else 1)
+
+
+def series_end(event):
+    rule = _parse_rule(event.recurrence_pattern) if event.is_recurring else None
+    if rule is None:
+        return event.end_time
+    freq, interval, count, until = rule
+    start = event.start_time
+    if count is not None:
+        last = count - 1
+    elif until is None:
+        return None
+    elif until < start:
+        last = 0
+    else:
+        if freq == 'MONTHLY':
+            last = ((until.year - start.year) * 12 + until.month - start.month) // interval
+        else:
+            last = (until - start) // (interval * timedelta(days=7 if freq == 'WEEKLY' else 1))
+        while last > 0 and _nth_start(start, freq, interval, last) > until:
+            last -= 1
+    return _nth_start(start, freq, interval, last) + (event.end_time - start) + SLACK
+
+
+def populate_recurrence_end(apps, schema_editor):
+    Event = apps.get_model('events', 'Event')
+    Event.objects.filter(is_recurring=False).update(recurrence_end=F('end_time'))
+    series = Event.objects.filter(is_recurring=True).only(
+        'start_time', 'end_time', 'is_recurring', 'recurrence_pattern',
+    )
+    for event in series.iterator(chunk_size=2000):
+        event.recurrence_end = series_end(event)
+        event.save(update_fields=['recurrence_end'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0003_event_span_gist_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='recurrence_end',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='recurrence_exceptions',
+            field=models.JSONField(blank=True, default=list, help_text='Start times of skipped occurrences (ISO 8601)'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='recurrence_pattern',
+            field=models.CharField(blank=True, help_text="Recurrence pattern like 'daily', 'weekly', 'monthly', or an RRULE such as 'FREQ=WEEKLY;INTERVAL=2;COUNT=10'", max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_recurring', True)), fields=['created_by', 'start_time'], name='event_owner_series_idx'),
+        ),
+        migrations.RunPython(populate_recurrence_end, migrations.RunPython.noop),
+    ]
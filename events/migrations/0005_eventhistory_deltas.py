@@ -0,0 +1,156 @@
+from django.db import migrations, models
+
+
+# Frozen copies of events.history constants: the conversion must not change
+# if the live settings do.
+HISTORY_FIELDS = ('title', 'description', 'location', 'start_time', 'end_time')
+DATETIME_FIELDS = ('start_time', 'end_time')
+KEYFRAME_INTERVAL = 10
+CHUNK_SIZE = 1000
+
+
+def _stored(row):
+    return {
+        field: getattr(row, field).isoformat() if field in DATETIME_FIELDS else getattr(row, field)
+        for field in HISTORY_FIELDS
+    }
+
+
+def to_deltas(apps, schema_editor):
+    """
+    Number each event's existing rows in edit order and replace the full
+    copies with a keyframe every KEYFRAME_INTERVAL versions and deltas between.
+    """
+    EventHistory = apps.get_model('events', 'EventHistory')
+    rows = EventHistory.objects.order_by('event_id', 'edited_at', 'id')
+
+    batch = []
+    event_id, version, previous = None, 0, None
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        if row.event_id != event_id:
+            event_id, version, previous = row.event_id, 0, None
+        version += 1
+        current = _stored(row)
+        row.version = version
+        row.is_keyframe = (version - 1) % KEYFRAME_INTERVAL == 0
+        if row.is_keyframe:
+            row.changes = current
+        else:
+            row.changes = {field: value for field, value in current.items() if previous[field] != value}
+        previous = current
+
+        batch.append(row)
+        if len(batch) >= CHUNK_SIZE:
+            EventHistory.objects.bulk_update(batch, ['version', 'is_keyframe', 'changes'])
+            batch = []
+    if batch:
+        EventHistory.objects.bulk_update(batch, ['version', 'is_keyframe', 'changes'])
+
+
+def to_full_copies(apps, schema_editor):
+    from django.utils.dateparse import parse_datetime
+
+    EventHistory = apps.get_model('events', 'EventHistory')
+    rows = EventHistory.objects.order_by('event_id', 'version')
+
+    batch = []
+    event_id, state = None, None
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        if row.event_id != event_id or row.is_keyframe:
+            event_id, state = row.event_id, {}
+        state = {**state, **row.changes}
+        for field in HISTORY_FIELDS:
+            value = state.get(field)
+            setattr(row, field, parse_datetime(value) if field in DATETIME_FIELDS else value)
+
+        batch.append(row)
+        if len(batch) >= CHUNK_SIZE:
+            EventHistory.objects.bulk_update(batch, HISTORY_FIELDS)
+            batch = []
+    if batch:
+        EventHistory.objects.bulk_update(batch, HISTORY_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_event_recurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventhistory',
+            name='version',
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='eventhistory',
+            name='is_keyframe',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='eventhistory',
+            name='changes',
+            field=models.JSONField(default=dict),
+        ),
+        # Nullable first so the migration can be reversed onto existing rows
+        migrations.AlterField(
+            model_name='eventhistory',
+            name='title',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='eventhistory',
+            name='description',
+            field=models.TextField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='eventhistory',
+            name='location',
+            field=models.CharField(max_length=255, null=True),
+        ),
+        migrations.AlterField(
+            model_name='eventhistory',
+            name='start_time',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AlterField(
+            model_name='eventhistory',
+            name='end_time',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(to_deltas, to_full_copies),
+        migrations.RemoveField(
+            model_name='eventhistory',
+            name='title',
+        ),
+        migrations.RemoveField(
+            model_name='eventhistory',
+            name='description',
+        ),
+        migrations.RemoveField(
+            model_name='eventhistory',
+            name='location',
+        ),
+        migrations.RemoveField(
+            model_name='eventhistory',
+            name='start_time',
+        ),
+        migrations.RemoveField(
+            model_name='eventhistory',
+            name='end_time',
+        ),
+        migrations.AlterField(
+            model_name='eventhistory',
+            name='version',
+            field=models.PositiveIntegerField(),
+        ),
+        migrations.AddIndex(
+            model_name='eventhistory',
+            index=models.Index(condition=models.Q(('is_keyframe', True)), fields=['event', 'version'], name='eventhistory_keyframe_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='eventhistory',
+            constraint=models.UniqueConstraint(fields=('event', 'version'), name='eventhistory_event_version_uniq'),
+        ),
+    ]
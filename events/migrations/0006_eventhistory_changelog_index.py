@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-17 06:38
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0005_eventhistory_deltas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='eventhistory',
+            index=models.Index(fields=['event', 'edited_at', 'id'], name='eventhistory_event_edited_idx'),
+        ),
+    ]
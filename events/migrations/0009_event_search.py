@@ -0,0 +1,70 @@
+from django.db import migrations
+
+
+# Full-text search over title, location and description, maintained by the
+# database so every write path (save, bulk_create, bulk_update, raw SQL)
+# keeps it current. PostgreSQL gets a stored generated tsvector column with
+# a GIN index; SQLite an external-content FTS5 table kept in sync by
+# triggers. The config must match events.search.SEARCH_CONFIG.
+#
+# Django rebuilds SQLite tables for most later schema changes to Event,
+# which drops the triggers; such migrations need to recreate them.
+VECTOR = (
+    "setweight(to_tsvector('english'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(location, '')), 'B') || "
+    "setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'C')"
+)
+
+FTS_COLUMNS = 'title, description, location'
+
+
+def create_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            f'ALTER TABLE events_event ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS ({VECTOR}) STORED'
+        )
+        schema_editor.execute('CREATE INDEX IF NOT EXISTS event_search_gin ON events_event USING gin (search_vector)')
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS events_event_fts USING fts5("
+            f"{FTS_COLUMNS}, content='events_event', content_rowid='id', tokenize='porter unicode61')"
+        )
+        new = 'new.title, new.description, new.location'
+        old = 'old.title, old.description, old.location'
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS events_event_fts_insert AFTER INSERT ON events_event BEGIN "
+            f"INSERT INTO events_event_fts(rowid, {FTS_COLUMNS}) VALUES (new.id, {new}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS events_event_fts_delete AFTER DELETE ON events_event BEGIN "
+            f"INSERT INTO events_event_fts(events_event_fts, rowid, {FTS_COLUMNS}) VALUES ('delete', old.id, {old}); END"
+        )
+        schema_editor.execute(
+            f"CREATE TRIGGER IF NOT EXISTS events_event_fts_update AFTER UPDATE OF {FTS_COLUMNS} ON events_event BEGIN "
+            f"INSERT INTO events_event_fts(events_event_fts, rowid, {FTS_COLUMNS}) VALUES ('delete', old.id, {old}); "
+            f"INSERT INTO events_event_fts(rowid, {FTS_COLUMNS}) VALUES (new.id, {new}); END"
+        )
+        schema_editor.execute("INSERT INTO events_event_fts(events_event_fts) VALUES ('rebuild')")
+
+
+def drop_search(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS event_search_gin')
+        schema_editor.execute('ALTER TABLE events_event DROP COLUMN IF EXISTS search_vector')
+    elif vendor == 'sqlite':
+        for trigger in ('insert', 'delete', 'update'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS events_event_fts_{trigger}')
+        schema_editor.execute('DROP TABLE IF EXISTS events_event_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0008_event_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -1,5 +1,8 @@
 from django.db import models
+from django.db.models import BooleanField, F, FilteredRelation, Func, Q, Value
 from django.contrib.auth.models import User
+from django.utils import timezone
+from .recurrence import series_end
 
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
@@ -8,6 +11,59 @@ class Profile(models.Model):
         return self.user.username
 
 
+class Overlaps(Func):
+    """
+    True when the half-open interval [start, end) overlaps [lower, upper).
+
+    On PostgreSQL this compiles to a `tstzrange && tstzrange` test so the GiST
+    span indexes can answer it; other backends get the equivalent pair of
+    comparisons.
+    """
+    arity = 4
+    output_field = BooleanField()
+
+    def _compile_bounds(self, compiler, connection):
+        return [compiler.compile(expression) for expression in self.get_source_expressions()]
+
+    def as_sql(self, compiler, connection, **extra_context):
+        (start, start_params), (end, end_params), (lower, lower_params), (upper, upper_params) = \
+            self._compile_bounds(compiler, connection)
+        sql = f'({start} < {upper} AND {end} > {lower})'
+        return sql, (*start_params, *upper_params, *end_params, *lower_params)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        (start, start_params), (end, end_params), (lower, lower_params), (upper, upper_params) = \
+            self._compile_bounds(compiler, connection)
+        sql = f"tstzrange({start}, {end}, '[)') && tstzrange({lower}, {upper}, '[)')"
+        return sql, (*start_params, *end_params, *lower_params, *upper_params)
+
+
+class EventQuerySet(models.QuerySet):
+    def visible_to(self, user):
+        # Events the user owns or holds a role on. Filtering the permissions
+        # join on the user keeps it to one LEFT JOIN with at most one row per
+        # event (user, event is unique), so no DISTINCT is needed.
+        return self.annotate(
+            user_permission=FilteredRelation('permissions', condition=Q(permissions__user=user)),
+        ).filter(Q(created_by=user) | Q(user_permission__isnull=False))
+
+    def overlapping(self, start, end):
+        return self.filter(Overlaps(F('start_time'), F('end_time'), Value(start), Value(end)))
+
+    def in_window(self, start, end):
+        # Single events overlapping the window, plus recurring series that
+        # may have an occurrence in it (expand them with events.recurrence)
+        return self.filter(
+            Q(Overlaps(F('start_time'), F('end_time'), Value(start), Value(end)))
+            | Q(is_recurring=True, start_time__lt=end)
+            & (Q(recurrence_end__isnull=True) | Q(recurrence_end__gt=start))
+        )
+
+    def bump_versions(self):
+        # For changes that don't go through Event.save(), e.g. permissions
+        return self.update(version=F('version') + 1)
+
+
 class Event(models.Model):
     title = models.CharField(max_length=255)
     description = models.TextField()
@@ -17,11 +73,32 @@ class Event(models.Model):
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='events')
     created_at = models.DateTimeField(auto_now_add=True) 
     is_recurring = models.BooleanField(default=False)
-    recurrence_pattern = models.CharField(max_length=50, blank=True, null=True, help_text="Recurrence pattern like 'daily', 'weekly', 'monthly'")
+    recurrence_pattern = models.CharField(max_length=255, blank=True, null=True, help_text="Recurrence pattern like 'daily', 'weekly', 'monthly', or an RRULE such as 'FREQ=WEEKLY;INTERVAL=2;COUNT=10'")
+    recurrence_exceptions = models.JSONField(default=list, blank=True, help_text="Start times of skipped occurrences (ISO 8601)")
+    # End of the last occurrence, null when the series never ends. Kept in sync on save().
+    recurrence_end = models.DateTimeField(blank=True, null=True, editable=False)
+    # Incremented by every change to the event or its permissions; the basis
+    # of the ETags served for the event, its permissions and its history
+    version = models.PositiveIntegerField(default=1, editable=False)
+
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination order for listings
+            models.Index(fields=['start_time', 'id'], name='event_start_id_idx'),
+            models.Index(fields=['created_by', 'start_time', 'id'], name='event_owner_start_id_idx'),
+            # Recurring series that can reach into a window
+            models.Index(fields=['created_by', 'start_time'], condition=Q(is_recurring=True), name='event_owner_series_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        self.recurrence_end = series_end(self)
+        super().save(*args, **kwargs)
+
 
 class EventPermission(models.Model):
     PERMISSION_ROLES = [
@@ -36,6 +113,10 @@ class EventPermission(models.Model):
 
     class Meta:
         unique_together = ('user', 'event')
+        indexes = [
+            # Covers the visibility join and role lookups without a heap fetch
+            models.Index(fields=['event', 'user', 'role'], name='eventperm_event_user_role_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.event.title} ({self.role})"
@@ -44,14 +125,74 @@ class EventPermission(models.Model):
 class EventHistory(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='history')
     edited_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
-    title = models.CharField(max_length=255)
-    description = models.TextField()
-    location = models.CharField(max_length=255)
-    start_time = models.DateTimeField()
-    end_time = models.DateTimeField()
+    # Sequence number of the version within its event, starting at 1
+    version = models.PositiveIntegerField()
+    # Keyframes hold every versioned field; other rows only hold the fields
+    # that differ from the previous version (see events.history)
+    is_keyframe = models.BooleanField(default=False)
+    changes = models.JSONField(default=dict)
     edited_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'version'], name='eventhistory_event_version_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['event', 'version'], condition=Q(is_keyframe=True), name='eventhistory_keyframe_idx'),
+            # Changelog pages: newest first within an event
+            models.Index(fields=['event', 'edited_at', 'id'], name='eventhistory_event_edited_idx'),
+        ]
+
     def __str__(self):
         return f"{self.event.title} edited by {self.edited_by.username if self.edited_by else 'Unknown'}"
 
 
+
+
+class NotificationOutbox(models.Model):
+    """
+    Channel-layer messages waiting for delivery. Rows are written in the
+    same transaction as the change they announce and sent by the
+    dispatch_notifications worker (see events.outbox); delivered rows are
+    deleted.
+    """
+    group = models.CharField(max_length=100)
+    message = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Not picked up before this time: set on retry backoff and while a
+    # worker holds the row
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    # Set once the retries are exhausted; the row is kept for inspection
+    failed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at', 'id'], condition=Q(failed_at__isnull=True), name='outbox_pending_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.group} ({self.attempts} attempts)"
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Progress of an import_events run over one file. Updated in the same
+    transaction as each chunk it counts, so a resumed run continues
+    exactly after the last committed chunk.
+    """
+    # '<kind>:<absolute path>'
+    source = models.CharField(max_length=255, unique=True)
+    kind = models.CharField(max_length=20)
+    # Byte offset in the file just past the last committed record
+    offset = models.BigIntegerField(default=0)
+    rows = models.BigIntegerField(default=0)
+    imported = models.BigIntegerField(default=0)
+    rejected = models.BigIntegerField(default=0)
+    started_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.source} ({self.rows} rows)"
@@ -0,0 +1,123 @@
+import asyncio
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import NotificationOutbox
+
+MAX_ATTEMPTS = getattr(settings, 'NOTIFICATION_OUTBOX_MAX_ATTEMPTS', 8)
+# Retry delay doubles per failed attempt, from BACKOFF_BASE up to BACKOFF_MAX
+BACKOFF_BASE = timedelta(seconds=getattr(settings, 'NOTIFICATION_OUTBOX_BACKOFF_BASE', 2))
+BACKOFF_MAX = timedelta(seconds=getattr(settings, 'NOTIFICATION_OUTBOX_BACKOFF_MAX', 300))
+# How long a claimed row stays hidden from other workers; a worker that dies
+# mid-batch has its rows picked up again after this
+LEASE = timedelta(seconds=getattr(settings, 'NOTIFICATION_OUTBOX_LEASE', 60))
+
+
+def enqueue(group, message):
+    """
+    Queue `message` (a channel-layer event dict) for `group`. Call it inside
+    the transaction that makes the change: the notification is sent if and
+    only if that transaction commits.
+    """
+    return NotificationOutbox.objects.create(group=group, message=message)
+
+
+def enqueue_many(items):
+    """
+    Queue several (group, message) pairs with one insert.
+    """
+    return NotificationOutbox.objects.bulk_create(
+        NotificationOutbox(group=group, message=message) for group, message in items
+    )
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def claim_batch(batch_size):
+    """
+    Lease up to `batch_size` due rows to this worker, oldest first. Rows
+    locked by a concurrent worker are skipped rather than waited on.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            NotificationOutbox.objects.select_for_update(skip_locked=True)
+            .filter(failed_at__isnull=True, available_at__lte=now)
+            .order_by('available_at', 'id')[:batch_size]
+        )
+        if rows:
+            NotificationOutbox.objects.filter(pk__in=[row.pk for row in rows]).update(available_at=now + LEASE)
+    return rows
+
+
+def coalesce(rows):
+    """
+    {group: [rows]} in queue order, so each group gets a single send.
+    """
+    groups = {}
+    for row in rows:
+        groups.setdefault(row.group, []).append(row)
+    return groups
+
+
+def group_event(rows):
+    if len(rows) == 1:
+        return rows[0].message
+    return {'type': 'send_notification_batch', 'events': [row.message for row in rows]}
+
+
+async def _send_groups(channel_layer, groups):
+    async def send(group, rows):
+        try:
+            await channel_layer.group_send(group, group_event(rows))
+        except Exception as exc:
+            return exc
+        return None
+
+    results = await asyncio.gather(*(send(group, rows) for group, rows in groups.items()))
+    return dict(zip(groups, results))
+
+
+def dispatch_batch(batch_size=500, channel_layer=None):
+    """
+    Claim one batch, send it with one group_send per group and settle the
+    rows: delivered ones are deleted, failed ones rescheduled with backoff.
+    Returns (claimed, delivered, retried).
+    """
+    rows = claim_batch(batch_size)
+    if not rows:
+        return 0, 0, 0
+
+    channel_layer = channel_layer or get_channel_layer()
+    groups = coalesce(rows)
+    errors = async_to_sync(_send_groups)(channel_layer, groups)
+
+    now = timezone.now()
+    delivered, retried = [], []
+    for group, group_rows in groups.items():
+        error = errors[group]
+        if error is None:
+            delivered.extend(row.pk for row in group_rows)
+            continue
+        for row in group_rows:
+            row.attempts += 1
+            row.last_error = f'{type(error).__name__}: {error}'
+            if row.attempts >= MAX_ATTEMPTS:
+                row.failed_at = now
+            else:
+                row.available_at = now + backoff(row.attempts)
+            retried.append(row)
+
+    with transaction.atomic():
+        if delivered:
+            NotificationOutbox.objects.filter(pk__in=delivered).delete()
+        if retried:
+            NotificationOutbox.objects.bulk_update(retried, ['attempts', 'last_error', 'available_at', 'failed_at'])
+    return len(rows), len(delivered), len(retried)
@@ -0,0 +1,155 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset (seek) pagination over a (key, tie-breaker) ordering.
+
+    Each page is fetched with a `WHERE (key, id) > (last key, last id)`
+    predicate instead of an OFFSET, so page N costs the same as page 1
+    as long as an index exists on the ordering columns.
+    """
+    # (key field, unique tie-breaker); prefix both with '-' for descending order
+    ordering = ('start_time', 'id')
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        if position is None:
+            reverse, key, pk = False, None, None
+        else:
+            reverse, key, pk = position
+
+        queryset = queryset.order_by(*self.get_ordering(reverse))
+        if key is not None:
+            queryset = queryset.filter(self.get_seek_filter(key, pk, reverse))
+
+        # Fetch one extra row to learn whether a further page exists
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, reverse=False):
+        if not reverse:
+            return self.ordering
+        return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering)
+
+    def get_seek_filter(self, key, pk, reverse=False):
+        key_field, pk_field = (name.lstrip('-') for name in self.ordering)
+        descending = self.ordering[0].startswith('-') != reverse
+        op = 'lt' if descending else 'gt'
+        # The redundant inclusive bound lets the database start an index range
+        # scan at `key` instead of evaluating the OR for every row.
+        return (
+            Q(**{f'{key_field}__{op}e': key})
+            & (Q(**{f'{key_field}__{op}': key}) | Q(**{f'{pk_field}__{op}': pk}))
+        )
+
+    def get_position(self, row):
+        key_field, pk_field = (name.lstrip('-') for name in self.ordering)
+        if isinstance(row, dict):
+            return row[key_field], row[pk_field]
+        return getattr(row, key_field), getattr(row, pk_field)
+
+    def encode_key(self, value):
+        return value.isoformat()
+
+    def decode_key(self, value):
+        return parse_datetime(value)
+
+    def encode_cursor(self, row, reverse):
+        key, pk = self.get_position(row)
+        raw = f"{'r' if reverse else 'f'}|{self.encode_key(key)}|{pk}"
+        cursor = urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            direction, key, pk = urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8').split('|')
+            key = self.decode_key(key)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if direction not in ('f', 'r') or key is None:
+            raise NotFound(self.invalid_cursor_message)
+        return direction == 'r', key, pk
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+
+class EventCursorPagination(KeysetPagination):
+    ordering = ('start_time', 'id')
+
+
+class EventHistoryCursorPagination(KeysetPagination):
+    ordering = ('-edited_at', '-id')
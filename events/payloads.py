@@ -0,0 +1,153 @@
+"""
+EventSerializer output built straight from .values() rows, for read-only
+listings: no model instances and no per-field serializer calls per row.
+
+For each tuple of fields a function turning a list of rows into a list of
+payloads is generated once, with the conversion of every field inlined.
+The result is equal to EventSerializer's for the same fields, field order
+included; fields it has no inline conversion for go through the
+serializer field's own to_representation.
+"""
+import time
+from datetime import timezone as dt_timezone
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .metrics import count_serialized
+from .models import Event
+from .serializers import EventSerializer
+
+PAYLOAD_FIELDS = tuple(EventSerializer.Meta.fields)
+# What events.recurrence reads from an event, besides its pk
+RECURRENCE_COLUMNS = ('start_time', 'end_time', 'is_recurring', 'recurrence_pattern', 'recurrence_exceptions')
+
+_serializer_fields = EventSerializer().fields
+
+
+def column(field):
+    # The values() column behind a payload field, e.g. created_by__username
+    return _serializer_fields[field].source.replace('.', '__')
+
+
+def columns(fields):
+    return tuple(column(field) for field in fields)
+
+
+def parse_fields(value):
+    """
+    The payload fields named in a ?fields= value ('title,start_time'), in
+    serializer order; None for all of them. ValueError for unknown ones.
+    """
+    if value is None:
+        return None
+    names = {name.strip() for name in value.split(',') if name.strip()}
+    if not names:
+        raise ValueError("'fields' must name at least one field.")
+    unknown = names.difference(PAYLOAD_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Choose from: {', '.join(PAYLOAD_FIELDS)}.")
+    return tuple(field for field in PAYLOAD_FIELDS if field in names)
+
+
+def _passes_through(field, model_field):
+    # Values the database already returns in their serialized form
+    if isinstance(field, serializers.ReadOnlyField):
+        return True
+    if isinstance(field, serializers.IntegerField):
+        return isinstance(model_field, models.IntegerField)
+    if isinstance(field, serializers.BooleanField):
+        return isinstance(model_field, models.BooleanField)
+    if isinstance(field, serializers.CharField):
+        return isinstance(model_field, (models.CharField, models.TextField))
+    return False
+
+
+def _is_datetime(field):
+    return (
+        type(field) is serializers.DateTimeField
+        and getattr(field, 'format', api_settings.DATETIME_FORMAT) == api_settings.DATETIME_FORMAT
+        and not hasattr(field, 'timezone')
+    )
+
+
+def _expression(field):
+    serializer_field = _serializer_fields[field]
+    value = f'row[{column(field)!r}]'
+    try:
+        model_field = Event._meta.get_field(serializer_field.source)
+    except FieldDoesNotExist:
+        # Related lookups such as created_by.username
+        model_field = None
+
+    if _passes_through(serializer_field, model_field):
+        return value
+    if _is_datetime(serializer_field):
+        converted = f'_datetime({value})'
+    elif isinstance(serializer_field, serializers.ListField) and _is_datetime(serializer_field.child):
+        converted = f'[_datetime(item) if item is not None else None for item in {value}]'
+    else:
+        converted = f'_fields[{field!r}].to_representation({value})'
+    # The serializer skips the field's to_representation for None
+    if model_field is not None and not model_field.null and not isinstance(model_field, models.JSONField):
+        return converted
+    return f'({converted} if {value} is not None else None)'
+
+
+@lru_cache(maxsize=256)
+def compile_payloads(fields):
+    """
+    The function (rows, _datetime, _fields) -> payloads for a tuple of
+    fields.
+    """
+    items = ', '.join(f'{field!r}: {_expression(field)}' for field in fields)
+    source = f'def payloads(rows, _datetime, _fields):\n    return [{{{items}}} for row in rows]\n'
+    namespace = {}
+    exec(compile(source, f'<payloads {",".join(fields)}>', 'exec'), namespace)
+    return namespace['payloads']
+
+
+def datetime_representation():
+    """
+    DateTimeField().to_representation for the active timezone, inlined
+    for aware datetimes and the usual ISO 8601 output with USE_TZ.
+    """
+    field = serializers.DateTimeField()
+    if not settings.USE_TZ or (api_settings.DATETIME_FORMAT or '').lower() != ISO_8601:
+        return field.to_representation
+    zone = timezone.get_current_timezone()
+    # Values already in the zone (or in UTC, for a UTC zone) print the same
+    # without converting them
+    in_zone = (zone, dt_timezone.utc) if getattr(zone, 'key', None) == 'UTC' else (zone,)
+
+    def representation(value):
+        tzinfo = getattr(value, 'tzinfo', None)
+        if tzinfo is None:
+            # None, strings and naive values
+            return field.to_representation(value)
+        if tzinfo not in in_zone:
+            try:
+                value = value.astimezone(zone)
+            except OverflowError:
+                return field.to_representation(value)
+        value = value.isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return representation
+
+
+def event_payloads(rows, fields=PAYLOAD_FIELDS):
+    """
+    Payloads of .values(*columns(fields)) rows, in row order.
+    """
+    started = time.perf_counter()
+    payloads = compile_payloads(tuple(fields))(rows, datetime_representation(), _serializer_fields)
+    count_serialized(len(payloads), time.perf_counter() - started)
+    return payloads
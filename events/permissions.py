@@ -1,26 +1,29 @@
+import hmac
+
 from rest_framework import permissions
-from .models import EventPermission
+from .metrics import METRICS_ALLOWED_ADDRESSES, METRICS_TOKEN
+from .roles import EDITOR_ROLES, OWNER_ROLES, VIEWER_ROLES, get_role
 
 class IsEventOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        try:
-            role = EventPermission.objects.get(user=request.user, event=obj).role
-            return role == 'owner'
-        except EventPermission.DoesNotExist:
-            return False
+        return get_role(request, obj) in OWNER_ROLES
 
 class IsEventEditorOrOwner(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        try:
-            role = EventPermission.objects.get(user=request.user, event=obj).role
-            return role in ['owner', 'editor']
-        except EventPermission.DoesNotExist:
-            return False
+        return get_role(request, obj) in EDITOR_ROLES
 
 class IsEventViewerOrAbove(permissions.BasePermission):
     def has_object_permission(self, request, view, obj):
-        try:
-            role = EventPermission.objects.get(user=request.user, event=obj).role
-            return role in ['owner', 'editor', 'viewer']
-        except EventPermission.DoesNotExist:
-            return False
+        return get_role(request, obj) in VIEWER_ROLES
+
+class CanScrapeMetrics(permissions.BasePermission):
+    """
+    The METRICS_TOKEN bearer token when one is configured, otherwise a
+    client in METRICS_ALLOWED_ADDRESSES (empty unless set, so by default
+    nobody).
+    """
+    def has_permission(self, request, view):
+        if METRICS_TOKEN:
+            scheme, _, token = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+            return scheme.lower() == 'bearer' and hmac.compare_digest(token.strip().encode(), METRICS_TOKEN.encode())
+        return request.META.get('REMOTE_ADDR') in METRICS_ALLOWED_ADDRESSES
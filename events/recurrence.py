@@ -0,0 +1,300 @@
+import calendar
+from collections import OrderedDict
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from threading import Lock
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+
+from .metrics import count_cache
+
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+
+OCCURRENCE_CACHE_SIZE = getattr(settings, 'RECURRENCE_OCCURRENCE_CACHE_SIZE', 2048)
+# Series repeat at the same wall-clock time in this zone, across DST changes
+RECURRENCE_TIME_ZONE = ZoneInfo(getattr(settings, 'RECURRENCE_TIME_ZONE', None) or settings.TIME_ZONE or 'UTC')
+
+
+class RecurrenceRule:
+    """
+    A subset of RFC 5545 RRULE: FREQ (DAILY, WEEKLY or MONTHLY), INTERVAL,
+    COUNT and UNTIL.
+
+    Monthly occurrences keep the day of month of the first occurrence and
+    are clamped to the last day of shorter months (the 31st becomes the
+    30th in April), so every month produces exactly one occurrence.
+
+    Occurrences are stepped in the wall-clock time of RECURRENCE_TIME_ZONE
+    (TIME_ZONE unless set), so a series at 09:00 stays at 09:00 local time
+    across DST changes; its UTC time moves instead. A wall-clock time that
+    a DST change skips or repeats resolves as zoneinfo does (fold=0).
+    """
+
+    def __init__(self, freq, interval=1, count=None, until=None):
+        self.freq = freq
+        self.interval = interval
+        self.count = count
+        self.until = until
+
+    @classmethod
+    def parse(cls, pattern):
+        """
+        Accepts the plain 'daily', 'weekly' and 'monthly' patterns or an RRULE
+        value such as 'FREQ=WEEKLY;INTERVAL=2;COUNT=10'. Raises ValueError.
+        """
+        if not pattern or not pattern.strip():
+            raise ValueError('Recurrence pattern is empty.')
+        pattern = pattern.strip()
+        if pattern.upper().startswith('RRULE:'):
+            pattern = pattern[len('RRULE:'):]
+
+        if '=' not in pattern:
+            freq = pattern.upper()
+            if freq not in FREQUENCIES:
+                raise ValueError(f"Unknown recurrence pattern '{pattern}'.")
+            return cls(freq)
+
+        parts = {}
+        for part in pattern.split(';'):
+            name, sep, value = part.partition('=')
+            if not sep or not value:
+                raise ValueError(f"Malformed recurrence rule part '{part}'.")
+            parts[name.strip().upper()] = value.strip()
+
+        unsupported = set(parts) - {'FREQ', 'INTERVAL', 'COUNT', 'UNTIL'}
+        if unsupported:
+            raise ValueError(f"Unsupported recurrence rule parts: {', '.join(sorted(unsupported))}.")
+
+        freq = parts.get('FREQ', '').upper()
+        if freq not in FREQUENCIES:
+            raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}.")
+        if 'COUNT' in parts and 'UNTIL' in parts:
+            raise ValueError('COUNT and UNTIL cannot both be set.')
+
+        interval = _parse_positive_int(parts.get('INTERVAL', '1'), 'INTERVAL')
+        count = _parse_positive_int(parts['COUNT'], 'COUNT') if 'COUNT' in parts else None
+        until = _parse_until(parts['UNTIL']) if 'UNTIL' in parts else None
+        return cls(freq, interval, count, until)
+
+    def to_rrule(self):
+        parts = [f'FREQ={self.freq}']
+        if self.interval != 1:
+            parts.append(f'INTERVAL={self.interval}')
+        if self.count is not None:
+            parts.append(f'COUNT={self.count}')
+        if self.until is not None:
+            parts.append(f"UNTIL={self.until.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')}")
+        return ';'.join(parts)
+
+    @property
+    def min_step(self):
+        # Shortest possible gap between two consecutive occurrences
+        if self.freq == 'DAILY':
+            return timedelta(days=self.interval)
+        if self.freq == 'WEEKLY':
+            return timedelta(weeks=self.interval)
+        return timedelta(days=28 * self.interval)
+
+    def nth_start(self, dtstart, n):
+        # Arithmetic on an aware datetime keeps its wall-clock time and
+        # recomputes the offset
+        local = dtstart.astimezone(RECURRENCE_TIME_ZONE)
+        if self.freq == 'MONTHLY':
+            local = _add_months(local, n * self.interval)
+        else:
+            local = local + n * self.min_step
+        return local.astimezone(dtstart.tzinfo)
+
+    def first_index_after(self, dtstart, moment):
+        """
+        Smallest n whose occurrence starts strictly after `moment`. O(1).
+        """
+        if moment < dtstart:
+            return 0
+        if self.freq == 'MONTHLY':
+            months = (moment.year - dtstart.year) * 12 + moment.month - dtstart.month
+            n = max(months // self.interval - 1, 0)
+        else:
+            # Off by at most one where DST changes shift the UTC times
+            n = max((moment - dtstart) // self.min_step, 0)
+            while n > 0 and self.nth_start(dtstart, n) > moment:
+                n -= 1
+        while self.nth_start(dtstart, n) <= moment:
+            n += 1
+        return n
+
+    def last_index(self, dtstart):
+        """
+        Index of the final occurrence, or None when the series never ends.
+        """
+        if self.count is not None:
+            return self.count - 1
+        if self.until is None:
+            return None
+        if self.until < dtstart:
+            return 0
+        return self.first_index_after(dtstart, self.until) - 1
+
+
+def _parse_positive_int(value, name):
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a positive integer.')
+    if number < 1:
+        raise ValueError(f'{name} must be a positive integer.')
+    return number
+
+
+def _parse_until(value):
+    for fmt in ('%Y%m%dT%H%M%SZ', '%Y%m%dT%H%M%S'):
+        try:
+            return datetime.strptime(value, fmt).replace(tzinfo=dt_timezone.utc)
+        except ValueError:
+            pass
+    try:
+        # A bare date includes the whole day
+        day = datetime.strptime(value, '%Y%m%d').date()
+        return datetime.combine(day, time.max, tzinfo=dt_timezone.utc)
+    except ValueError:
+        pass
+    until = parse_datetime(value)
+    if until is None:
+        raise ValueError('UNTIL must be a date or UTC datetime such as 20250131T235959Z.')
+    if until.tzinfo is None:
+        until = until.replace(tzinfo=dt_timezone.utc)
+    return until
+
+
+def _add_months(moment, months):
+    month_index = moment.month - 1 + months
+    year, month = moment.year + month_index // 12, month_index % 12 + 1
+    day = min(moment.day, calendar.monthrange(year, month)[1])
+    return moment.replace(year=year, month=month, day=day)
+
+
+def get_rule(event):
+    """
+    The event's parsed rule, or None for single events and unparseable
+    legacy patterns (which are then treated as single events).
+    """
+    if not event.is_recurring or not event.recurrence_pattern:
+        return None
+    try:
+        return RecurrenceRule.parse(event.recurrence_pattern)
+    except ValueError:
+        return None
+
+
+def parse_exceptions(values):
+    exceptions = set()
+    for value in values or ():
+        moment = parse_datetime(value) if isinstance(value, str) else value
+        if moment is not None:
+            exceptions.add(moment)
+    return exceptions
+
+
+def iter_occurrences(event, window_start, window_end):
+    """
+    Lazily yield (start, end) for each occurrence of `event` overlapping
+    [window_start, window_end).
+
+    The first candidate is computed arithmetically, so the cost is
+    proportional to the number of occurrences in the window, not to the
+    length of the series.
+    """
+    rule = get_rule(event)
+    if rule is None:
+        if event.start_time < window_end and event.end_time > window_start:
+            yield event.start_time, event.end_time
+        return
+
+    duration = event.end_time - event.start_time
+    exceptions = parse_exceptions(event.recurrence_exceptions)
+    last = rule.last_index(event.start_time)
+
+    # An occurrence overlaps the window once its start is past window_start - duration
+    n = rule.first_index_after(event.start_time, window_start - duration)
+    while last is None or n <= last:
+        start = rule.nth_start(event.start_time, n)
+        if start >= window_end:
+            return
+        if start not in exceptions:
+            yield start, start + duration
+        n += 1
+
+
+def series_end(event):
+    """
+    End of the event's final occurrence, or None when the series never ends.
+    """
+    rule = get_rule(event)
+    if rule is None:
+        return event.end_time
+    last = rule.last_index(event.start_time)
+    if last is None:
+        return None
+    return rule.nth_start(event.start_time, last) + (event.end_time - event.start_time)
+
+
+class OccurrenceCache:
+    """
+    Bounded LRU of expanded occurrence windows.
+
+    Keys carry a fingerprint of the series fields, so a stale entry is never
+    served even when another process edited the event; explicit
+    invalidation just frees the memory early.
+    """
+
+    def __init__(self, maxsize=OCCURRENCE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def get_or_expand(self, event, window_start, window_end):
+        key = (event.pk, _fingerprint(event), window_start, window_end)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                count_cache('occurrence', hits=1)
+                return self._entries[key]
+        count_cache('occurrence', misses=1)
+
+        occurrences = tuple(iter_occurrences(event, window_start, window_end))
+
+        with self._lock:
+            self._entries[key] = occurrences
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return occurrences
+
+    def invalidate(self, event_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == event_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _fingerprint(event):
+    return (
+        event.start_time, event.end_time, event.is_recurring,
+        event.recurrence_pattern, tuple(event.recurrence_exceptions or ()),
+    )
+
+
+occurrence_cache = OccurrenceCache()
+
+
+def occurrences_between(event, window_start, window_end):
+    """
+    Cached tuple of the event's occurrences overlapping the window.
+    """
+    if get_rule(event) is None or event.pk is None:
+        return tuple(iter_occurrences(event, window_start, window_end))
+    return occurrence_cache.get_or_expand(event, window_start, window_end)
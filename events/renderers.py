@@ -0,0 +1,67 @@
+import json
+
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import encoders
+
+_default = encoders.JSONEncoder().default
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer writing compact output with orjson. The bytes are the
+    same as JSONRenderer's for strings, ints, bools, None, lists and dicts
+    (anything else goes through DRF's encoder). Floats are formatted
+    differently and NaN becomes null, so use it only for payloads without
+    floats. Indented and ASCII-only output, and whatever orjson rejects,
+    are left to JSONRenderer.
+    """
+    _options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=_default, option=self._options)
+        except TypeError:
+            # e.g. ints past 64 bits
+            return super().render(data, accepted_media_type, renderer_context)
+        # As JSONRenderer: escape the separators that end lines in JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Newline-delimited JSON, one object per line. Views stream large
+    results themselves with `line()`; anything rendered through a normal
+    Response (e.g. errors) comes out as one line per item.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    @staticmethod
+    def line(item):
+        return json.dumps(item, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        return ''.join(self.line(item) for item in items).encode(self.charset)
+
+
+class PrometheusRenderer(BaseRenderer):
+    """
+    Prometheus text exposition format. Views pass the finished text;
+    errors are rendered as their detail message.
+    """
+    media_type = 'text/plain'
+    format = 'prometheus'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = f"{data.get('detail', data)}\n"
+        return data.encode(self.charset)
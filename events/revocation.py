@@ -0,0 +1,141 @@
+import hashlib
+import math
+import time
+import uuid
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+# Seconds between polls for tokens blacklisted by other processes; a token
+# revoked elsewhere can be refreshed here for at most this long
+REVOCATION_SYNC_INTERVAL = getattr(settings, 'TOKEN_REVOCATION_SYNC_INTERVAL', 5)
+REVOCATION_ERROR_RATE = getattr(settings, 'TOKEN_REVOCATION_ERROR_RATE', 0.001)
+# Blacklist rows re-read on every poll, for rows committed out of id order
+SYNC_OVERLAP = 100
+MIN_CAPACITY = 1024
+
+# Changed by prune_tokens so every process rebuilds its filter
+GENERATION_KEY = 'token-revocation-generation'
+
+
+class BloomFilter:
+    """
+    Set membership with false positives (at about `error_rate` until
+    `capacity` items are added) and no false negatives. `count` is the
+    number of distinct items added.
+    """
+
+    def __init__(self, capacity, error_rate=REVOCATION_ERROR_RATE):
+        self.capacity = max(capacity, 1)
+        self.size = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, item):
+        # Double hashing: k positions from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + n * step) % self.size for n in range(self.hashes)]
+
+    def add(self, item):
+        # Only counted when a bit changes: the sync overlap and signals
+        # re-add jtis, and they must not use up the capacity. (A new item
+        # that is a false positive goes uncounted too, which is harmless.)
+        bits = self.bits
+        added = False
+        for position in self._positions(item):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                added = True
+        if added:
+            self.count += 1
+
+    def __contains__(self, item):
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevokedTokens:
+    """
+    Bloom filter of the JTIs of unexpired blacklisted refresh tokens. A
+    miss means the token is certainly not blacklisted, so the blacklist
+    query can be skipped; a hit still has to be confirmed there.
+
+    Built on first use. Blacklistings in this process are added as they
+    commit (see events.signals). Other processes' are picked up by polling
+    the blacklist table past the highest id seen, every
+    REVOCATION_SYNC_INTERVAL seconds.
+    """
+
+    def __init__(self, sync_interval=REVOCATION_SYNC_INTERVAL, error_rate=REVOCATION_ERROR_RATE):
+        self.sync_interval = sync_interval
+        self.error_rate = error_rate
+        self._filter = None
+        self._generation = None
+        self._last_id = 0
+        self._synced = 0.0
+        self._lock = Lock()
+
+    def __contains__(self, jti):
+        if self._filter is None or time.monotonic() - self._synced >= self.sync_interval:
+            self.sync()
+        return jti in self._filter
+
+    def sync(self):
+        with self._lock:
+            if self._filter is not None and time.monotonic() - self._synced < self.sync_interval:
+                return
+            generation = cache.get(GENERATION_KEY)
+            if self._filter is None or generation != self._generation or self._filter.count > self._filter.capacity:
+                self._rebuild(generation)
+            else:
+                self._load(BlacklistedToken.objects.filter(id__gt=self._last_id - SYNC_OVERLAP), self._filter)
+            self._synced = time.monotonic()
+
+    def _rebuild(self, generation):
+        rows = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        # Room to grow before the error rate degrades and forces a rebuild
+        bloom = BloomFilter(max(2 * rows.count(), MIN_CAPACITY), self.error_rate)
+        self._last_id = 0
+        self._load(rows, bloom)
+        self._filter = bloom
+        self._generation = generation
+
+    def _load(self, rows, bloom):
+        for row_id, jti in rows.values_list('id', 'token__jti').iterator(chunk_size=10000):
+            bloom.add(jti)
+            self._last_id = max(self._last_id, row_id)
+
+    def add(self, jti):
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(jti)
+
+    def reset(self):
+        """
+        Have every process rebuild its filter, e.g. after pruning.
+        """
+        cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+        with self._lock:
+            self._filter = None
+
+    def stats(self):
+        bloom = self._filter
+        if bloom is None:
+            return {'built': False}
+        return {
+            'built': True,
+            'tokens': bloom.count,
+            'capacity': bloom.capacity,
+            'bits': bloom.size,
+            'hashes': bloom.hashes,
+        }
+
+
+revoked_tokens = RevokedTokens()
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .metrics import count_cache
+from .models import EventPermission
+
+ROLE_CACHE_TIMEOUT = getattr(settings, 'EVENT_ROLE_CACHE_TIMEOUT', 300)
+
+OWNER_ROLES = ('owner',)
+EDITOR_ROLES = ('owner', 'editor')
+VIEWER_ROLES = ('owner', 'editor', 'viewer')
+
+# Cached in place of None so "no role" is a cache hit too; whatever creates
+# events or permissions must therefore invalidate the new (event, user) pairs
+NO_ROLE = ''
+
+
+def _cache_key(event_id, user_id):
+    return f'event-role:{event_id}:{user_id}'
+
+
+def _request_memo(request):
+    # Kept on the underlying HttpRequest so permission classes and the view
+    # share it even though DRF wraps the request
+    http_request = getattr(request, '_request', request)
+    memo = getattr(http_request, '_event_roles', None)
+    if memo is None:
+        memo = http_request._event_roles = {}
+    return memo
+
+
+def lookup_role(user_id, event_id):
+    """
+    Role of the user on the event, or None. Served from the shared cache,
+    falling back to a single EventPermission query.
+    """
+    key = _cache_key(event_id, user_id)
+    role = cache.get(key)
+    count_cache('role', hits=role is not None, misses=role is None)
+    if role is None:
+        role = EventPermission.objects.filter(
+            user_id=user_id, event_id=event_id,
+        ).values_list('role', flat=True).first()
+        cache.set(key, role or NO_ROLE, ROLE_CACHE_TIMEOUT)
+    return role or None
+
+
+def get_role(request, event):
+    """
+    Role of the requesting user on `event` (an Event or its id), or None.
+    Resolved at most once per request.
+    """
+    event_id = getattr(event, 'pk', event)
+    memo = _request_memo(request)
+    if event_id not in memo:
+        memo[event_id] = lookup_role(request.user.pk, event_id)
+    return memo[event_id]
+
+
+def invalidate_roles(event_id, user_ids, request=None):
+    """
+    Drop cached roles after permissions on the event changed.
+    """
+    cache.delete_many([_cache_key(event_id, user_id) for user_id in user_ids])
+    if request is not None:
+        _request_memo(request).pop(event_id, None)
+
+
+def invalidate_role_pairs(pairs):
+    """
+    Drop cached roles for many (event_id, user_id) pairs in one round trip.
+    """
+    cache.delete_many([_cache_key(event_id, user_id) for event_id, user_id in pairs])
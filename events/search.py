@@ -0,0 +1,75 @@
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Event
+
+# Text search configuration of the search_vector column (migration 0009)
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'events_event_fts'
+MAX_QUERY_LENGTH = 200
+
+_WORDS = re.compile(r'\w+')
+
+
+def fts_query(text):
+    # Every word as a quoted FTS5 string, so user input can't use (or break)
+    # the query syntax; adjacent strings are ANDed
+    return ' '.join(f'"{word}"' for word in _WORDS.findall(text))
+
+
+def search_events(queryset, text):
+    """
+    Filter `queryset` to events matching `text` and annotate a `rank`
+    (higher is better), using the search index created by migration 0009:
+    the GIN-indexed search_vector column on PostgreSQL, FTS5 on SQLite.
+    Other backends fall back to unranked icontains matching.
+    """
+    vendor = connections[queryset.db].vendor
+    table = queryset.model._meta.db_table
+
+    if vendor == 'postgresql':
+        # websearch_to_tsquery accepts free text: quotes, OR, -exclusions
+        query = 'websearch_to_tsquery(%s::regconfig, %s)'
+        params = (SEARCH_CONFIG, text)
+        return queryset.alias(
+            matched=RawSQL(f'"{table}"."search_vector" @@ {query}', params, output_field=BooleanField()),
+        ).filter(matched=True).annotate(
+            rank=RawSQL(f'ts_rank("{table}"."search_vector", {query})', params, output_field=FloatField()),
+        )
+
+    if vendor == 'sqlite':
+        match = fts_query(text)
+        if not match:
+            return queryset.none().annotate(rank=Value(None, output_field=FloatField()))
+        # bm25() is lower for better matches; weights follow the column
+        # order (title, description, location)
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', (match,)),
+        ).annotate(
+            rank=RawSQL(
+                f'(SELECT -bm25({FTS_TABLE}, 10.0, 1.0, 2.5) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND rowid = "{table}"."id")',
+                (match,), output_field=FloatField(),
+            ),
+        )
+
+    return queryset.filter(
+        Q(title__icontains=text) | Q(description__icontains=text) | Q(location__icontains=text)
+    ).annotate(rank=Value(None, output_field=FloatField()))
+
+
+def search_visible(user, text, fields=('id', 'version', 'rank')):
+    """
+    Ranked matches among the events `user` owns or holds a role on, best
+    first, as `fields` tuples.
+
+    The two halves are searched separately and combined with UNION: each
+    starts from the user's own rows (the owner index, or their permission
+    rows) instead of from every match of a common word.
+    """
+    owned = search_events(Event.objects.filter(created_by=user), text)
+    shared = search_events(Event.objects.filter(permissions__user=user), text)
+    return owned.values_list(*fields).union(shared.values_list(*fields)).order_by('-rank', 'id')
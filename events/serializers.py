@@ -1,7 +1,13 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from .authentication import FilteredRefreshToken, user_claims
 from .models import Event,  EventPermission,  EventHistory
+from .conflicts import find_conflict
+from .metrics import TimedSerializerMixin
+from .recurrence import RecurrenceRule
 
 class UserRegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -19,6 +25,14 @@ class UserRegisterSerializer(serializers.ModelSerializer):
         return user
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        # Read back by ClaimsJWTAuthentication instead of loading the user
+        token = super().get_token(user)
+        for claim, value in user_claims(user).items():
+            token[claim] = value
+        return token
+
     def validate(self, attrs):
         data = super().validate(attrs)
         data['user'] = {
@@ -28,54 +42,112 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         }
         return data
 
-class EventSerializer(serializers.ModelSerializer):
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh with one query: the user is loaded once, both to check it may
+    still log in and to issue the new tokens with its current claims (the
+    refresh token holds those of login time). The blacklist is only
+    queried when the revoked token filter matches.
+    """
+    token_class = FilteredRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user = User.objects.filter(
+            **{jwt_settings.USER_ID_FIELD: refresh.payload.get(jwt_settings.USER_ID_CLAIM)}
+        ).first()
+        if user is None or not jwt_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+        claims = user_claims(user)
+
+        access = refresh.access_token
+        for claim, value in claims.items():
+            access[claim] = value
+        data = {'access': str(access)}
+
+        if jwt_settings.ROTATE_REFRESH_TOKENS:
+            if jwt_settings.BLACKLIST_AFTER_ROTATION:
+                refresh.blacklist()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            for claim, value in claims.items():
+                refresh[claim] = value
+            refresh.outstand()
+            data['refresh'] = str(refresh)
+        return data
+
+class EventSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     created_by = serializers.ReadOnlyField(source='created_by.username')
+    recurrence_exceptions = serializers.ListField(child=serializers.DateTimeField(), required=False)
 
     class Meta:
         model = Event
         fields = [
             'id', 'title', 'description', 'location',
             'start_time', 'end_time', 'created_by',
-            'created_at', 'is_recurring', 'recurrence_pattern'
+            'created_at', 'is_recurring', 'recurrence_pattern',
+            'recurrence_exceptions', 'version'
         ]
-        read_only_fields = ['created_by', 'created_at']
+        read_only_fields = ['created_by', 'created_at', 'version']
+
+    def _current(self, data, field, default=None):
+        # Value after this update: incoming data first, then the existing instance
+        if field in data:
+            return data[field]
+        return getattr(self.instance, field) if self.instance else default
 
     def validate(self, data):
         user = self.context['request'].user
 
         # Use updated data if present, otherwise fall back to existing instance values if available
-        start_time = data.get('start_time') if 'start_time' in data else (self.instance.start_time if self.instance else None)
-        end_time = data.get('end_time') if 'end_time' in data else (self.instance.end_time if self.instance else None)
+        start_time = self._current(data, 'start_time')
+        end_time = self._current(data, 'end_time')
+        is_recurring = self._current(data, 'is_recurring', False)
+        recurrence_pattern = self._current(data, 'recurrence_pattern')
+
+        if 'recurrence_exceptions' in data:
+            # Stored as ISO strings so they round-trip exactly
+            data['recurrence_exceptions'] = [moment.isoformat() for moment in data['recurrence_exceptions']]
+
+        # Only check the rule when this request touches it, so legacy free-text
+        # patterns don't block unrelated edits
+        rule = None
+        if is_recurring and ({'is_recurring', 'recurrence_pattern'} & set(data) or not self.instance):
+            if not recurrence_pattern:
+                raise serializers.ValidationError({'recurrence_pattern': "Recurring events need a recurrence pattern."})
+            try:
+                rule = RecurrenceRule.parse(recurrence_pattern)
+            except ValueError as exc:
+                raise serializers.ValidationError({'recurrence_pattern': str(exc)})
 
         # Only validate if both are provided
         if start_time and end_time:
             if start_time >= end_time:
                 raise serializers.ValidationError("End time must be after start time.")
-
-            # Conflict detection for overlapping events
-            overlapping = Event.objects.filter(
-                created_by=user,
-                start_time__lt=end_time,
-                end_time__gt=start_time
+            if rule is not None and end_time - start_time >= rule.min_step:
+                raise serializers.ValidationError("Event duration must be shorter than its recurrence interval.")
+
+            # Batch callers check conflicts for the whole set at once
+            if not self.context.get('check_conflicts', True):
+                return data
+
+            # Conflict detection against the user's events, including the
+            # occurrences of recurring series on either side
+            candidate = Event(
+                start_time=start_time,
+                end_time=end_time,
+                is_recurring=is_recurring,
+                recurrence_pattern=recurrence_pattern,
+                recurrence_exceptions=self._current(data, 'recurrence_exceptions', []),
             )
-           
-            if self.instance:
-                overlapping = overlapping.exclude(id=self.instance.id)
-
-            if overlapping.exists():
+            exclude_ids = [self.instance.id] if self.instance else ()
+            if find_conflict(user, candidate, exclude_ids):
                 raise serializers.ValidationError("This event conflicts with another scheduled event.")
 
         return data
 
-class BatchEventSerializer(serializers.ListSerializer):
-    child = EventSerializer()
-
-    def create(self, validated_data):
-        events = [Event(**item) for item in validated_data]
-        return Event.objects.bulk_create(events)
-
-
-class EventPermissionSerializer(serializers.ModelSerializer):
+class EventPermissionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = EventPermission
         fields = ('user', 'event', 'role')
@@ -86,12 +158,24 @@ class EventPermissionSerializer(serializers.ModelSerializer):
         return data
     
 
-class EventHistorySerializer(serializers.ModelSerializer):
+class EventHistorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """
+    Expects rows passed through events.history.attach_snapshots, which
+    rebuilds the versioned fields from the delta store.
+    """
     edited_by = serializers.StringRelatedField()
+    title = serializers.CharField(source='snapshot.title', read_only=True)
+    description = serializers.CharField(source='snapshot.description', read_only=True)
+    location = serializers.CharField(source='snapshot.location', read_only=True)
+    start_time = serializers.DateTimeField(source='snapshot.start_time', read_only=True)
+    end_time = serializers.DateTimeField(source='snapshot.end_time', read_only=True)
 
     class Meta:
         model = EventHistory
-        fields = '__all__'
+        fields = (
+            'id', 'edited_by', 'title', 'description', 'location',
+            'start_time', 'end_time', 'edited_at', 'event',
+        )
 
 
 
@@ -0,0 +1,78 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+
+from .caching import invalidate_payloads
+from .models import Event, EventPermission
+from .roles import invalidate_roles
+from .utils import notify_users
+
+MAX_SHARE_BATCH_SIZE = 1000
+
+ROLES = [role for role, _ in EventPermission.PERMISSION_ROLES]
+
+
+def share_event_bulk(event, items, request):
+    """
+    Grant roles on `event` to many users: one query validates every user
+    id, one reads the existing roles and one upsert writes the new ones.
+    Each item is {'user': <id>, 'role': <role>}.
+
+    Returns one result per item, in input order, with status created,
+    updated, unchanged or invalid.
+    """
+    results = [None] * len(items)
+    wanted = {}
+
+    for index, item in enumerate(items):
+        user_id = item.get('user') if isinstance(item, dict) else None
+        role = item.get('role') if isinstance(item, dict) else None
+        errors = {}
+        if not isinstance(user_id, int) or isinstance(user_id, bool):
+            errors['user'] = 'A user id is required.'
+        elif user_id == request.user.pk:
+            errors['user'] = 'You cannot change your own role.'
+        elif user_id in wanted:
+            errors['user'] = f'Duplicate of item {wanted[user_id][0]}.'
+        if role not in ROLES:
+            errors['role'] = f"Role must be one of: {', '.join(ROLES)}."
+        if errors:
+            results[index] = {'index': index, 'status': 'invalid', 'errors': errors}
+        else:
+            wanted[user_id] = (index, role)
+
+    existing_users = set(User.objects.filter(pk__in=wanted).values_list('pk', flat=True))
+    for user_id in list(wanted):
+        if user_id not in existing_users:
+            index, _ = wanted.pop(user_id)
+            results[index] = {'index': index, 'status': 'invalid', 'errors': {'user': 'User not found.'}}
+
+    current = dict(
+        EventPermission.objects.filter(event=event, user_id__in=wanted).values_list('user_id', 'role')
+    )
+    changed = {}
+    for user_id, (index, role) in wanted.items():
+        if current.get(user_id) == role:
+            results[index] = {'index': index, 'user': user_id, 'status': 'unchanged'}
+        else:
+            changed[user_id] = role
+            status = 'updated' if user_id in current else 'created'
+            results[index] = {'index': index, 'user': user_id, 'status': status}
+
+    if changed:
+        with transaction.atomic():
+            EventPermission.objects.bulk_create(
+                [EventPermission(event=event, user_id=user_id, role=role) for user_id, role in changed.items()],
+                update_conflicts=True,
+                unique_fields=['user', 'event'],
+                update_fields=['role'],
+            )
+            Event.objects.filter(pk=event.pk).bump_versions()
+            invalidate_payloads([event.pk])
+            # Newly added users hear about it, as with the single share
+            notify_users(
+                (user_id, f"You've been added to the event: '{event.title}'")
+                for user_id in changed if user_id not in current
+            )
+        invalidate_roles(event.pk, changed, request)
+
+    return results
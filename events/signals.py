@@ -0,0 +1,40 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+
+from .authentication import user_states
+from .caching import invalidate_payloads
+from .models import Event
+from .recurrence import occurrence_cache
+from .revocation import revoked_tokens
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def invalidate_occurrences(sender, instance, **kwargs):
+    occurrence_cache.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=Event)
+def invalidate_payload(sender, instance, **kwargs):
+    # Covers API deletes as well as cascades from deleted users
+    invalidate_payloads([instance.pk])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_user_state(sender, instance, **kwargs):
+    # This user's next token is checked against the table here at once,
+    # elsewhere on reload
+    user_id = instance.pk
+    transaction.on_commit(lambda: user_states.forget(user_id))
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def track_revoked_token(sender, instance, created, **kwargs):
+    # Other processes find it when they next poll the blacklist
+    if created:
+        jti = instance.token.jti
+        transaction.on_commit(lambda: revoked_tokens.add(jti))
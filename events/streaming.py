@@ -0,0 +1,44 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+# Parts joined into each chunk written to the client
+STREAM_CHUNK_PARTS = 200
+
+_DONE = object()
+
+
+def _chunks(parts, size):
+    chunk = []
+    for part in parts:
+        chunk.append(part)
+        if len(chunk) >= size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+async def _async_chunks(chunks):
+    # Each step runs in the request's sync thread, so a server-side cursor
+    # behind `chunks` keeps using the same database connection
+    step = sync_to_async(next, thread_sensitive=True)
+    while True:
+        chunk = await step(chunks, _DONE)
+        if chunk is _DONE:
+            return
+        yield chunk
+
+
+def stream_response(request, parts, content_type):
+    """
+    StreamingHttpResponse over an iterator of str parts.
+
+    Django buffers a sync iterator completely when serving under ASGI (and
+    an async one under WSGI), so the iterator type follows the request
+    handler to keep memory flat either way.
+    """
+    chunks = _chunks(parts, STREAM_CHUNK_PARTS)
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        chunks = _async_chunks(chunks)
+    return StreamingHttpResponse(chunks, content_type=content_type)
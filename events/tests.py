@@ -1,3 +1,1054 @@
-from django.test import TestCase
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from importlib import import_module
+from types import SimpleNamespace
+from unittest import mock
+from zoneinfo import ZoneInfo
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.layers import InMemoryChannelLayer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.db.models import F
+from django.http import StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from . import metrics
+from .authentication import JWTAuthMiddleware, user_states
+from .caching import get_payload
+from .conflicts import find_conflict, sweep_conflicts
+from .consumers import NotificationQueue, frame
+from .diff import diff_versions
+from .history import KEYFRAME_INTERVAL, attach_snapshots, decode_snapshot, iter_snapshots, record_version, snapshot_of
+from .ical import import_calendar, iter_calendar, parse_line, parse_moment, vevent
+from .importing import EventImporter
+from .management.commands.bench_api import percentile
+from .models import Event, EventHistory, EventPermission, ImportCheckpoint, NotificationOutbox
+from .outbox import dispatch_batch
+from .payloads import PAYLOAD_FIELDS, columns, event_payloads, parse_fields
+from .recurrence import RecurrenceRule, iter_occurrences, series_end
+from .renderers import FastJSONRenderer
+from .revocation import BloomFilter, revoked_tokens
+from .roles import get_role, invalidate_roles, lookup_role
+from .routing import websocket_urlpatterns
+from .serializers import CustomTokenObtainPairSerializer, EventSerializer
+from .throttling import SlidingWindowLimiter, _limiters, parse_rate
+from .utils import notify_user
+
+# A Monday
+START = datetime(2030, 1, 7, 9, tzinfo=dt_timezone.utc)
+BERLIN = ZoneInfo('Europe/Berlin')
+
+
+def make_event(owner, start, hours=1, **fields):
+    fields.setdefault('title', 'Meeting')
+    fields.setdefault('description', '')
+    fields.setdefault('location', '')
+    event = Event.objects.create(start_time=start, end_time=start + timedelta(hours=hours), created_by=owner, **fields)
+    EventPermission.objects.create(user=owner, event=event, role='owner')
+    return event
+
+
+def series(start, pattern, hours=1, exceptions=()):
+    # What the recurrence helpers read from an event
+    return SimpleNamespace(
+        pk=None, start_time=start, end_time=start + timedelta(hours=hours), is_recurring=True,
+        recurrence_pattern=pattern, recurrence_exceptions=list(exceptions),
+    )
+
+
+@override_settings(RATELIMIT_ENABLE=False)
+class EventAPITestCase(APITestCase):
+    def setUp(self):
+        # The caches outlive the per-test transaction, and ids are reused
+        cache.clear()
+        user_states.clear()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'alice-password')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'bob-password')
+        self.client.force_authenticate(self.alice)
+
+
+class EventListTests(EventAPITestCase):
+    def setUp(self):
+        super().setUp()
+        own = [make_event(self.alice, START + timedelta(days=day)) for day in (3, 1, 2)]
+        shared = make_event(self.bob, START, title='Shared')
+        EventPermission.objects.create(user=self.alice, event=shared, role='viewer')
+        make_event(self.bob, START + timedelta(days=4), title='Private')
+        self.visible = [shared.pk] + [event.pk for event in sorted(own, key=lambda event: event.start_time)]
+
+    def ids(self, response):
+        return [event['id'] for event in response.json()['results']]
+
+    def test_lists_owned_and_shared_events_in_start_order(self):
+        response = self.client.get('/api/events/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.ids(response), self.visible)
+
+    def test_cursor_pages_cover_every_event_once(self):
+        ids, pages, url = [], [], '/api/events/?page_size=2'
+        while url:
+            response = self.client.get(url)
+            pages.append(response.json())
+            ids += self.ids(response)
+            url = response.json()['next']
+        self.assertEqual(ids, self.visible)
+        self.assertIsNone(pages[0]['previous'])
+
+        back = self.client.get(pages[1]['previous'])
+        self.assertEqual(self.ids(back), self.visible[:2])
+
+    def test_invalid_cursor_is_not_found(self):
+        self.assertEqual(self.client.get('/api/events/?cursor=bogus').status_code, 404)
+
+    def test_sparse_fieldset(self):
+        response = self.client.get('/api/events/?fields=start_time,title')
+        self.assertEqual([list(event) for event in response.json()['results']], [['title', 'start_time']] * 4)
+        self.assertEqual(self.client.get('/api/events/?fields=title,secret').status_code, 400)
+
+    def test_unchanged_page_is_not_modified(self):
+        response = self.client.get('/api/events/')
+        etag = response['ETag']
+        self.assertEqual(self.client.get('/api/events/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Event.objects.filter(pk=self.visible[-1]).bump_versions()
+        response = self.client.get('/api/events/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class CalendarTests(EventAPITestCase):
+    def test_returns_events_overlapping_the_window(self):
+        before = make_event(self.alice, START - timedelta(hours=2), hours=3)
+        inside = make_event(self.alice, START + timedelta(days=1))
+        make_event(self.alice, START + timedelta(days=3))
+        make_event(self.bob, START, title='Private')
+
+        response = self.client.get('/api/events/calendar/?from=2030-01-07&to=2030-01-10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([entry['id'] for entry in response.json()], [before.pk, inside.pk])
+
+    def test_expands_series_within_the_window(self):
+        daily = make_event(
+            self.alice, START, is_recurring=True, recurrence_pattern='daily',
+            recurrence_exceptions=[(START + timedelta(days=1)).isoformat()],
+        )
+        single = make_event(self.alice, START + timedelta(days=2, hours=3))
+        make_event(self.alice, START + timedelta(days=5), title='Outside')
+
+        response = self.client.get('/api/events/calendar/?from=2030-01-07&to=2030-01-10&fields=title,start_time')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [(entry['title'], entry['start_time']) for entry in response.json()],
+            [('Meeting', '2030-01-07T09:00:00Z'), ('Meeting', '2030-01-09T09:00:00Z'), ('Meeting', '2030-01-09T12:00:00Z')],
+        )
+        self.assertEqual(Event.objects.get(pk=daily.pk).recurrence_end, None)
+        self.assertEqual(Event.objects.get(pk=single.pk).recurrence_end, single.end_time)
+
+    def test_rejects_bad_windows(self):
+        for query in ('from=2030-01-07', 'from=2030-01-10&to=2030-01-07', 'from=2030-01-01&to=2031-06-01'):
+            self.assertEqual(self.client.get(f'/api/events/calendar/?{query}').status_code, 400)
+
+
+class BatchCreateTests(EventAPITestCase):
+    def item(self, start, **fields):
+        return {
+            'title': 'Planning', 'description': 'Quarterly', 'location': 'Room 1',
+            'start_time': start.isoformat(), 'end_time': (start + timedelta(hours=1)).isoformat(), **fields,
+        }
+
+    def test_reports_each_item(self):
+        make_event(self.alice, START)
+        response = self.client.post('/api/events/batch/', [
+            self.item(START + timedelta(days=1)),
+            self.item(START + timedelta(days=1, minutes=30)),
+            self.item(START + timedelta(minutes=30)),
+            self.item(START + timedelta(days=2), title=''),
+        ], format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['created', 'conflict', 'conflict', 'invalid'])
+        self.assertEqual(response.json()['results'][1]['detail'], 'Overlaps item 0 in this batch.')
+        created = response.json()['results'][0]['id']
+        self.assertEqual(EventPermission.objects.get(event_id=created).role, 'owner')
+
+    def test_rejects_oversized_and_malformed_batches(self):
+        self.assertEqual(self.client.post('/api/events/batch/', {'title': 'x'}, format='json').status_code, 400)
+
+
+class RecurrenceTests(SimpleTestCase):
+    def starts(self, event, start, end):
+        return [moment for moment, _ in iter_occurrences(event, start, end)]
+
+    def test_parses_the_supported_rules(self):
+        rule = RecurrenceRule.parse('RRULE:FREQ=WEEKLY;INTERVAL=2;COUNT=10')
+        self.assertEqual((rule.freq, rule.interval, rule.count), ('WEEKLY', 2, 10))
+        self.assertEqual(rule.to_rrule(), 'FREQ=WEEKLY;INTERVAL=2;COUNT=10')
+        for pattern in ('', 'hourly', 'FREQ=DAILY;BYDAY=MO', 'FREQ=DAILY;COUNT=2;UNTIL=20300101T000000Z', 'FREQ=DAILY;COUNT=0'):
+            with self.assertRaises(ValueError):
+                RecurrenceRule.parse(pattern)
+
+    def test_count_and_exceptions(self):
+        event = series(START, 'FREQ=DAILY;COUNT=5', exceptions=[(START + timedelta(days=2)).isoformat()])
+        self.assertEqual(
+            self.starts(event, START, START + timedelta(days=30)),
+            [START + timedelta(days=day) for day in (0, 1, 3, 4)],
+        )
+        self.assertEqual(series_end(event), START + timedelta(days=4, hours=1))
+
+    def test_monthly_keeps_the_day_clamped_to_the_month(self):
+        event = series(datetime(2030, 1, 31, 9, tzinfo=dt_timezone.utc), 'monthly')
+        self.assertEqual(
+            [moment.date().isoformat() for moment in self.starts(event, START, datetime(2030, 5, 1, tzinfo=dt_timezone.utc))],
+            ['2030-01-31', '2030-02-28', '2030-03-31', '2030-04-30'],
+        )
+
+    def test_window_far_into_a_series_matches_enumeration(self):
+        event = series(START, 'FREQ=WEEKLY;INTERVAL=2', hours=2)
+        rule = RecurrenceRule.parse(event.recurrence_pattern)
+        window_start = START + timedelta(days=3000, hours=1)
+        window_end = window_start + timedelta(days=60)
+        expected = [
+            start for start in (rule.nth_start(START, n) for n in range(300))
+            if start < window_end and start + timedelta(hours=2) > window_start
+        ]
+        self.assertTrue(expected)
+        self.assertEqual(self.starts(event, window_start, window_end), expected)
+
+    def test_keeps_the_wall_clock_time_across_dst(self):
+        # Europe/Berlin moves to summer time on 2030-03-31
+        start = datetime(2030, 3, 29, 9, tzinfo=BERLIN).astimezone(dt_timezone.utc)
+        event = series(start, 'daily')
+        with mock.patch('events.recurrence.RECURRENCE_TIME_ZONE', BERLIN):
+            starts = self.starts(event, start, start + timedelta(days=4))
+            later = self.starts(event, datetime(2030, 3, 31, 8, tzinfo=dt_timezone.utc), start + timedelta(days=5))
+        self.assertEqual([moment.astimezone(BERLIN).hour for moment in starts], [9] * 5)
+        self.assertEqual(starts[2] - starts[1], timedelta(hours=23))
+        self.assertEqual(later[0], datetime(2030, 4, 1, 7, tzinfo=dt_timezone.utc))
+
+    def test_migration_keeps_a_frozen_copy_of_series_end(self):
+        migration = import_module('events.migrations.0004_event_recurrence')
+        start = datetime(2030, 3, 29, 9, tzinfo=dt_timezone.utc)
+        for pattern in ('weekly', 'FREQ=DAILY;COUNT=5', 'FREQ=MONTHLY;INTERVAL=2;UNTIL=20301231', 'bogus'):
+            event = series(start, pattern)
+            with mock.patch('events.recurrence.RECURRENCE_TIME_ZONE', dt_timezone.utc):
+                live = series_end(event)
+            with mock.patch('events.recurrence.RECURRENCE_TIME_ZONE', BERLIN):
+                frozen = migration.series_end(event)
+            if live is None or pattern == 'bogus':
+                self.assertEqual(frozen, live, pattern)
+            else:
+                self.assertEqual(frozen, live + migration.SLACK, pattern)
+
+
+class ConflictTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'alice-password')
+
+    def test_sweep_rejects_later_overlaps(self):
+        hour = timedelta(hours=1)
+        self.assertEqual(sweep_conflicts([
+            (START, START + 2 * hour, 'a'),
+            (START + hour, START + 3 * hour, 'b'),
+            (START + 2 * hour, START + 4 * hour, 'c'),
+            # A series doesn't conflict with itself
+            (START + 5 * hour, START + 6 * hour, 'd'),
+            (START + 6 * hour, START + 7 * hour, 'd'),
+        ]), {'b': 'a'})
+
+    def test_finds_conflicts_with_series_occurrences(self):
+        make_event(self.alice, START, is_recurring=True, recurrence_pattern='weekly')
+        self.assertTrue(find_conflict(self.alice, Event(
+            start_time=START + timedelta(weeks=30, minutes=30), end_time=START + timedelta(weeks=30, hours=2),
+        )))
+        self.assertFalse(find_conflict(self.alice, Event(
+            start_time=START + timedelta(days=1), end_time=START + timedelta(days=1, hours=1),
+        )))
+        candidate = Event(
+            start_time=START + timedelta(days=1, minutes=30), end_time=START + timedelta(days=1, hours=1),
+            is_recurring=True, recurrence_pattern='FREQ=DAILY;COUNT=7',
+        )
+        self.assertTrue(find_conflict(self.alice, candidate))
+
+
+class RoleCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'alice-password')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'bob-password')
+        self.event = make_event(self.alice, START)
+
+    def test_roles_are_looked_up_once(self):
+        request = RequestFactory().get('/')
+        request.user = self.alice
+        with self.assertNumQueries(1):
+            self.assertEqual(get_role(request, self.event), 'owner')
+            self.assertEqual(get_role(request, self.event.pk), 'owner')
+        with self.assertNumQueries(0):
+            self.assertEqual(lookup_role(self.alice.pk, self.event.pk), 'owner')
+
+    def test_missing_roles_are_cached_until_invalidated(self):
+        self.assertIsNone(lookup_role(self.bob.pk, self.event.pk))
+        with self.assertNumQueries(0):
+            self.assertIsNone(lookup_role(self.bob.pk, self.event.pk))
+
+        EventPermission.objects.create(user=self.bob, event=self.event, role='viewer')
+        invalidate_roles(self.event.pk, [self.bob.pk])
+        self.assertEqual(lookup_role(self.bob.pk, self.event.pk), 'viewer')
+
+
+class NewEventRoleTests(EventAPITestCase):
+    def test_roles_probed_before_creation_are_dropped(self):
+        last = make_event(self.alice, START).pk
+        upcoming = range(last + 1, last + 4)
+        for event_id in upcoming:
+            self.assertIsNone(lookup_role(self.alice.pk, event_id))
+
+        item = {'title': 'Planning', 'description': 'Quarterly', 'location': 'Room 1'}
+        with self.captureOnCommitCallbacks(execute=True):
+            created = self.client.post('/api/events/', {
+                **item, 'start_time': START + timedelta(days=1), 'end_time': START + timedelta(days=1, hours=1),
+            }, format='json').json()['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            batch = self.client.post('/api/events/batch/', [{
+                **item, 'start_time': (START + timedelta(days=2)).isoformat(),
+                'end_time': (START + timedelta(days=2, hours=1)).isoformat(),
+            }], format='json').json()['results'][0]['id']
+
+        self.assertEqual([created, batch], list(upcoming[:2]))
+        for event_id in (created, batch):
+            self.assertEqual(self.client.get(f'/api/events/{event_id}/').status_code, 200)
+
+
+class HistoryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'alice-password')
+        self.event = make_event(self.alice, START, description='Agenda\nline two')
+        # Stored snapshot of each recorded version
+        self.snapshots = []
+        for n in range(KEYFRAME_INTERVAL + 2):
+            self.snapshots.append(snapshot_of(self.event))
+            record_version(self.event, self.alice)
+            self.event.title = f'Title {n}'
+            if n % 3 == 0:
+                self.event.start_time += timedelta(hours=1)
+                self.event.end_time += timedelta(hours=1)
+            self.event.version += 1
+            self.event.save()
+
+    def rows(self):
+        return EventHistory.objects.filter(event=self.event).order_by('version')
+
+    def test_keyframes_and_deltas(self):
+        rows = list(self.rows())
+        self.assertEqual([row.version for row in rows if row.is_keyframe], [1, KEYFRAME_INTERVAL + 1])
+        self.assertEqual(rows[0].changes, self.snapshots[0])
+        self.assertEqual(rows[2].changes, {'title': 'Title 1'})
+        self.assertEqual(self.event.version, len(rows) + 1)
+
+    def test_replay_rebuilds_every_version(self):
+        replayed = [row.snapshot for row in iter_snapshots(self.rows())]
+        self.assertEqual(replayed, [decode_snapshot(snapshot) for snapshot in self.snapshots])
+
+        picked = attach_snapshots([self.rows().get(version=5), self.rows().get(version=KEYFRAME_INTERVAL + 2)])
+        self.assertEqual([row.snapshot for row in picked], [decode_snapshot(self.snapshots[4]), decode_snapshot(self.snapshots[-1])])
+
+
+class DiffTests(EventAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = make_event(self.alice, START, title='Standup', description='Agenda\nline two')
+        self.v1 = record_version(self.event, self.alice)
+        self.event.title = 'Daily standup'
+        self.event.description = 'Agenda\nline 2'
+        self.event.save()
+        self.v2 = record_version(self.event, self.alice)
+
+    def test_reports_changed_fields(self):
+        result = diff_versions(self.v1, self.v2)
+        self.assertEqual(set(result['values_changed']), {"root['title']", "root['description']"})
+        self.assertEqual(
+            result['values_changed']["root['title']"], {'new_value': 'Daily standup', 'old_value': 'Standup'},
+        )
+        self.assertIn('-line two\n+line 2', result['values_changed']["root['description']"]['diff'])
+
+        script = diff_versions(self.v1, self.v2, 'word')['values_changed']["root['description']"]['diff']
+        self.assertEqual(
+            [step for step in script if step['op'] != 'equal'], [{'op': 'replace', 'old': 'two', 'new': '2'}],
+        )
+
+    def test_diffs_are_cached(self):
+        expected = diff_versions(self.v1, self.v2)
+        v1, v2 = EventHistory.objects.get(pk=self.v1.pk), EventHistory.objects.get(pk=self.v2.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(diff_versions(v1, v2), expected)
+
+    def test_diff_endpoints(self):
+        url = f'/api/events/{self.event.pk}/diff/{self.v1.pk}/'
+        response = self.client.get(f'{url}{self.v2.pk}/')
+        self.assertEqual(response.json(), diff_versions(self.v1, self.v2))
+        self.event.location = 'Room 2'
+        self.event.save()
+        current = self.client.get(f'{url}current/').json()['values_changed']
+        self.assertEqual(current["root['location']"], {'new_value': 'Room 2', 'old_value': ''})
+        self.assertEqual(self.client.get(f'{url}{self.v2.pk}/?granularity=char').status_code, 400)
+        self.assertEqual(self.client.get(f'{url}999999/').status_code, 404)
+
+
+class ChangelogTests(EventAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = make_event(self.alice, START)
+        self.versions = []
+        for n in range(3):
+            self.versions.append(record_version(self.event, self.alice).pk)
+            self.event.title = f'Title {n}'
+            self.event.version += 1
+            self.event.save()
+        self.url = f'/api/events/{self.event.pk}/changelog/'
+
+    def test_pages_newest_first(self):
+        first = self.client.get(f'{self.url}?page_size=2').json()
+        second = self.client.get(first['next']).json()
+        self.assertEqual(
+            [row['id'] for row in first['results'] + second['results']], self.versions[::-1],
+        )
+        self.assertEqual(second['results'][0]['title'], 'Meeting')
+
+    def test_streams_ndjson_oldest_first(self):
+        response = self.client.get(f'{self.url}?format=ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['title'] for line in lines], ['Meeting', 'Title 0', 'Title 1'])
+
+    def test_unchanged_changelog_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        record_version(self.event, self.alice)
+        Event.objects.filter(pk=self.event.pk).bump_versions()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class OutboxTests(TestCase):
+    def test_rolled_back_notifications_are_not_queued(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                notify_user(1, 'Hello')
+                raise RuntimeError
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_dispatch_sends_one_message_per_group(self):
+        layer = InMemoryChannelLayer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)('user_1', channel)
+        notify_user(1, 'one')
+        notify_user(1, 'two')
+
+        self.assertEqual(dispatch_batch(channel_layer=layer), (2, 2, 0))
+        message = async_to_sync(layer.receive)(channel)
+        self.assertEqual(message['type'], 'send_notification_batch')
+        self.assertEqual([event['message']['message'] for event in message['events']], ['one', 'two'])
+        self.assertFalse(NotificationOutbox.objects.exists())
+
+    def test_failed_sends_are_retried_later(self):
+        class BrokenLayer:
+            async def group_send(self, group, message):
+                raise ConnectionError('layer down')
+
+        notify_user(1, 'one')
+        self.assertEqual(dispatch_batch(channel_layer=BrokenLayer()), (1, 0, 1))
+        row = NotificationOutbox.objects.get()
+        self.assertEqual(row.attempts, 1)
+        self.assertEqual(row.last_error, 'ConnectionError: layer down')
+        # Not due again yet
+        self.assertEqual(dispatch_batch(channel_layer=BrokenLayer()), (0, 0, 0))
+
+
+class NotificationQueueTests(SimpleTestCase):
+    def update(self, event_id, version_id, **changes):
+        return {'type': 'event.update', 'event_id': event_id, 'version_id': version_id, 'changes': changes, 'edited_by': 'alice'}
+
+    def test_drop_oldest(self):
+        queue = NotificationQueue(2, 'drop_oldest')
+        for n in range(3):
+            queue.push({'message': n})
+        self.assertEqual(queue.drain(), [{'message': 1}, {'message': 2}])
+        self.assertEqual(queue.stats()['dropped'], 1)
+
+    def test_disconnect(self):
+        queue = NotificationQueue(1, 'disconnect')
+        self.assertTrue(queue.push({'message': 'a'}))
+        self.assertFalse(queue.push({'message': 'b'}))
+
+    def test_coalesce(self):
+        queue = NotificationQueue(2, 'coalesce')
+        for message in ('a', 'b', 'c', 'd'):
+            queue.push({'message': message})
+        self.assertEqual(queue.drain(), [{'message': '3 new notifications', 'count': 3, 'coalesced': True}, {'message': 'd'}])
+        self.assertEqual(frame([{'message': 'a'}]), {'message': 'a'})
+        self.assertEqual(frame([{'message': 'a'}, {'message': 'b'}]), {'messages': [{'message': 'a'}, {'message': 'b'}]})
+
+    def test_coalescing_keeps_live_edits(self):
+        queue = NotificationQueue(3, 'coalesce')
+        queue.push({'message': 'a'})
+        queue.push(self.update(1, 10, title='New'))
+        queue.push(self.update(1, 11, location='Room 2'))
+        queue.push({'message': 'b'})
+        self.assertEqual(queue.drain(), [
+            {'message': '2 new notifications', 'count': 2, 'coalesced': True},
+            self.update(1, 11, title='New', location='Room 2'),
+        ])
+        self.assertEqual(frame([{'message': 'a'}]), {'message': 'a'})
+
+
+class LiveUpdateTests(EventAPITestCase):
+    def test_edits_publish_only_the_changed_fields(self):
+        event = make_event(self.alice, START)
+        response = self.client.patch(f'/api/events/{event.pk}/', {'title': 'Renamed'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        row = NotificationOutbox.objects.get(group=f'event_{event.pk}')
+        update = row.message['update']
+        self.assertEqual(update['changes'], {'title': 'Renamed', 'version': 2})
+        self.assertEqual(update['version_id'], EventHistory.objects.get(event=event).pk)
+        self.assertEqual(update['edited_by'], 'alice')
+
+
+class NotificationSocketTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        user_states.clear()
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'alice-password')
+        self.bob = User.objects.create_user('bob', 'bob@example.com', 'bob-password')
+        self.event = make_event(self.bob, START)
+        self.token = str(CustomTokenObtainPairSerializer.get_token(self.alice).access_token)
+        self.application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    async def connect(self, path):
+        communicator = WebsocketCommunicator(self.application, path)
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_only_the_authenticated_user_may_connect(self):
+        for path in (
+            f'/ws/notifications/{self.alice.pk}/',
+            f'/ws/notifications/{self.alice.pk}/?token=junk',
+            f'/ws/notifications/{self.bob.pk}/?token={self.token}',
+        ):
+            communicator, connected = await self.connect(path)
+            self.assertFalse(connected, path)
+            await communicator.disconnect()
+
+    async def test_subscriptions_need_a_role(self):
+        communicator, connected = await self.connect(f'/ws/notifications/{self.alice.pk}/?token={self.token}')
+        self.assertTrue(connected)
+        await communicator.send_json_to({'action': 'subscribe', 'event_id': self.event.pk})
+        self.assertEqual((await communicator.receive_json_from())['detail'], 'No permission on this event.')
+
+        await sync_to_async(EventPermission.objects.create)(user=self.alice, event=self.event, role='viewer')
+        await sync_to_async(invalidate_roles)(self.event.pk, [self.alice.pk])
+        await communicator.send_json_to({'action': 'subscribe', 'event_id': self.event.pk})
+        self.assertEqual(await communicator.receive_json_from(), {'type': 'subscribed', 'event_id': self.event.pk})
+        await communicator.disconnect()
+
+
+class ASGIApplicationTests(SimpleTestCase):
+    def test_imports_in_a_fresh_process(self):
+        # The app registry is already loaded here, so import it elsewhere
+        result = subprocess.run(
+            [sys.executable, '-c', 'import event_manager.asgi'], cwd=settings.BASE_DIR, capture_output=True, text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+
+
+class ConditionalRequestTests(EventAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = make_event(self.alice, START)
+
+    def test_event_revalidation(self):
+        url = f'/api/events/{self.event.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(url, {'title': 'Renamed'}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['title'], 'Renamed')
+
+    def test_permissions_revalidation(self):
+        url = f'/api/events/{self.event.pk}/permissions/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post(f'/api/events/{self.event.pk}/share/', {'user': self.bob.pk, 'role': 'viewer'}, format='json')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class PayloadCacheTests(EventAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.event = make_event(self.alice, START)
+        self.url = f'/api/events/{self.event.pk}/'
+
+    def test_writes_go_through_to_the_cache(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(self.url, {'title': 'Renamed'}, format='json')
+        self.assertEqual(get_payload(self.event.pk, 2)['title'], 'Renamed')
+
+    def test_payloads_of_older_versions_are_not_served(self):
+        self.client.get(self.url)
+        self.assertIsNotNone(get_payload(self.event.pk, 1))
+        # A write that skipped the cache
+        Event.objects.filter(pk=self.event.pk).update(title='Renamed', version=F('version') + 1)
+        self.assertEqual(self.client.get(self.url).json()['title'], 'Renamed')
+        self.assertEqual(self.client.get('/api/events/').json()['results'][0]['title'], 'Renamed')
+
+    def test_deletes_invalidate(self):
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(self.url).status_code, 204)
+        self.assertIsNone(get_payload(self.event.pk))
+
+
+class BulkShareTests(EventAPITestCase):
+    def test_grants_roles_in_one_request(self):
+        carol = User.objects.create_user('carol', 'carol@example.com', 'carol-password')
+        event = make_event(self.alice, START)
+        url = f'/api/events/{event.pk}/share/bulk/'
+        response = self.client.post(url, [
+            {'user': self.bob.pk, 'role': 'editor'},
+            {'user': 999999, 'role': 'viewer'},
+            {'user': carol.pk, 'role': 'boss'},
+        ], format='json')
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['created', 'invalid', 'invalid'])
+        self.assertEqual(lookup_role(self.bob.pk, event.pk), 'editor')
+        self.assertEqual(Event.objects.get(pk=event.pk).version, 2)
+        self.assertTrue(NotificationOutbox.objects.filter(group=f'user_{self.bob.pk}').exists())
+
+        response = self.client.post(url, [{'user': self.bob.pk, 'role': 'editor'}], format='json')
+        self.assertEqual(response.json()['results'][0]['status'], 'unchanged')
+
+    def test_only_owners_share(self):
+        event = make_event(self.bob, START)
+        EventPermission.objects.create(user=self.alice, event=event, role='editor')
+        response = self.client.post(f'/api/events/{event.pk}/share/bulk/', [{'user': self.alice.pk, 'role': 'owner'}], format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class BulkEventTests(EventAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.own = make_event(self.alice, START)
+        self.other = make_event(self.bob, START)
+
+    def test_bulk_update(self):
+        response = self.client.patch('/api/events/bulk/', [
+            {'id': self.own.pk, 'title': 'Renamed'},
+            {'id': self.other.pk, 'title': 'Mine now'},
+            {'id': 999999, 'title': 'Ghost'},
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']], ['updated', 'forbidden', 'not_found'],
+        )
+        self.own.refresh_from_db()
+        self.assertEqual((self.own.title, self.own.version), ('Renamed', 2))
+        self.assertEqual(EventHistory.objects.filter(event=self.own).count(), 1)
+        self.assertEqual(Event.objects.get(pk=self.other.pk).title, 'Meeting')
+
+    def test_bulk_delete(self):
+        response = self.client.delete('/api/events/bulk/', [self.own.pk, self.other.pk], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['deleted', 'forbidden'])
+        self.assertEqual(list(Event.objects.values_list('pk', flat=True)), [self.other.pk])
+
+
+class AvailabilityTests(EventAPITestCase):
+    def test_finds_shared_free_time(self):
+        make_event(self.alice, START)
+        make_event(self.bob, START + timedelta(minutes=30), hours=1.5)
+        response = self.client.post('/api/availability/', {
+            'users': [self.alice.pk, self.bob.pk],
+            'from': '2030-01-07T08:00:00Z', 'to': '2030-01-07T12:00:00Z', 'duration': 60, 'limit': 2,
+        }, format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['free'], [
+            {'start': '2030-01-07T08:00:00Z', 'end': '2030-01-07T09:00:00Z'},
+            {'start': '2030-01-07T11:00:00Z', 'end': '2030-01-07T12:00:00Z'},
+        ])
+        self.assertEqual(
+            [(slot['start'], slot['available']) for slot in response.json()['best']],
+            [('2030-01-07T08:00:00Z', 2), ('2030-01-07T11:00:00Z', 2)],
+        )
+
+    def test_rejects_unknown_users(self):
+        response = self.client.post('/api/availability/', {
+            'users': [self.alice.pk, 999999], 'from': '2030-01-07', 'to': '2030-01-08', 'duration': 30,
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['users'], [999999])
+
+
+class SearchTests(EventAPITestCase):
+    def test_ranks_visible_matches(self):
+        title = make_event(self.alice, START, title='Budget review')
+        body = make_event(self.alice, START + timedelta(days=1), description='We talk about the budget')
+        shared = make_event(self.bob, START + timedelta(days=2), title='Budget planning', location='Budget room')
+        EventPermission.objects.create(user=self.alice, event=shared, role='viewer')
+        make_event(self.bob, START + timedelta(days=3), title='Budget secrets')
+
+        response = self.client.get('/api/events/search/?q=budget')
+        self.assertEqual(response.status_code, 200)
+        hits = response.json()
+        self.assertEqual({hit['id'] for hit in hits}, {title.pk, body.pk, shared.pk})
+        self.assertEqual(hits[-1]['id'], body.pk)
+        self.assertEqual(hits, sorted(hits, key=lambda hit: -hit['rank']))
+
+    def test_query_syntax_is_not_interpreted(self):
+        make_event(self.alice, START, title='Budget review')
+        self.assertEqual(self.client.get('/api/events/search/?q=budget" OR "x').json(), [])
+        self.assertEqual(self.client.get('/api/events/search/?q=').status_code, 400)
+
+
+class ICalTests(EventAPITestCase):
+    def export(self):
+        response = self.client.get('/api/events/export.ics')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def test_round_trip(self):
+        make_event(self.alice, START, title='Review, part 1', description='Agenda:\nbudget; hiring', location='Room 1')
+        make_event(
+            self.alice, START + timedelta(days=1, hours=3), title='Standup', is_recurring=True,
+            recurrence_pattern='FREQ=DAILY;COUNT=5', recurrence_exceptions=[(START + timedelta(days=2, hours=3)).isoformat()],
+        )
+        calendar = self.export()
+        self.assertTrue(all(len(line) <= 75 for line in calendar.split(b'\r\n')))
+
+        self.client.force_authenticate(self.bob)
+        response = self.client.post('/api/events/import.ics', calendar, content_type='text/calendar')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['created'], 2)
+
+        fields = ('title', 'description', 'location', 'start_time', 'end_time', 'is_recurring', 'recurrence_pattern', 'recurrence_exceptions')
+        exported = list(Event.objects.filter(created_by=self.alice).order_by('start_time').values_list(*fields))
+        imported = list(Event.objects.filter(created_by=self.bob).order_by('start_time').values_list(*fields))
+        self.assertEqual(imported, exported)
+
+    def test_series_carry_their_time_zone(self):
+        event = Event(
+            id=1, title='Standup', description='', location='', created_at=None, version=1,
+            start_time=datetime(2030, 3, 29, 9, tzinfo=BERLIN).astimezone(dt_timezone.utc),
+            end_time=datetime(2030, 3, 29, 10, tzinfo=BERLIN).astimezone(dt_timezone.utc),
+            is_recurring=True, recurrence_pattern='daily', recurrence_exceptions=[],
+        )
+        with mock.patch('events.ical.RECURRENCE_TIME_ZONE', BERLIN):
+            lines = vevent(event, '20300101T000000Z').split('\r\n')
+        start = next(line for line in lines if line.startswith('DTSTART'))
+        self.assertEqual(start, 'DTSTART;TZID=Europe/Berlin:20300329T090000')
+        _, params, value = parse_line(start)
+        self.assertEqual(parse_moment(value, params), event.start_time)
+
+    def test_rejects_other_files(self):
+        response = self.client.post('/api/events/import.ics', b'hello', content_type='text/calendar')
+        self.assertEqual(response.status_code, 400)
+
+    def test_reports_events_it_cannot_import(self):
+        calendar = ''.join(iter_calendar([])).replace('END:VCALENDAR', 'BEGIN:VEVENT\r\nUID:x\r\nSUMMARY:No start\r\nEND:VEVENT\r\nEND:VCALENDAR')
+        created, failures = import_calendar(calendar.splitlines(True), SimpleNamespace(user=self.alice))
+        self.assertEqual((created, failures), (0, [{'index': 0, 'uid': 'x', 'status': 'invalid', 'detail': 'DTSTART is required.'}]))
+
+
+class ImportCommandTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user('alice', 'alice@example.com', 'alice-password')
+        handle, self.path = tempfile.mkstemp(suffix='.ndjson')
+        self.addCleanup(os.remove, self.path)
+        with os.fdopen(handle, 'w') as stream:
+            for day in range(5):
+                start = START + timedelta(days=day)
+                stream.write(json.dumps({
+                    'owner': 'alice', 'title': f'Imported {day}',
+                    'start_time': start.isoformat(), 'end_time': (start + timedelta(hours=1)).isoformat(),
+                }) + '\n')
+            # Overlaps the first row
+            stream.write(json.dumps({
+                'owner': 'alice', 'title': 'Clash',
+                'start_time': START.isoformat(), 'end_time': (START + timedelta(hours=1)).isoformat(),
+            }) + '\n')
+
+    def test_resumes_after_the_last_committed_chunk(self):
+        process = EventImporter.process
+        calls = []
+
+        def interrupted(importer, records):
+            calls.append(len(records))
+            if len(calls) == 2:
+                raise KeyboardInterrupt
+            return process(importer, records)
+
+        with mock.patch.object(EventImporter, 'process', interrupted):
+            call_command('import_events', self.path, chunk_size=2, stdout=io.StringIO())
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual((checkpoint.rows, checkpoint.finished_at), (2, None))
+        self.assertEqual(Event.objects.count(), 2)
+
+        with self.assertRaisesMessage(CommandError, 'Pass --resume'):
+            call_command('import_events', self.path, stdout=io.StringIO())
+        call_command('import_events', self.path, chunk_size=2, resume=True, stdout=io.StringIO())
+
+        checkpoint.refresh_from_db()
+        self.assertEqual((checkpoint.rows, checkpoint.imported, checkpoint.rejected), (6, 5, 1))
+        self.assertIsNotNone(checkpoint.finished_at)
+        self.assertEqual(
+            list(Event.objects.order_by('start_time').values_list('title', flat=True)),
+            [f'Imported {day}' for day in range(5)],
+        )
+        self.assertEqual(EventPermission.objects.filter(user=self.alice, role='owner').count(), 5)
+
+    def test_imported_events_drop_cached_missing_roles(self):
+        last = make_event(self.alice, START - timedelta(days=1)).pk
+        for event_id in range(last + 1, last + 7):
+            self.assertIsNone(lookup_role(self.alice.pk, event_id))
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_events', self.path, stdout=io.StringIO())
+        imported = Event.objects.exclude(pk=last).values_list('pk', flat=True)
+        self.assertEqual({lookup_role(self.alice.pk, event_id) for event_id in imported}, {'owner'})
+
+    def test_history_deltas_need_an_earlier_keyframe(self):
+        event, other = make_event(self.alice, START), make_event(self.alice, START + timedelta(days=1))
+        rows = [
+            {'event': other.pk, 'version': 2, 'is_keyframe': False, 'changes': {'title': 'Orphan'}},
+            {'event': event.pk, 'version': 1, 'is_keyframe': True, 'changes': snapshot_of(event)},
+            {'event': event.pk, 'version': 2, 'is_keyframe': False, 'changes': {'title': 'Renamed'}},
+        ]
+        with open(self.path, 'w') as stream:
+            stream.writelines(json.dumps(row) + '\n' for row in rows)
+        call_command('import_events', self.path, kind='history', stdout=io.StringIO())
+
+        checkpoint = ImportCheckpoint.objects.get()
+        self.assertEqual((checkpoint.imported, checkpoint.rejected), (2, 1))
+        self.assertFalse(EventHistory.objects.filter(event=other).exists())
+        self.assertEqual(
+            [row.snapshot['title'] for row in iter_snapshots(EventHistory.objects.filter(event=event).order_by('version'))],
+            ['Meeting', 'Renamed'],
+        )
+
+    def test_chunk_size_must_be_positive(self):
+        for chunk_size in (0, -1):
+            with self.assertRaisesMessage(CommandError, '--chunk-size must be at least 1.'):
+                call_command('import_events', self.path, chunk_size=chunk_size, stdout=io.StringIO())
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+
+class BenchmarkTests(SimpleTestCase):
+    def test_nearest_rank_percentile(self):
+        ordered = list(range(1, 101))
+        self.assertEqual([percentile(ordered, fraction) for fraction in (0.5, 0.95, 0.99)], [50, 95, 99])
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_notification_sockets_connect_and_drain(self):
+        stdout = io.StringIO()
+        call_command(
+            'bench_notifications', connections=3, messages=2, client_delay=0, window=0.01, json=True, stdout=stdout,
+        )
+        report = json.loads(stdout.getvalue())
+        self.assertEqual((report['open_at_end'], report['received_by_consumers'], report['still_queued']), (3, 6, 0))
+
+    def test_notification_sockets_that_never_connect_time_out(self):
+        with mock.patch('events.management.commands.bench_notifications.connection_stats', return_value=[]):
+            with self.assertRaisesMessage(CommandError, 'Only 0 of 2 sockets connected'):
+                call_command('bench_notifications', connections=2, connect_timeout=0.05, stdout=io.StringIO())
+
+
+class MetricsTests(EventAPITestCase):
+    def test_scraping_is_refused_by_default(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    def test_exposition(self):
+        self.client.get('/api/events/')
+        self.client.force_authenticate(None)
+        with mock.patch('events.permissions.METRICS_ALLOWED_ADDRESSES', ('127.0.0.1',)):
+            response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        body = response.content.decode()
+        self.assertIn('events_http_requests_total{view="event-list",method="GET",status="200"}', body)
+        self.assertIn('# TYPE events_http_request_duration_seconds histogram', body)
+
+    def test_async_streams_are_recorded_when_they_end(self):
+        async def body():
+            yield b'first'
+            yield b'second'
+
+        async def get_response(request):
+            return StreamingHttpResponse(body())
+
+        async def consume(response):
+            return [chunk async for chunk in response]
+
+        middleware = metrics.MetricsMiddleware(get_response)
+        with mock.patch('events.metrics.record_request') as record_request:
+            response = async_to_sync(middleware)(RequestFactory().get('/'))
+            self.assertFalse(record_request.called)
+            self.assertEqual(async_to_sync(consume)(response), [b'first', b'second'])
+        record_request.assert_called_once()
+
+    def test_finished_threads_keep_their_counts(self):
+        shards = len(metrics._shards)
+        threads = [threading.Thread(target=metrics.count_cache, args=('test-threads',), kwargs={'hits': 1}) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertLessEqual(len(metrics._shards), shards)
+        lookups = dict(
+            (labels['result'], value) for _, labels, value in next(
+                samples for name, _, _, samples in metrics.collect() if name == 'events_cache_lookups'
+            ) if labels['cache'] == 'test-threads'
+        )
+        self.assertEqual(lookups, {'hit': 20, 'miss': 0})
+
+
+class TokenAuthenticationTests(EventAPITestCase):
+    def setUp(self):
+        super().setUp()
+        revoked_tokens.reset()
+        self.client.force_authenticate(None)
+        response = self.client.post('/api/auth/login/', {'username': 'alice', 'password': 'alice-password'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.tokens = response.json()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {self.tokens['access']}")
+
+    def test_requests_do_not_load_the_user(self):
+        self.assertEqual(self.client.get('/api/events/').status_code, 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/events/').status_code, 200)
+
+    def test_deactivated_and_deleted_users_are_refused(self):
+        self.assertEqual(self.client.get('/api/events/').status_code, 200)
+        # As another process would: no signal reaches this one
+        User.objects.filter(pk=self.alice.pk).update(is_active=False)
+        user_states.reload()
+        self.assertEqual(self.client.get('/api/events/').status_code, 200)
+        user_states.clear()
+        self.assertEqual(self.client.get('/api/events/').json()['detail'], 'User is inactive')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.alice.delete()
+        self.assertEqual(self.client.get('/api/events/').json()['detail'], 'User not found')
+
+    def test_staff_rights_follow_the_table(self):
+        # Neither change goes through a signal, as in another process
+        User.objects.filter(pk=self.alice.pk).update(is_staff=True)
+        user_states.clear()
+        self.assertEqual(self.client.get('/api/cache/stats/').status_code, 200)
+        User.objects.filter(pk=self.alice.pk).update(is_staff=False)
+        user_states.clear()
+        self.assertEqual(self.client.get('/api/cache/stats/').status_code, 403)
+
+    def test_logged_out_refresh_tokens_are_refused(self):
+        refresh = {'refresh': self.tokens['refresh']}
+        self.assertEqual(self.client.post('/api/auth/refresh/', refresh, format='json').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/auth/logout/', refresh, format='json').status_code, 205)
+        self.assertEqual(self.client.post('/api/auth/refresh/', refresh, format='json').status_code, 401)
+
+
+class BloomFilterTests(SimpleTestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(100)
+        items = [f'jti-{n}' for n in range(100)]
+        for item in items:
+            bloom.add(item)
+        self.assertTrue(all(item in bloom for item in items))
+        self.assertLess(sum(f'other-{n}' in bloom for n in range(10000)), 100)
+
+    def test_readding_does_not_count(self):
+        bloom = BloomFilter(100)
+        for _ in range(3):
+            for n in range(50):
+                bloom.add(f'jti-{n}')
+        self.assertEqual(bloom.count, 50)
+
+
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('5/m'), (5, 60))
+        self.assertEqual(parse_rate('100/10m'), (100, 600))
+        with self.assertRaises(ValueError):
+            parse_rate('5 per minute')
+
+    def test_sliding_window(self):
+        limiter = SlidingWindowLimiter('test-window', 10, 60, sync_interval=0)
+        now = 1000 * 60
+        self.assertEqual([limiter.hit('a', now)[0] for _ in range(11)], [True] * 10 + [False])
+        allowed, wait = limiter.hit('a', now + 1)
+        self.assertFalse(allowed)
+        self.assertGreater(wait, 0)
+        # Halfway into the next window half of the previous count still applies
+        self.assertEqual([limiter.hit('a', now + 90)[0] for _ in range(6)], [True] * 5 + [False])
+        self.assertTrue(limiter.hit('b', now)[0])
+
+    def test_processes_share_the_limit(self):
+        limiters = [SlidingWindowLimiter('test-shared', 10, 60, sync_interval=60) for _ in range(2)]
+        now = 1000 * 60
+        allowed = sum(limiters[n % 2].hit('a', now + n / 100)[0] for n in range(40))
+        self.assertLessEqual(allowed, 11)
+        self.assertGreaterEqual(allowed, 10)
+
+
+@override_settings(RATELIMIT_ENABLE=True)
+class LoginThrottleTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        _limiters.clear()
+        self.addCleanup(_limiters.clear)
+
+    def test_login_is_throttled_per_address(self):
+        statuses = [
+            self.client.post('/api/auth/login/', {'username': 'nobody', 'password': 'wrong'}, format='json').status_code
+            for _ in range(6)
+        ]
+        self.assertEqual(statuses, [401] * 5 + [429])
+
+
+class FastSerializationTests(TestCase):
+    def test_payloads_match_the_serializer(self):
+        alice = User.objects.create_user('alice', 'alice@example.com', 'alice-password')
+        make_event(alice, START, title='Ünïcode   title')
+        make_event(
+            alice, START + timedelta(days=1), is_recurring=True, recurrence_pattern='weekly',
+            recurrence_exceptions=[(START + timedelta(days=8)).isoformat()],
+        )
+        rows = Event.objects.order_by('id').values(*columns(PAYLOAD_FIELDS))
+        expected = EventSerializer(Event.objects.order_by('id'), many=True).data
+        payloads = event_payloads(rows)
+        self.assertEqual(payloads, expected)
+        self.assertEqual([list(payload) for payload in payloads], [list(PAYLOAD_FIELDS)] * 2)
+        self.assertEqual(event_payloads(rows, parse_fields('version,title')), [
+            {'title': payload['title'], 'version': payload['version']} for payload in expected
+        ])
+        self.assertEqual(FastJSONRenderer().render(payloads), JSONRenderer().render(payloads))
@@ -0,0 +1,226 @@
+import re
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+RATELIMIT_USE_CACHE = getattr(settings, 'RATELIMIT_USE_CACHE', 'default')
+# Hits counted in this process are pushed to the shared cache after this
+# many seconds, or once a batch of them has built up
+RATELIMIT_SYNC_INTERVAL = getattr(settings, 'RATELIMIT_SYNC_INTERVAL', 1.0)
+# Batches are sized so that RATELIMIT_WORKERS processes sharing the cache
+# admit at most this fraction of the limit on top of it: each can hold
+# batch - 1 hits the others haven't seen
+RATELIMIT_MAX_OVERSHOOT = getattr(settings, 'RATELIMIT_MAX_OVERSHOOT', 0.1)
+RATELIMIT_WORKERS = getattr(settings, 'RATELIMIT_WORKERS', 4)
+# Keys tracked per limiter; the least recently seen are forgotten first
+RATELIMIT_MAX_KEYS = getattr(settings, 'RATELIMIT_MAX_KEYS', 100_000)
+# Per-scope overrides of the rates views declare, e.g. {'login': '10/m'}
+RATELIMIT_RATES = getattr(settings, 'RATELIMIT_RATES', {})
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+_RATE = re.compile(r'^(\d+)/(\d*)([smhd])$')
+
+
+def parse_rate(rate):
+    """
+    (limit, period seconds) of a rate such as '5/m' or '100/10m'.
+    """
+    match = _RATE.match(rate.strip())
+    if not match:
+        raise ValueError(f'Malformed rate {rate!r}.')
+    limit, multiplier, unit = match.groups()
+    return int(limit), int(multiplier or 1) * PERIODS[unit]
+
+
+class _Window:
+    __slots__ = ('index', 'previous', 'current', 'pending', 'synced_at', 'previous_synced', 'lock')
+
+    def __init__(self, index):
+        self.index = index
+        # Shared counts of the previous and current window as last synced
+        self.previous = 0
+        self.current = 0
+        # Hits admitted here and not yet pushed to the shared cache
+        self.pending = 0
+        self.synced_at = 0.0
+        self.previous_synced = False
+        self.lock = Lock()
+
+
+class SlidingWindowLimiter:
+    """
+    Sliding-window rate limit, counted in process memory and synced to the
+    shared cache in batches.
+
+    A request is admitted while the previous fixed window's count, weighted
+    by how much of it still overlaps the sliding window, plus the current
+    window's count stays under the limit. Counts only grow within a
+    window, so a rejection from the local view is always right and costs
+    no round trip. Rejected requests are not counted.
+    """
+
+    def __init__(self, scope, limit, period, cache_alias=RATELIMIT_USE_CACHE,
+                 sync_interval=RATELIMIT_SYNC_INTERVAL, max_overshoot=RATELIMIT_MAX_OVERSHOOT,
+                 workers=RATELIMIT_WORKERS, max_keys=RATELIMIT_MAX_KEYS):
+        self.scope = scope
+        self.limit = limit
+        self.period = period
+        self.cache = caches[cache_alias]
+        self.sync_interval = sync_interval
+        self.batch = int(limit * max_overshoot / max(workers - 1, 1)) + 1
+        self.max_keys = max_keys
+        self._windows = OrderedDict()
+        self._lock = Lock()
+
+    def _key(self, ident, index):
+        return f'ratelimit:{self.scope}:{ident}:{index}'
+
+    def _window(self, ident, index):
+        with self._lock:
+            window = self._windows.get(ident)
+            if window is None:
+                window = self._windows[ident] = _Window(index)
+                if len(self._windows) > self.max_keys:
+                    # Loses at most one batch of unsynced hits
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(ident)
+            return window
+
+    def _push(self, key, amount):
+        try:
+            return self.cache.incr(key, amount)
+        except ValueError:
+            # Kept through the next window, which reads it as its previous
+            self.cache.add(key, 0, 2 * self.period + 1)
+            return self.cache.incr(key, amount)
+
+    def _roll(self, ident, window, index):
+        current = window.current
+        if window.pending:
+            current = self._push(self._key(ident, window.index), window.pending)
+        window.previous = current if window.index == index - 1 else 0
+        window.previous_synced = False
+        window.index = index
+        window.current = window.pending = 0
+        window.synced_at = 0.0
+
+    def _sync(self, ident, window, now):
+        key = self._key(ident, window.index)
+        if window.previous_synced:
+            if window.pending:
+                window.current = self._push(key, window.pending)
+            else:
+                window.current = self.cache.get(key, 0)
+        else:
+            previous_key = self._key(ident, window.index - 1)
+            found = self.cache.get_many([key, previous_key])
+            window.previous = max(window.previous, found.get(previous_key, 0))
+            window.current = found.get(key, 0)
+            if window.pending:
+                window.current = self._push(key, window.pending)
+            window.previous_synced = True
+        window.pending = 0
+        window.synced_at = now
+
+    def _wait(self, window, offset):
+        counted = window.current + window.pending
+        if counted >= self.limit or not window.previous:
+            return self.period - offset
+        # Until the previous window's weight has fallen far enough
+        weight = (self.limit - 1 - counted) / window.previous
+        return max(0.0, (1 - weight) * self.period - offset)
+
+    def hit(self, ident, now=None):
+        """
+        Count a request for `ident` if the limit allows it. Returns
+        (allowed, seconds until a request would be allowed).
+        """
+        now = time.time() if now is None else now
+        index, offset = divmod(now, self.period)
+        index = int(index)
+        weight = 1 - offset / self.period
+        window = self._window(ident, index)
+        with window.lock:
+            if window.index != index:
+                self._roll(ident, window, index)
+            if now - window.synced_at >= self.sync_interval:
+                self._sync(ident, window, now)
+            estimate = window.previous * weight + window.current + window.pending
+            if estimate + 1 > self.limit:
+                return False, self._wait(window, offset)
+
+            window.pending += 1
+            # Close to the limit every hit is pushed, so it is admitted
+            # against the shared count
+            if window.pending >= self.batch or estimate + 1 > self.limit - self.batch:
+                self._sync(ident, window, now)
+                if window.previous * weight + window.current > self.limit:
+                    self.cache.decr(self._key(ident, index))
+                    window.current -= 1
+                    return False, self._wait(window, offset)
+            return True, 0.0
+
+    def flush(self):
+        """
+        Push every unsynced hit to the shared cache.
+        """
+        with self._lock:
+            windows = list(self._windows.items())
+        for ident, window in windows:
+            with window.lock:
+                if window.pending:
+                    self._sync(ident, window, time.time())
+
+
+_limiters = {}
+_limiters_lock = Lock()
+
+
+def get_limiter(scope, rate):
+    limiter = _limiters.get((scope, rate))
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get((scope, rate))
+            if limiter is None:
+                limiter = _limiters[(scope, rate)] = SlidingWindowLimiter(scope, *parse_rate(rate))
+    return limiter
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def user_or_ip(request):
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'ip:{client_ip(request)}'
+
+
+KEYS = {'ip': client_ip, 'user': user_or_ip}
+
+
+class LocalRateThrottle(BaseThrottle):
+    """
+    Throttle over SlidingWindowLimiter. Views set `throttle_scope`,
+    `throttle_rate` ('5/m', '100/10m', ...) and `throttle_key`: 'ip', or
+    'user' (the authenticated user, else the IP). Turned off with
+    RATELIMIT_ENABLE = False.
+    """
+
+    def allow_request(self, request, view):
+        if not getattr(settings, 'RATELIMIT_ENABLE', True):
+            return True
+        scope = view.throttle_scope
+        limiter = get_limiter(scope, RATELIMIT_RATES.get(scope, view.throttle_rate))
+        key = KEYS[getattr(view, 'throttle_key', 'ip')](request)
+        allowed, self.retry_after = limiter.hit(key)
+        return allowed
+
+    def wait(self):
+        return self.retry_after
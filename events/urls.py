@@ -2,9 +2,9 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     RegisterView, LoginView, RefreshView, LogoutView,
-    EventViewSet, BatchEventCreateView, ShareEventView,
+    EventViewSet, BatchEventCreateView, BulkEventView, EventExportView, EventImportView, ShareEventView, BulkShareEventView,
     EventHistoryView, EventHistoryDetailView, EventRollbackView, EventDiffView,
-    EventPermissionListView, UpdateOrRevokePermissionView,
+    EventPermissionListView, UpdateOrRevokePermissionView, AvailabilityView, NotificationStatsView, CacheStatsView,
 )
 
 router = DefaultRouter()
@@ -20,9 +20,15 @@ urlpatterns = [
 
     # Event Creation / Batch 
     path('events/batch/', BatchEventCreateView.as_view(), name='batch-create-events'),
+    path('events/bulk/', BulkEventView.as_view(), name='bulk-events'),
+
+    # iCalendar
+    path('events/export.ics', EventExportView.as_view(), name='event-export-ics'),
+    path('events/import.ics', EventImportView.as_view(), name='event-import-ics'),
 
     # Event Sharing 
     path('events/<int:pk>/share/', ShareEventView.as_view(), name='event-share'),
+    path('events/<int:pk>/share/bulk/', BulkShareEventView.as_view(), name='event-share-bulk'),
 
     # Permissions Management 
     path('events/<int:pk>/permissions/', EventPermissionListView.as_view(), name='event-permissions-list'),
@@ -35,6 +41,14 @@ urlpatterns = [
 
     # Changelog & Diff
     path('events/<int:event_id>/diff/<int:v1_id>/<int:v2_id>/', EventDiffView.as_view(), name='event-diff'),
+    path('events/<int:event_id>/diff/<int:v1_id>/current/', EventDiffView.as_view(), name='event-diff-current'),
+
+    # Scheduling
+    path('availability/', AvailabilityView.as_view(), name='availability'),
+
+    # Notifications
+    path('notifications/stats/', NotificationStatsView.as_view(), name='notification-stats'),
+    path('cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
 
     # ViewSet Routes for basic CRUD 
     path('', include(router.urls)),
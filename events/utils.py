@@ -1,12 +1,19 @@
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
+from .outbox import enqueue, enqueue_many
+
+
+def _notification(message):
+    return {
+        'type': 'send_notification',
+        'message': {'message': message}
+    }
+
 
 def notify_user(user_id, message):
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        f"user_{user_id}",
-        {
-            'type': 'send_notification',
-            'message': {'message': message}
-        }
-    )
+    # Delivered by the dispatch_notifications worker once the surrounding
+    # transaction commits
+    enqueue(f"user_{user_id}", _notification(message))
+
+
+def notify_users(messages):
+    # Same, for many (user_id, message) pairs with a single insert
+    enqueue_many((f"user_{user_id}", _notification(message)) for user_id, message in messages)
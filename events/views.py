@@ -3,18 +3,73 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from rest_framework_simplejwt.tokens import RefreshToken
-from .serializers import UserRegisterSerializer, CustomTokenObtainPairSerializer, EventSerializer, EventPermissionSerializer, EventHistorySerializer
-from rest_framework import viewsets, permissions
-from .models import Event, EventPermission, EventHistory
-from rest_framework.permissions import IsAuthenticated
-from deepdiff import DeepDiff
-from django_ratelimit.decorators import ratelimit
-from .permissions import IsEventOwner, IsEventEditorOrOwner, IsEventViewerOrAbove
-from django.utils.decorators import method_decorator
+from .serializers import UserRegisterSerializer, CustomTokenObtainPairSerializer, ClaimsTokenRefreshSerializer, EventSerializer, EventPermissionSerializer, EventHistorySerializer
+from rest_framework import serializers, viewsets, permissions
+from rest_framework.decorators import action
+from .models import Event, EventPermission, EventHistory, NotificationOutbox
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
+from .permissions import CanScrapeMetrics, IsEventOwner, IsEventEditorOrOwner, IsEventViewerOrAbove
+from .roles import EDITOR_ROLES, OWNER_ROLES, VIEWER_ROLES, get_role, invalidate_roles
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
+from .pagination import EventCursorPagination, EventHistoryCursorPagination
+from .batch import MAX_BATCH_SIZE, create_event_batch, delete_event_batch, update_event_batch
+from .sharing import MAX_SHARE_BATCH_SIZE, share_event_bulk
+from .recurrence import occurrences_between
+from .history import HISTORY_FIELDS, attach_snapshots, iter_snapshots, record_version
+from .diff import GRANULARITIES, diff_snapshots, diff_versions
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from rest_framework.settings import api_settings
+from .renderers import FastJSONRenderer, NDJSONRenderer, PrometheusRenderer
+from rest_framework.renderers import JSONRenderer
+from types import SimpleNamespace
+from .throttling import LocalRateThrottle
+from .streaming import stream_response
+from .utils import notify_user
+from .consumers import connection_stats
+from .live import changed_fields, publish_access_revoked, publish_event_update
+from .etags import digest_etag, etag_matches, not_modified, version_etag, with_etag
+from .availability import AVAILABILITY_MAX_WINDOW, DEFAULT_STEP_MINUTES, MAX_AVAILABILITY_RESULTS, MAX_AVAILABILITY_USERS, find_availability
+from .search import MAX_QUERY_LENGTH, search_visible
+from .ical import ICAL_EXPORT_CHUNK_SIZE, MEDIA_TYPE as ICAL_MEDIA_TYPE, import_calendar, iter_calendar
+from .caching import get_payload, get_payloads, invalidate_payloads, payload_cache_stats, store_payloads, write_through
+from .metrics import collect, exposition
+from .payloads import PAYLOAD_FIELDS, RECURRENCE_COLUMNS, columns, event_payloads, parse_fields
+from .revocation import revoked_tokens
+
+
+CALENDAR_MAX_WINDOW = timedelta(days=366)
+SEARCH_MAX_RESULTS = 100
+
+# Rows fetched per round trip when streaming a changelog
+HISTORY_STREAM_CHUNK_SIZE = 2000
+
+
+def parse_window_bound(value):
+    # Accepts a full ISO 8601 datetime or a bare date (midnight)
+    if not value:
+        return None
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            moment = datetime.combine(day, time.min) if day else None
+    except ValueError:
+        return None
+    if moment is not None and timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
 
 
-@method_decorator(ratelimit(key='ip', rate='5/m', block=True), name='dispatch')
 class RegisterView(APIView):
+    throttle_classes = [LocalRateThrottle]
+    throttle_scope = 'register'
+    throttle_rate = '5/m'
+    throttle_key = 'ip'
+
     def post(self, request):
         serializer = UserRegisterSerializer(data=request.data)
         if serializer.is_valid():
@@ -23,8 +78,11 @@ class RegisterView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-@method_decorator(ratelimit(key='ip', rate='5/m', block=True), name='dispatch')
 class LoginView(TokenObtainPairView):
+    throttle_classes = [LocalRateThrottle]
+    throttle_scope = 'login'
+    throttle_rate = '5/m'
+    throttle_key = 'ip'
     serializer_class = CustomTokenObtainPairSerializer
 
     def post(self, request, *args, **kwargs):
@@ -32,7 +90,7 @@ class LoginView(TokenObtainPairView):
 
 
 class RefreshView(TokenRefreshView):
-    pass
+    serializer_class = ClaimsTokenRefreshSerializer
 
 
 class LogoutView(APIView):
@@ -54,6 +112,21 @@ class EventViewSet(viewsets.ModelViewSet):
     queryset = Event.objects.all()
     serializer_class = EventSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = EventCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'calendar']:
+            # Listings only show events the caller owns or has been shared on
+            queryset = queryset.visible_to(self.request.user)
+        return queryset
+
+    def get_renderers(self):
+        renderers = super().get_renderers()
+        if self.action in ['list', 'calendar']:
+            # Their payloads hold no floats, so orjson's output is the same
+            renderers = [FastJSONRenderer() if type(renderer) is JSONRenderer else renderer for renderer in renderers]
+        return renderers
 
     def get_permissions(self):
         if self.action in ['update', 'partial_update']:
@@ -66,34 +139,264 @@ class EventViewSet(viewsets.ModelViewSet):
             permission_classes = [IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    def retrieve(self, request, *args, **kwargs):
+        event_id = kwargs[self.lookup_field]
+        # With a cached role a version-only query answers revalidations and
+        # cache hits. Cached payloads are only served at the current
+        # version: a reader may store one it loaded just before a write
+        # committed.
+        if event_id.isdigit() and get_role(request, int(event_id)) in VIEWER_ROLES:
+            version = Event.objects.filter(pk=event_id).values_list('version', flat=True).first()
+            if version is not None:
+                etag = version_etag('event', event_id, version)
+                if etag_matches(request, etag):
+                    return not_modified(etag)
+                cached = get_payload(int(event_id), version)
+                if cached is not None:
+                    return with_etag(Response(cached), etag)
+
+        instance = self.get_object()
+        data = self.get_serializer(instance).data
+        store_payloads([data])
+        return with_etag(Response(data), version_etag('event', instance.pk, instance.version))
+
+    def list(self, request, *args, **kwargs):
+        try:
+            fields = parse_fields(request.query_params.get('fields'))
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        # The page query only reads the keyset and version columns; bodies
+        # come from the payload cache, misses from one query by id. Sparse
+        # fieldsets (?fields=) read their columns with the page instead.
+        extra = columns(fields) if fields is not None else ()
+        queryset = self.filter_queryset(self.get_queryset()).values(*dict.fromkeys(('id', 'start_time', 'version', *extra)))
+        page = self.paginate_queryset(queryset)
+        # The page is unchanged if the same events at the same versions are on
+        # it and the same neighbouring pages exist
+        etag = digest_etag(
+            request.user.pk, request.get_full_path(), self.paginator.has_next, self.paginator.has_previous,
+            [(row['id'], row['version']) for row in page],
+        )
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        if fields is not None:
+            data = event_payloads(page, fields)
+        else:
+            data = self.cached_payloads({row['id']: row['version'] for row in page})
+        return with_etag(self.get_paginated_response(data), etag)
+
+    def cached_payloads(self, versions):
+        # Serialized events for {id: version}, in that order: cache hits at
+        # the same version, misses from one query by id
+        payloads = get_payloads(versions, versions)
+        missing = [event_id for event_id in versions if event_id not in payloads]
+        if missing:
+            fresh = event_payloads(Event.objects.filter(pk__in=missing).values(*columns(PAYLOAD_FIELDS)))
+            store_payloads(fresh)
+            payloads.update((payload['id'], payload) for payload in fresh)
+        return [payloads[event_id] for event_id in versions]
+
     def perform_create(self, serializer):
-        event = serializer.save(created_by=self.request.user)
-        # Owner automatically gets owner role permission on created event
-        EventPermission.objects.create(user=self.request.user, event=event, role='owner')
+        with transaction.atomic():
+            event = serializer.save(created_by=self.request.user)
+            # Owner automatically gets owner role permission on created event
+            EventPermission.objects.create(user=self.request.user, event=event, role='owner')
+            write_through([serializer.data])
+            # The id may have been probed, and its missing role cached, before the event existed
+            transaction.on_commit(lambda: invalidate_roles(event.pk, [self.request.user.pk], self.request))
 
     def perform_update(self, serializer):
-        event = self.get_object()
-        # Save edit history before update
-        EventHistory.objects.create(
-            event=event,
-            edited_by=self.request.user,
-            title=event.title,
-            description=event.description,
-            location=event.location,
-            start_time=event.start_time,
-            end_time=event.end_time,
+        event = serializer.instance
+        before = self.get_serializer(event).data
+        with transaction.atomic():
+            # Save edit history before update
+            version = record_version(event, self.request.user)
+            event.version += 1
+            serializer.save()
+            write_through([serializer.data])
+            # Push only what changed to sockets subscribed to the event
+            publish_event_update(event.pk, version.pk, changed_fields(before, serializer.data), self.request.user)
+
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Events matching ?q= in title, description or location, best match
+        first; at most ?limit= (default 20, max 100). Each carries its rank.
+        """
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return Response({'detail': "A search query 'q' is required."}, status=400)
+        if len(text) > MAX_QUERY_LENGTH:
+            return Response({'detail': f'Search queries are limited to {MAX_QUERY_LENGTH} characters.'}, status=400)
+        limit = request.query_params.get('limit', '20')
+        if not limit.isdigit() or not 1 <= int(limit) <= SEARCH_MAX_RESULTS:
+            return Response({'detail': f"'limit' must be between 1 and {SEARCH_MAX_RESULTS}."}, status=400)
+
+        hits = list(search_visible(request.user, text)[:int(limit)])
+        payloads = self.cached_payloads({event_id: version for event_id, version, _ in hits})
+        return Response([{**payload, 'rank': rank} for payload, (_, _, rank) in zip(payloads, hits)])
+
+    @action(detail=False, methods=['get'])
+    def calendar(self, request):
+        """
+        Events overlapping the window given by ?from=&to= (ISO datetimes or
+        dates), optionally with only the fields in ?fields=.
+        """
+        try:
+            fields = parse_fields(request.query_params.get('fields')) or PAYLOAD_FIELDS
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=400)
+        start = parse_window_bound(request.query_params.get('from'))
+        end = parse_window_bound(request.query_params.get('to'))
+        if start is None or end is None:
+            return Response({'detail': "Both 'from' and 'to' must be valid ISO dates or datetimes."}, status=400)
+        if start >= end:
+            return Response({'detail': "'to' must be after 'from'."}, status=400)
+        if end - start > CALENDAR_MAX_WINDOW:
+            return Response({'detail': f'Window cannot exceed {CALENDAR_MAX_WINDOW.days} days.'}, status=400)
+
+        rows = list(
+            self.get_queryset().in_window(start, end).order_by('start_time', 'id')
+            .values(*dict.fromkeys(('id', *RECURRENCE_COLUMNS, *columns(fields))))
         )
-        serializer.save()
+        payloads = event_payloads(rows, fields)
+
+        # Recurring series contribute one entry per occurrence in the window,
+        # each carrying that occurrence's start and end time
+        to_representation = serializers.DateTimeField().to_representation
+        entries = []
+        for row, data in zip(rows, payloads):
+            event = SimpleNamespace(pk=row['id'], **{name: row[name] for name in RECURRENCE_COLUMNS})
+            for occurrence_start, occurrence_end in occurrences_between(event, start, end):
+                entry = dict(data)
+                if 'start_time' in entry:
+                    entry['start_time'] = to_representation(occurrence_start)
+                if 'end_time' in entry:
+                    entry['end_time'] = to_representation(occurrence_end)
+                entries.append((occurrence_start, row['id'], entry))
+        entries.sort(key=lambda item: item[:2])
+        return Response([entry for _, _, entry in entries])
 
 
-@method_decorator(ratelimit(key='ip', rate='5/m', block=True), name='dispatch')
 class BatchEventCreateView(APIView):
+    """
+    Create many events in one request. Responds with a per-item result list;
+    207 when only some items were created.
+    """
+    throttle_classes = [LocalRateThrottle]
+    throttle_scope = 'batch-create'
+    throttle_rate = '5/m'
+    throttle_key = 'user'
+    permission_classes = [IsAuthenticated]
+
     def post(self, request):
-        serializer = EventSerializer(data=request.data, many=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response({'message': 'Events created successfully'}, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Expected a list of events.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > MAX_BATCH_SIZE:
+            return Response({'detail': f'A batch may contain at most {MAX_BATCH_SIZE} events.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = create_event_batch(request.data, request)
+        created = sum(1 for result in results if result['status'] == 'created')
+
+        if created == len(results):
+            message, status_code = 'Events created successfully', status.HTTP_201_CREATED
+        elif created:
+            message, status_code = 'Some events could not be created', status.HTTP_207_MULTI_STATUS
+        else:
+            message, status_code = 'No events were created', status.HTTP_400_BAD_REQUEST
+        return Response({'message': message, 'created': created, 'results': results}, status=status_code)
+
+
+class BulkEventView(APIView):
+    """
+    PATCH: partial updates for many events, a list of {"id": <id>, <field>: <value>, ...}.
+    DELETE: a list of event ids.
+    Both respond with a per-id result list; 207 when only some succeeded.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def _check_size(self, data, expected):
+        if not isinstance(data, list):
+            return Response({'detail': f'Expected a list of {expected}.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(data) > MAX_BATCH_SIZE:
+            return Response({'detail': f'A batch may contain at most {MAX_BATCH_SIZE} events.'}, status=status.HTTP_400_BAD_REQUEST)
+        return None
+
+    def _respond(self, results, done):
+        count = sum(1 for result in results if result['status'] == done)
+        if count == len(results):
+            message, status_code = f'Events {done} successfully', status.HTTP_200_OK
+        elif count:
+            message, status_code = f'Some events could not be {done}', status.HTTP_207_MULTI_STATUS
+        else:
+            message, status_code = f'No events were {done}', status.HTTP_400_BAD_REQUEST
+        return Response({'message': message, done: count, 'results': results}, status=status_code)
+
+    def patch(self, request):
+        error = self._check_size(request.data, 'event updates')
+        if error:
+            return error
+        return self._respond(update_event_batch(request.data, request), 'updated')
+
+    def delete(self, request):
+        error = self._check_size(request.data, 'event ids')
+        if error:
+            return error
+        return self._respond(delete_event_batch(request.data, request), 'deleted')
+
+
+class EventExportView(APIView):
+    """
+    Every event the caller can see as one iCalendar file, streamed.
+    Series are exported with their RRULE and EXDATEs.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        # Named tuples rather than model instances; vevent only reads them
+        events = Event.objects.visible_to(request.user).values_list(
+            'id', 'title', 'description', 'location', 'start_time', 'end_time', 'created_at',
+            'is_recurring', 'recurrence_pattern', 'recurrence_exceptions', 'version', named=True,
+        ).order_by('start_time', 'id')
+        response = stream_response(
+            request, iter_calendar(events.iterator(chunk_size=ICAL_EXPORT_CHUNK_SIZE)), f'{ICAL_MEDIA_TYPE}; charset=utf-8',
+        )
+        response['Content-Disposition'] = 'attachment; filename="events.ics"'
+        return response
+
+
+class EventImportView(APIView):
+    """
+    Create events from an iCalendar file sent as the request body
+    (text/calendar) or as the 'file' field of a multipart upload. The file
+    is parsed as it is read and inserted in chunks, each in its own
+    transaction; only the events that were not created are listed.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        if request.content_type.startswith('multipart/'):
+            upload = request.FILES.get('file')
+            if upload is None:
+                return Response({'detail': "Upload the calendar as 'file'."}, status=status.HTTP_400_BAD_REQUEST)
+            lines = upload
+        else:
+            # Read the body line by line instead of through a parser
+            lines = request._request
+
+        try:
+            created, failures = import_calendar(lines, request)
+        except ValueError as exc:
+            return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not failures:
+            message, status_code = 'Events imported successfully', status.HTTP_201_CREATED
+        elif created:
+            message, status_code = 'Some events could not be imported', status.HTTP_207_MULTI_STATUS
+        else:
+            message, status_code = 'No events were imported', status.HTTP_400_BAD_REQUEST
+        return Response({'message': message, 'created': created, 'failed': len(failures), 'errors': failures}, status=status_code)
 
 
 class ShareEventView(APIView):
@@ -106,9 +409,8 @@ class ShareEventView(APIView):
             return Response({'detail': 'Event not found'}, status=404)
 
         # Permission check, only owners can share
-        try:
-            role = EventPermission.objects.get(user=request.user, event=event).role
-        except EventPermission.DoesNotExist:
+        role = get_role(request, event)
+        if role is None:
             return Response({'detail': 'No permission on this event'}, status=403)
 
         if role != 'owner':
@@ -119,37 +421,74 @@ class ShareEventView(APIView):
 
         serializer = EventPermissionSerializer(data=data)
         if serializer.is_valid():
-            shared_permission = serializer.save()
-
-            # Real-time notification
-            from .utils import notify_user
-            notify_user(shared_permission.user.id, f"You've been added to the event: '{event.title}'")
+            # The notification is queued in the same transaction as the share
+            with transaction.atomic():
+                shared_permission = serializer.save()
+                Event.objects.filter(pk=event.pk).bump_versions()
+                invalidate_payloads([event.pk])
+                notify_user(shared_permission.user_id, f"You've been added to the event: '{event.title}'")
+            invalidate_roles(event.id, [shared_permission.user_id], request)
 
             return Response({'message': 'Event shared successfully.'}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class EventPermissionListView(APIView):
+class BulkShareEventView(APIView):
+    """
+    Grant roles to many users in one request: a list of
+    {"user": <id>, "role": <role>}. Existing roles are updated in place.
+    """
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, pk):
+    def post(self, request, pk):
         try:
-            event = Event.objects.get(pk=pk)
+            event = Event.objects.only('id', 'title').get(pk=pk)
         except Event.DoesNotExist:
             return Response({'detail': 'Event not found'}, status=404)
 
+        if get_role(request, event) not in OWNER_ROLES:
+            return Response({'detail': 'Only owners can share the event.'}, status=403)
+
+        if not isinstance(request.data, list):
+            return Response({'detail': 'Expected a list of {"user", "role"} objects.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(request.data) > MAX_SHARE_BATCH_SIZE:
+            return Response({'detail': f'At most {MAX_SHARE_BATCH_SIZE} users can be shared with at once.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = share_event_bulk(event, request.data, request)
+        valid = sum(1 for result in results if result['status'] != 'invalid')
+
+        if valid == len(results):
+            message, status_code = 'Event shared successfully.', status.HTTP_200_OK
+        elif valid:
+            message, status_code = 'Some users could not be added.', status.HTTP_207_MULTI_STATUS
+        else:
+            message, status_code = 'No users were added.', status.HTTP_400_BAD_REQUEST
+        return Response({'message': message, 'results': results}, status=status_code)
+
+
+class EventPermissionListView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        version = Event.objects.filter(pk=pk).values_list('version', flat=True).first()
+        if version is None:
+            return Response({'detail': 'Event not found'}, status=404)
+
         # Only owner can view permission list
-        try:
-            role = EventPermission.objects.get(user=request.user, event=event).role
-        except EventPermission.DoesNotExist:
+        role = get_role(request, pk)
+        if role is None:
             return Response({'detail': 'No permission on this event'}, status=403)
 
         if role != 'owner':
             return Response({'detail': 'Only the owner can view permission list'}, status=403)
 
-        permissions = EventPermission.objects.filter(event=event)
+        etag = version_etag('permissions', pk, version)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        permissions = EventPermission.objects.filter(event_id=pk)
         serializer = EventPermissionSerializer(permissions, many=True)
-        return Response(serializer.data)
+        return with_etag(Response(serializer.data), etag)
 
 
 class UpdateOrRevokePermissionView(APIView):
@@ -161,7 +500,7 @@ class UpdateOrRevokePermissionView(APIView):
         except Event.DoesNotExist:
             return Response({'detail': 'Event not found'}, status=404)
 
-        if not EventPermission.objects.filter(event=event, user=request.user, role='owner').exists():
+        if get_role(request, event) not in OWNER_ROLES:
             return Response({'detail': 'Only owners can update roles.'}, status=403)
 
         try:
@@ -174,7 +513,11 @@ class UpdateOrRevokePermissionView(APIView):
             return Response({'detail': 'Invalid role.'}, status=400)
 
         perm.role = new_role
-        perm.save()
+        with transaction.atomic():
+            perm.save()
+            Event.objects.filter(pk=event.pk).bump_versions()
+            invalidate_payloads([event.pk])
+        invalidate_roles(event.id, [perm.user_id], request)
         return Response({'message': 'Role updated successfully.'})
 
     def delete(self, request, event_id, user_id):
@@ -183,7 +526,7 @@ class UpdateOrRevokePermissionView(APIView):
         except Event.DoesNotExist:
             return Response({'detail': 'Event not found'}, status=404)
 
-        if not EventPermission.objects.filter(event=event, user=request.user, role='owner').exists():
+        if get_role(request, event) not in OWNER_ROLES:
             return Response({'detail': 'Only owners can revoke permissions.'}, status=403)
 
         try:
@@ -191,24 +534,52 @@ class UpdateOrRevokePermissionView(APIView):
         except EventPermission.DoesNotExist:
             return Response({'detail': 'Permission not found.'}, status=404)
 
-        perm.delete()
+        with transaction.atomic():
+            perm.delete()
+            Event.objects.filter(pk=event.pk).bump_versions()
+            invalidate_payloads([event.pk])
+            publish_access_revoked(event.id, perm.user_id)
+        invalidate_roles(event.id, [perm.user_id], request)
         return Response({'message': 'Permission revoked successfully.'})
 
 
 
-@method_decorator(ratelimit(key='ip', rate='5/m', block=True), name='dispatch')
 class EventHistoryView(APIView):
+    """
+    Changelog, newest first, keyset-paginated on edited_at. With
+    ?format=ndjson (or Accept: application/x-ndjson) the full history is
+    streamed instead, oldest first, one version per line.
+    """
+    throttle_classes = [LocalRateThrottle]
+    throttle_scope = 'changelog'
+    throttle_rate = '5/m'
+    throttle_key = 'user'
     permission_classes = [IsAuthenticated]
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, NDJSONRenderer]
+    pagination_class = EventHistoryCursorPagination
 
     def get(self, request, pk):
-        try:
-            event = Event.objects.get(pk=pk)
-        except Event.DoesNotExist:
+        version = Event.objects.filter(pk=pk).values_list('version', flat=True).first()
+        if version is None:
             return Response({'detail': 'Event not found'}, status=404)
 
-        history = event.history.all().order_by('-edited_at')
-        serializer = EventHistorySerializer(history, many=True)
-        return Response(serializer.data)
+        # Every new history row comes with a version bump
+        etag = version_etag(f'history.{request.accepted_renderer.format}', pk, version, request)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        history = EventHistory.objects.filter(event_id=pk).select_related('edited_by')
+
+        if request.accepted_renderer.format == NDJSONRenderer.format:
+            rows = iter_snapshots(history.order_by('version').iterator(chunk_size=HISTORY_STREAM_CHUNK_SIZE))
+            serializer = EventHistorySerializer()
+            lines = (NDJSONRenderer.line(serializer.to_representation(row)) for row in rows)
+            return with_etag(stream_response(request, lines, NDJSONRenderer.media_type), etag)
+
+        paginator = self.pagination_class()
+        page = attach_snapshots(paginator.paginate_queryset(history, request, view=self))
+        serializer = EventHistorySerializer(page, many=True)
+        return with_etag(paginator.get_paginated_response(serializer.data), etag)
 
 
 class EventHistoryDetailView(APIView):
@@ -216,44 +587,48 @@ class EventHistoryDetailView(APIView):
 
     def get(self, request, id, versionId):
         try:
-            history_version = EventHistory.objects.get(pk=versionId, event_id=id)
+            history_version = EventHistory.objects.select_related('edited_by').get(pk=versionId, event_id=id)
         except EventHistory.DoesNotExist:
             return Response({'detail': 'History version not found'}, status=404)
 
+        attach_snapshots([history_version])
         serializer = EventHistorySerializer(history_version)
         return Response(serializer.data)
 
 
 
 class EventDiffView(APIView):
+    """
+    Field diff between two versions, or between a version and the live
+    event when no second version is given. ?granularity=word switches text
+    fields to a word-level edit script.
+    """
     permission_classes = [IsAuthenticated]
 
-    def get(self, request, event_id, v1_id, v2_id):
-        try:
-            version1 = EventHistory.objects.get(pk=v1_id, event_id=event_id)
-            version2 = EventHistory.objects.get(pk=v2_id, event_id=event_id)
-        except EventHistory.DoesNotExist:
-            return Response({'detail': 'One or both versions not found'}, status=404)
+    def get(self, request, event_id, v1_id, v2_id=None):
+        granularity = request.query_params.get('granularity', 'line')
+        if granularity not in GRANULARITIES:
+            return Response({'detail': f"granularity must be one of: {', '.join(GRANULARITIES)}"}, status=400)
 
-        # Convert both versions to plain dictionaries
-        v1_data = {
-            "title": version1.title,
-            "description": version1.description,
-            "location": version1.location,
-            "start_time": str(version1.start_time),
-            "end_time": str(version1.end_time),
+        wanted = {v1_id} if v2_id is None else {v1_id, v2_id}
+        versions = {
+            version.pk: version
+            for version in EventHistory.objects.filter(pk__in=wanted, event_id=event_id).only('id', 'event_id', 'version')
         }
+        if len(versions) != len(wanted):
+            return Response({'detail': 'One or both versions not found'}, status=404)
 
-        v2_data = {
-            "title": version2.title,
-            "description": version2.description,
-            "location": version2.location,
-            "start_time": str(version2.start_time),
-            "end_time": str(version2.end_time),
-        }
+        if v2_id is not None:
+            return Response(diff_versions(versions[v1_id], versions[v2_id], granularity))
 
-        diff = DeepDiff(v1_data, v2_data, ignore_order=True)
-        return Response(diff)
+        # Against the live event: not cached, the event can change at any time
+        try:
+            event = Event.objects.get(pk=event_id)
+        except Event.DoesNotExist:
+            return Response({'detail': 'Event not found'}, status=404)
+        version1 = attach_snapshots([versions[v1_id]])[0]
+        live = {field: getattr(event, field) for field in HISTORY_FIELDS}
+        return Response(diff_snapshots(version1.snapshot, live, granularity))
 
 
 class EventRollbackView(APIView):
@@ -271,26 +646,156 @@ class EventRollbackView(APIView):
             return Response({'detail': 'Version not found'}, status=404)
 
         # Only creator or editor can rollback
-        if event.created_by != request.user and not EventPermission.objects.filter(event=event, user=request.user, role__in=['owner', 'editor']).exists():
+        if event.created_by_id != request.user.id and get_role(request, event) not in EDITOR_ROLES:
             return Response({'detail': 'You do not have permission to rollback this event.'}, status=403)
 
-        # Save current as new history before rollback
-        EventHistory.objects.create(
-            event=event,
-            edited_by=request.user,
-            title=event.title,
-            description=event.description,
-            location=event.location,
-            start_time=event.start_time,
-            end_time=event.end_time,
-        )
+        attach_snapshots([version])
+        before = EventSerializer(event).data
+
+        with transaction.atomic():
+            # Save current as new history before rollback
+            recorded = record_version(event, request.user)
 
-        # Perform rollback
-        event.title = version.title
-        event.description = version.description
-        event.location = version.location
-        event.start_time = version.start_time
-        event.end_time = version.end_time
-        event.save()
+            # Perform rollback
+            for field in HISTORY_FIELDS:
+                setattr(event, field, version.snapshot[field])
+            event.version += 1
+            event.save()
+            after = EventSerializer(event).data
+            write_through([after])
+            publish_event_update(event.pk, recorded.pk, changed_fields(before, after), request.user)
 
         return Response({'message': 'Event rolled back to selected version.'})
+
+
+def _positive_int(value):
+    if isinstance(value, int) and not isinstance(value, bool) and value > 0:
+        return value
+    return None
+
+
+class AvailabilityView(APIView):
+    """
+    Shared free time of several users. Body: {"users": [<id>, ...], "from",
+    "to" (ISO dates or datetimes), "duration" (minutes), optional "step"
+    (minutes between candidate times) and "limit"}.
+    Responds with the gaps where everyone is free and the best meeting
+    times ranked by attendance.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        data = request.data if isinstance(request.data, dict) else {}
+        users = data.get('users')
+        if not isinstance(users, list) or not users or not all(_positive_int(user) for user in users):
+            return Response({'detail': "'users' must be a non-empty list of user ids."}, status=400)
+        users = list(dict.fromkeys(users))
+        if len(users) > MAX_AVAILABILITY_USERS:
+            return Response({'detail': f'At most {MAX_AVAILABILITY_USERS} users can be compared at once.'}, status=400)
+
+        start = parse_window_bound(data.get('from')) if isinstance(data.get('from'), str) else None
+        end = parse_window_bound(data.get('to')) if isinstance(data.get('to'), str) else None
+        if start is None or end is None:
+            return Response({'detail': "Both 'from' and 'to' must be valid ISO dates or datetimes."}, status=400)
+        if start >= end:
+            return Response({'detail': "'to' must be after 'from'."}, status=400)
+        if end - start > AVAILABILITY_MAX_WINDOW:
+            return Response({'detail': f'Window cannot exceed {AVAILABILITY_MAX_WINDOW.days} days.'}, status=400)
+
+        duration = _positive_int(data.get('duration'))
+        step = _positive_int(data.get('step', DEFAULT_STEP_MINUTES))
+        limit = _positive_int(data.get('limit', 10))
+        if duration is None or step is None:
+            return Response({'detail': "'duration' and 'step' must be positive numbers of minutes."}, status=400)
+        if limit is None or limit > MAX_AVAILABILITY_RESULTS:
+            return Response({'detail': f"'limit' must be between 1 and {MAX_AVAILABILITY_RESULTS}."}, status=400)
+
+        missing = set(users) - set(User.objects.filter(pk__in=users).values_list('pk', flat=True))
+        if missing:
+            return Response({'detail': 'Unknown users.', 'users': sorted(missing)}, status=400)
+
+        result = find_availability(users, start, end, timedelta(minutes=duration), timedelta(minutes=step), limit)
+        to_representation = serializers.DateTimeField().to_representation
+        return Response({
+            'from': to_representation(start),
+            'to': to_representation(end),
+            'duration': duration,
+            'free': [
+                {'start': to_representation(slot_start), 'end': to_representation(slot_end)}
+                for slot_start, slot_end in result['free']
+            ],
+            'best': [
+                {**slot, 'start': to_representation(slot['start']), 'end': to_representation(slot['end'])}
+                for slot in result['best']
+            ],
+        })
+
+
+class CacheStatsView(APIView):
+    """
+    Event payload cache counters for this process.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(payload_cache_stats())
+
+
+class NotificationStatsView(APIView):
+    """
+    Send-queue counters of the notification sockets served by this process,
+    deepest queues first.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        connections = sorted(connection_stats(), key=lambda stats: stats['depth'], reverse=True)
+        return Response({
+            'connections': len(connections),
+            'queued': sum(stats['depth'] for stats in connections),
+            'high_water': max((stats['high_water'] for stats in connections), default=0),
+            'dropped': sum(stats['dropped'] for stats in connections),
+            'coalesced': sum(stats['coalesced'] for stats in connections),
+            'deepest': connections[:100],
+        })
+
+
+class MetricsView(APIView):
+    """
+    Request, cache and notification metrics of this process in the
+    Prometheus text format. Each worker process reports its own.
+    """
+    authentication_classes = []
+    permission_classes = [CanScrapeMetrics]
+    renderer_classes = [PrometheusRenderer]
+
+    def get(self, request):
+        cache = payload_cache_stats()
+        sockets = connection_stats()
+        outbox = NotificationOutbox.objects.aggregate(
+            pending=Count('id', filter=Q(failed_at__isnull=True)),
+            failed=Count('id', filter=Q(failed_at__isnull=False)),
+            oldest=Min('created_at', filter=Q(failed_at__isnull=True)),
+        )
+        oldest = (timezone.now() - outbox['oldest']).total_seconds() if outbox['oldest'] else 0
+
+        def gauge(value):
+            return [('', {}, value)]
+
+        families = collect() + [
+            ('events_payload_cache_writes', 'counter', 'Event payloads written to the cache.', [('_total', {}, cache['writes'])]),
+            ('events_payload_cache_invalidations', 'counter', 'Event payloads invalidated.', [('_total', {}, cache['invalidations'])]),
+            ('events_notification_connections', 'gauge', 'Open notification sockets.', gauge(len(sockets))),
+            ('events_notification_queued', 'gauge', 'Messages waiting in socket send queues.',
+             gauge(sum(stats['depth'] for stats in sockets))),
+            ('events_notification_dropped', 'gauge', 'Messages dropped by the open sockets.',
+             gauge(sum(stats['dropped'] for stats in sockets))),
+            ('events_notification_coalesced', 'gauge', 'Messages coalesced by the open sockets.',
+             gauge(sum(stats['coalesced'] for stats in sockets))),
+            ('events_outbox_pending', 'gauge', 'Notifications waiting in the outbox.', gauge(outbox['pending'])),
+            ('events_outbox_failed', 'gauge', 'Notifications that exhausted their retries.', gauge(outbox['failed'])),
+            ('events_outbox_oldest_seconds', 'gauge', 'Age of the oldest pending notification.', gauge(oldest)),
+            ('events_revoked_token_filter_tokens', 'gauge', 'Revoked refresh tokens in the Bloom filter.',
+             gauge(revoked_tokens.stats().get('tokens', 0))),
+        ]
+        return Response(exposition(families))